@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Compares the per call latency of the senza execution backends.
+
+The default command (``senza list --help``) doesn't touch AWS, so it measures
+the overhead each backend adds on top of the actual senza work::
+
+    $ python3 benchmarks/executors.py --calls 20
+    $ python3 benchmarks/executors.py --region eu-central-1 list
+"""
+
+import argparse
+import statistics
+import time
+from typing import List
+
+from lizzy.apps.common import Application
+from lizzy.apps.executors import EXECUTORS, get_executor
+
+
+def measure(backend: str, subcommand: str, arguments: List[str],
+            region: str, calls: int) -> List[float]:
+    extra_parameters = ['--region', region] if region else []
+    app = Application('senza', extra_parameters=extra_parameters,
+                      executor=get_executor(backend))
+    # first call is not measured so one time imports don't skew the numbers
+    app._execute(subcommand, *arguments)  # pylint: disable=protected-access
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        app._execute(subcommand, *arguments)  # pylint: disable=protected-access
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=10)
+    parser.add_argument('--region', default=None)
+    parser.add_argument('--backend', action='append', choices=sorted(EXECUTORS),
+                        help='Backend to measure (default: all)')
+    parser.add_argument('subcommand', nargs='?', default='list')
+    parser.add_argument('arguments', nargs='*')
+    args = parser.parse_args()
+
+    arguments = args.arguments
+    if args.subcommand == 'list' and not arguments and not args.region:
+        arguments = ['--help']
+
+    print('{:<12} {:>10} {:>10} {:>10}'.format('backend', 'mean ms', 'p50 ms', 'max ms'))
+    for backend in args.backend or sorted(EXECUTORS):
+        timings = [timing * 1000 for timing in
+                   measure(backend, args.subcommand, arguments, args.region,
+                           args.calls)]
+        print('{:<12} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            backend, statistics.mean(timings), statistics.median(timings),
+            max(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Measures the stack read throughput of lizzy while long running stack creations
+are in progress.
+
+Against a running lizzy (creations are dry runs unless --no-dry-run is used)::
+
+    $ python3 benchmarks/load_test.py --url https://lizzy.example.com \\
+          --token "$(ztoken)" --senza-yaml app.yaml --creates 8
+
+Against a local lizzy served by a threaded server, using a fake senza whose
+creations take --create-seconds and listings --list-seconds::
+
+    $ python3 benchmarks/load_test.py --local --creates 8 --create-seconds 20
+"""
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Tuple  # NOQA pylint: disable=unused-import
+
+import requests
+
+FAKE_SENZA = '''#!{python}
+import json
+import os
+import sys
+import time
+
+command = sys.argv[1]
+if command == 'create':
+    time.sleep(float(os.environ['FAKE_SENZA_CREATE_SECONDS']))
+    print('Stack created')
+elif command == 'list':
+    time.sleep(float(os.environ['FAKE_SENZA_LIST_SECONDS']))
+    print(json.dumps([{{'creation_time': 1460635167,
+                       'description': 'Load test',
+                       'stack_name': 'load-test',
+                       'status': 'CREATE_COMPLETE',
+                       'version': '1'}}]))
+else:
+    print('[]')
+'''
+
+
+class TokenInfoHandler(BaseHTTPRequestHandler):
+    """Accepts any token with the deployer scope."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        body = json.dumps({'scope': ['load-test'], 'uid': 'load-test'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def start_local_lizzy(args) -> str:
+    """
+    Starts lizzy in this process with a fake senza on the path and returns
+    its URL.
+    """
+    bin_dir = tempfile.mkdtemp(prefix='lizzy-load-test-')
+    senza_path = os.path.join(bin_dir, 'senza')
+    with open(senza_path, 'w') as senza:
+        senza.write(FAKE_SENZA.format(python=sys.executable))
+    os.chmod(senza_path, 0o755)
+
+    token_info = serve(ThreadingHTTPServer(('127.0.0.1', 0), TokenInfoHandler))
+    os.environ.update({
+        'PATH': bin_dir + os.pathsep + os.environ['PATH'],
+        'FAKE_SENZA_CREATE_SECONDS': str(args.create_seconds),
+        'FAKE_SENZA_LIST_SECONDS': str(args.list_seconds),
+        'TOKENINFO_URL': 'http://127.0.0.1:{}/'.format(token_info.server_port),
+        'TOKEN_URL': 'http://127.0.0.1/',
+        'DEPLOYER_SCOPE': 'load-test',
+    })
+
+    # lizzy reads its configuration when imported
+    from werkzeug.serving import make_server
+    from lizzy.configuration import Configuration
+    from lizzy.service import setup_webapp
+
+    app = setup_webapp(Configuration())
+    logging.disable(logging.INFO)
+    server = serve(make_server('127.0.0.1', 0, app.app, threaded=True))
+    return 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+def create(session: requests.Session, url: str, senza_yaml: str,
+           version: int, dry_run: bool) -> Tuple[int, float]:
+    data = {'keep_stacks': 1,
+            'new_traffic': 0,
+            'stack_version': 'lt{}'.format(version),
+            'senza_yaml': senza_yaml,
+            'dry_run': dry_run}
+    start = time.perf_counter()
+    response = session.post(url + '/api/stacks', json=data, timeout=600)
+    return response.status_code, time.perf_counter() - start
+
+
+def read_loop(session: requests.Session, url: str, deadline: float,
+              results: List[Tuple[int, float]]):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            status = session.get(url + '/api/stacks', timeout=60).status_code
+        except requests.RequestException:
+            status = 0
+        results.append((status, time.perf_counter() - start))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url')
+    parser.add_argument('--token', default='load-test')
+    parser.add_argument('--senza-yaml', type=argparse.FileType())
+    parser.add_argument('--no-dry-run', dest='dry_run', action='store_false')
+    parser.add_argument('--local', action='store_true',
+                        help='Start lizzy in this process with a fake senza')
+    parser.add_argument('--create-seconds', type=float, default=10)
+    parser.add_argument('--list-seconds', type=float, default=0.5)
+    parser.add_argument('--creates', type=int, default=8,
+                        help='Stack creations running during the test')
+    parser.add_argument('--readers', type=int, default=8,
+                        help='Clients listing stacks in a loop')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Seconds the readers run')
+    args = parser.parse_args()
+
+    if args.local:
+        url = start_local_lizzy(args)
+        senza_yaml = 'SenzaInfo:\n  StackName: load-test\n'
+    elif args.url and args.senza_yaml:
+        url = args.url.rstrip('/')
+        senza_yaml = args.senza_yaml.read()
+    else:
+        parser.error('either --local or --url and --senza-yaml are required')
+
+    session = requests.Session()
+    session.headers['Authorization'] = 'Bearer {}'.format(args.token)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_maxsize=args.creates + args.readers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    creations = []  # type: List[Tuple[int, float]]
+    creators = [threading.Thread(
+        target=lambda version: creations.append(
+            create(session, url, senza_yaml, version, args.dry_run)),
+        args=(version,)) for version in range(args.creates)]
+    for creator in creators:
+        creator.start()
+    # lets the creations take their share of the server first
+    time.sleep(0.5)
+
+    reads = []  # type: List[Tuple[int, float]]
+    deadline = time.monotonic() + args.duration
+    readers = [threading.Thread(target=read_loop,
+                                args=(session, url, deadline, reads))
+               for _ in range(args.readers)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    creations_running = sum(creator.is_alive() for creator in creators)
+    for creator in creators:
+        creator.join()
+
+    latencies = [latency * 1000 for status, latency in reads if status == 200]
+    print('creations: {} ({} still running when the readers stopped), '
+          'statuses: {}'.format(len(creations), creations_running,
+                                sorted({status for status, _ in creations})))
+    print('reads: {} ok, {} failed, {:.1f} reads/s'.format(
+        len(latencies), len(reads) - len(latencies),
+        len(latencies) / args.duration))
+    if latencies:
+        print('read latency ms: p50 {:.1f}, p95 {:.1f}, max {:.1f}, '
+              'mean {:.1f}'.format(percentile(latencies, 0.5),
+                                   percentile(latencies, 0.95),
+                                   max(latencies),
+                                   statistics.mean(latencies)))
+
+
+if __name__ == '__main__':
+    main()
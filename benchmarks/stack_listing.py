@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Compares reading stacks with senza and straight from CloudFormation.
+
+Against a local moto server holding --stacks stacks (needs ``moto[server]``)::
+
+    $ python3 benchmarks/stack_listing.py --stacks 2000 --calls 5
+
+Against the stacks of a real AWS account::
+
+    $ python3 benchmarks/stack_listing.py --aws --region eu-central-1 \\
+          --get my-app 42
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Callable, List, Tuple  # NOQA pylint: disable=unused-import
+
+import boto3
+from lizzy.apps.cloudformation import CloudFormation
+from lizzy.apps.senza import Senza
+
+TEMPLATE = json.dumps({'Description': 'Benchmark stack',
+                       'Resources': {'Topic': {'Type': 'AWS::SNS::Topic'}}})
+
+
+def start_moto(region: str, stacks: int) -> Tuple[str, str]:
+    """
+    Starts a moto server with the stacks, senza reaches it through the
+    AWS_ENDPOINT_URL environment variable.
+
+    :return: Name and version of one of the stacks
+    """
+    from moto.server import ThreadedMotoServer
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ.update({'AWS_ENDPOINT_URL': 'http://{}:{}'.format(host, port),
+                       'AWS_ACCESS_KEY_ID': 'benchmark',
+                       'AWS_SECRET_ACCESS_KEY': 'benchmark'})
+    client = boto3.client('cloudformation', region_name=region)
+    for number in range(stacks):
+        client.create_stack(StackName='app{}-{}'.format(number % 100, number),
+                            TemplateBody=TEMPLATE)
+    return 'app1', '1'
+
+
+def measure(read: Callable[[], List], calls: int) -> Tuple[List[float], int]:
+    # first call is not measured so one time imports don't skew the numbers
+    stacks = read()
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        read()
+        timings.append(time.perf_counter() - start)
+    return timings, len(stacks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--calls', type=int, default=5)
+    parser.add_argument('--region', default='eu-west-1')
+    parser.add_argument('--stacks', type=int, default=1000,
+                        help='Stacks created in the moto server')
+    parser.add_argument('--aws', action='store_true',
+                        help='Read the stacks of the AWS account instead')
+    parser.add_argument('--get', nargs=2, metavar=('NAME', 'VERSION'),
+                        help='Stack read with a single lookup')
+    args = parser.parse_args()
+
+    if args.aws:
+        stack_name, stack_version = args.get or (None, None)
+    else:
+        stack_name, stack_version = args.get or start_moto(args.region,
+                                                           args.stacks)
+
+    senza = Senza(args.region)
+    cloud_formation = CloudFormation(args.region)
+    reads = [('senza list', senza.list),
+             ('cloudformation list', cloud_formation.list)]
+    if stack_name:
+        reads += [('senza get', lambda: senza.list(stack_name, stack_version)),
+                  ('cloudformation get',
+                   lambda: cloud_formation.list(stack_name, stack_version))]
+
+    print('{:<20} {:>8} {:>10} {:>10} {:>10}'.format(
+        'read', 'stacks', 'mean ms', 'p50 ms', 'max ms'))
+    for name, read in reads:
+        timings, stacks = measure(read, args.calls)
+        timings = [timing * 1000 for timing in timings]
+        print('{:<20} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            name, stacks, statistics.mean(timings), statistics.median(timings),
+            max(timings)))
+
+
+if __name__ == '__main__':
+    main()
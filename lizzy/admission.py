@@ -0,0 +1,300 @@
+"""
+Admission control of requests that run senza commands.
+"""
+
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from logging import getLogger
+from threading import Condition, local
+from typing import Callable, Dict, Iterator, List, Optional  # NOQA pylint: disable=unused-import
+
+from .configuration import config
+from .exceptions import Overloaded
+
+logger = getLogger('lizzy.admission')  # pylint: disable=invalid-name
+
+# Rejection reasons
+RATE = 'rate'
+USER_RATE = 'user_rate'
+USER_CONCURRENCY = 'user_concurrency'
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+IDLE_FULL = 'idle_full'
+
+REASONS = (RATE, USER_RATE, USER_CONCURRENCY, QUEUE_FULL, QUEUE_TIMEOUT, IDLE_FULL)
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` requests per minute with bursts of up to ten seconds
+    worth of requests.
+    """
+
+    def __init__(self, rate: float, clock: Callable[[], float]):
+        self.rate = rate / 60
+        self.capacity = max(1.0, rate / 6)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """
+        Takes a token if there is one.
+
+        :return: zero when a token was taken, otherwise the seconds until
+                 there is one
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        """Returns a token taken for a request that was rejected after all."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:  # pylint: disable=too-many-instance-attributes
+    """
+    Limits the requests being served at the same time, in total and per user,
+    and how many requests per minute are accepted.
+
+    Requests over the total concurrency wait in a queue of ``queue_size``
+    requests for up to ``queue_timeout`` seconds. Everything else over a
+    limit is rejected right away with :class:`~lizzy.exceptions.Overloaded`,
+    telling the client when to retry. Idle requests don't take a slot but
+    still hold a thread of the server, so at most ``idle_limit`` of them are
+    allowed. Limits of zero or less are disabled.
+    """
+
+    max_buckets = 1000
+
+    def __init__(self, *, concurrency: int, queue_size: int,
+                 queue_timeout: float, user_concurrency: int, rate: float,
+                 user_rate: float, idle_limit: int=0,
+                 clock: Callable[[], float]=time.monotonic):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.user_concurrency = user_concurrency
+        self.rate = rate
+        self.user_rate = user_rate
+        self.idle_limit = idle_limit
+        self.clock = clock
+        self.in_flight = 0
+        self.queued = 0
+        self.idling = 0
+        self.admitted = 0
+        self.rejected = dict.fromkeys(REASONS, 0)
+        self.user_in_flight = defaultdict(int)  # type: Dict[str, int]
+        self.duration = 1.0  # moving average of the request duration
+        self._bucket = TokenBucket(rate, clock) if rate > 0 else None
+        self._user_buckets = {}  # type: Dict[str, TokenBucket]
+        self._condition = Condition()
+        self._idle = local()
+
+    @property
+    def retry_after(self) -> int:
+        """Seconds a client should wait before retrying a rejected request."""
+        return min(max(1, math.ceil(self.duration)), 60)
+
+    def _reject(self, reason: str, user: Optional[str],
+                retry_after: Optional[float]=None):
+        self.rejected[reason] += 1
+        retry_after = (self.retry_after if retry_after is None
+                       else max(1, math.ceil(retry_after)))
+        logger.warning('Rejected request.',
+                       extra={'reason': reason, 'user': user,
+                              'in_flight': self.in_flight,
+                              'queued': self.queued})
+        raise Overloaded(reason, retry_after)
+
+    def _user_bucket(self, user: str) -> TokenBucket:
+        bucket = self._user_buckets.get(user)
+        if bucket is None:
+            if len(self._user_buckets) >= self.max_buckets:
+                # full buckets are the same as new ones
+                for idle_user in [idle_user for idle_user, idle_bucket
+                                  in self._user_buckets.items() if idle_bucket.full]:
+                    del self._user_buckets[idle_user]
+            bucket = self._user_buckets[user] = TokenBucket(self.user_rate,
+                                                            self.clock)
+        return bucket
+
+    def _take_tokens(self, user: Optional[str]) -> List[TokenBucket]:
+        """
+        Takes a token of each rate limit of the user, giving back the ones
+        already taken when a bucket is empty.
+        """
+        buckets = []
+        if self.user_rate > 0 and user is not None:
+            buckets.append((USER_RATE, self._user_bucket(user)))
+        if self._bucket is not None:
+            buckets.append((RATE, self._bucket))
+        taken = []  # type: List[TokenBucket]
+        for reason, bucket in buckets:
+            wait = bucket.take()
+            if wait:
+                for taken_bucket in taken:
+                    taken_bucket.give_back()
+                self._reject(reason, user, wait)
+            taken.append(bucket)
+        return taken
+
+    def _wait_for_slot(self, user: Optional[str]):
+        self.queued += 1
+        try:
+            deadline = self.clock() + self.queue_timeout
+            while self.in_flight >= self.concurrency:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    self._reject(QUEUE_TIMEOUT, user)
+                self._condition.wait(remaining)
+        finally:
+            self.queued -= 1
+
+    def _admit(self, user: Optional[str]):
+        with self._condition:
+            # limits rejecting right away go first, so they don't use up the
+            # rates of requests that are rejected anyway
+            if (self.user_concurrency > 0 and
+                    self.user_in_flight[user] >= self.user_concurrency):
+                self._reject(USER_CONCURRENCY, user)
+            full = 0 < self.concurrency <= self.in_flight
+            if full and self.queued >= self.queue_size:
+                self._reject(QUEUE_FULL, user)
+            taken = self._take_tokens(user)
+            if full:
+                try:
+                    self._wait_for_slot(user)
+                except Overloaded:
+                    for bucket in taken:
+                        bucket.give_back()
+                    raise
+            self.in_flight += 1
+            self.user_in_flight[user] += 1
+            self.admitted += 1
+
+    def _leave(self, user: Optional[str]):
+        """Frees a slot of the user, the condition must be held."""
+        self.in_flight -= 1
+        self.user_in_flight[user] -= 1
+        if not self.user_in_flight[user]:
+            del self.user_in_flight[user]
+        self._condition.notify()
+
+    def _release(self, user: Optional[str], duration: float):
+        with self._condition:
+            self._leave(user)
+            self.duration = 0.9 * self.duration + 0.1 * duration
+
+    @contextmanager
+    def admit(self, user: Optional[str]) -> Iterator[None]:
+        """
+        Serves a request of the user once it is admitted.
+
+        :raises Overloaded: when the request is rejected
+        """
+        self._admit(user)
+        started = self.clock()
+        # requests may be admitted again while idle, e.g. to read a stack
+        outer_idle = getattr(self._idle, 'seconds', 0.0)
+        self._idle.seconds = 0.0
+        try:
+            yield
+        finally:
+            self._release(user, self.clock() - started - self._idle.seconds)
+            self._idle.seconds = outer_idle
+
+    @contextmanager
+    def idle(self, user: Optional[str]) -> Iterator[None]:
+        """
+        Gives up the slot of an admitted request while it waits without
+        running commands, e.g. for a stack to reach a status. The slot is
+        taken back afterwards even over the concurrency limit, since the
+        request only has to be answered then, and the idle time isn't counted
+        in the request duration.
+
+        :raises Overloaded: when ``idle_limit`` requests are already idle
+        """
+        with self._condition:
+            if 0 < self.idle_limit <= self.idling:
+                self._reject(IDLE_FULL, user)
+            self.idling += 1
+            self._leave(user)
+        started = self.clock()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.idling -= 1
+                self.in_flight += 1
+                self.user_in_flight[user] += 1
+            self._idle.seconds = getattr(self._idle, 'seconds', 0.0) + self.clock() - started
+
+    def detach(self, user: Optional[str]) -> Callable[[], None]:
+        """
+        Keeps the slot of an admitted request taken for work it leaves
+        running in the background, e.g. a streamed operation, until the
+        returned function is called.
+        """
+        with self._condition:
+            self.in_flight += 1
+            self.user_in_flight[user] += 1
+
+        def release():
+            with self._condition:
+                self._leave(user)
+
+        return release
+
+    @contextmanager
+    def background(self) -> Iterator[None]:
+        """
+        Takes a slot for work that runs outside of a request, e.g. a
+        background job, waiting as long as it takes. The rates aren't
+        applied, the request that queued the work was already admitted.
+        """
+        with self._condition:
+            while 0 < self.concurrency <= self.in_flight:
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {'in_flight': self.in_flight,
+                    'queued': self.queued,
+                    'idle': self.idling,
+                    'admitted': self.admitted,
+                    'rejected': dict(self.rejected),
+                    'retry_after': self.retry_after}
+
+
+ADMISSION = AdmissionController(concurrency=config.admission_concurrency,
+                                queue_size=config.admission_queue_size,
+                                queue_timeout=config.admission_queue_timeout,
+                                user_concurrency=config.admission_user_concurrency,
+                                rate=config.admission_rate,
+                                user_rate=config.admission_user_rate,
+                                idle_limit=config.stack_wait_concurrency)
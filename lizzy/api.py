@@ -1,24 +1,67 @@
+import calendar
+import hashlib
 import json
 import logging
 import os
-from typing import (Dict, List, Optional,  # noqa pylint: disable=unused-import
-                    Tuple)
+from collections import OrderedDict
+from typing import (Any, Callable, Dict, List,  # noqa pylint: disable=unused-import
+                    Optional, Tuple)
 
 import connexion
 import yaml
+from connexion.lifecycle import ConnexionResponse
 from decorator import decorator
 from flask import Response
-from lizzy import config, sentry_client
-from lizzy.apps.senza import Senza
-from lizzy.exceptions import ExecutionError, ObjectNotFound, TrafficNotUpdated
-from lizzy.models.stack import Stack
+from lizzy import config, metrics, sentry_client
+from lizzy.admission import ADMISSION
+from lizzy.apps.aws import CLIENTS
+from lizzy.apps.breaker import BREAKERS
+from lizzy.apps.coalescing import SingleFlight
+from lizzy.apps.executors import OutputCallback
+from lizzy.apps.history import HISTORY, acting_user, current_user
+from lizzy.apps.output import OUTPUTS, CommandOutput
+from lizzy.apps.limits import LANES
+from lizzy.apps.senza import READ_FLIGHTS, Senza
+from lizzy.apps.throttling import BUDGET
+from lizzy.cache import TTLCache
+from lizzy.exceptions import (ClientDisconnected, ExecutionError,
+                              ExecutionTimeout, JobQueueFull,
+                              ObjectNotFound, Overloaded,
+                              TemporarilyUnavailable, TrafficNotUpdated)
+from lizzy.health import HealthChecker
+from lizzy.jobs import JOBS, Job
+from lizzy.models.query import StackQuery, decode_cursor, encode_cursor
+from lizzy.models.stack import INVENTORY, STACK_CACHE, WATCHER, Stack
 from lizzy.security import bouncer
-from lizzy.util import filter_empty_values
+from lizzy.streaming import MIMETYPE as EVENT_STREAM
+from lizzy.streaming import OutputStream
+from lizzy.util import filter_empty_values, parse_date
 from lizzy.version import VERSION
 from senza import __version__ as SENZA_VERSION
 
 logger = logging.getLogger('lizzy.api')  # pylint: disable=invalid-name
 
+# Responses of requests with an Idempotency-Key header, keyed by user, method,
+# path and idempotency key
+IDEMPOTENT_RESPONSES = TTLCache(ttl=config.idempotency_key_ttl,
+                                maxsize=config.idempotency_key_size)
+IDEMPOTENT_FLIGHTS = SingleFlight()
+
+
+def _check_senza():
+    """
+    Lists the stacks of the region, unless the inventory poller already does.
+    """
+    if INVENTORY.snapshot(config.region) is not None:
+        error = INVENTORY.errors.get(config.region)
+        if error:
+            raise ExecutionError('inventory', error)
+        return
+    Senza(config.region).list()
+
+
+HEALTH = HealthChecker(_check_senza, interval=config.health_check_interval)
+
 
 def _make_headers(**kwargs: Dict[str, str]) -> dict:
     headers = {'x-Lizzy-{key}'.format(key=k.title()): v.replace('\n', '\\n')
@@ -28,31 +71,176 @@ def _make_headers(**kwargs: Dict[str, str]) -> dict:
     return headers
 
 
+def _output_headers(output: str) -> dict:
+    """
+    Headers with the beginning and end of the senza output and, when the
+    complete output was stored, its execution id.
+    """
+    headers = _make_headers(output=output)
+    if isinstance(output, CommandOutput) and output.execution_id:
+        headers['X-Lizzy-Execution-Id'] = output.execution_id
+    return headers
+
+
+def _inventory_headers(region: str) -> dict:
+    """
+    Headers for responses that may be answered from the inventory snapshot,
+    including the snapshot age in seconds and its revision when it is used.
+    """
+    headers = _make_headers()
+    age = INVENTORY.age(region)
+    if age is not None:
+        headers['X-Lizzy-Inventory-Age'] = '{:.1f}'.format(age)
+        revision = INVENTORY.revision(region)
+        if revision is not None:
+            headers['X-Lizzy-Inventory-Revision'] = revision
+    return headers
+
+
 @decorator
 def exception_to_connexion_problem(func, *args, **kwargs):
     try:
         return func(*args, **kwargs)
     except ObjectNotFound as exception:
+        metrics.count_error(exception)
         problem = connexion.problem(404, 'Not Found',
                                     "Stack not found: {}".format(exception.uid),
                                     headers=_make_headers())
         return problem
+    except JobQueueFull as exception:
+        metrics.count_error(exception)
+        return connexion.problem(503, 'Service Unavailable',
+                                 exception.message,
+                                 headers=_make_headers())
+    except TemporarilyUnavailable as error:
+        metrics.count_error(error)
+        headers = _make_headers()
+        headers['Retry-After'] = str(error.retry_after)
+        return connexion.problem(503, 'Service Unavailable', error.output,
+                                 headers=headers)
+    except ExecutionTimeout as error:
+        metrics.count_error(error)
+        sentry_client.captureException()
+        return connexion.problem(504, 'Execution Timeout',
+                                 error.output,
+                                 headers=_make_headers())
     except ExecutionError as error:
+        metrics.count_error(error)
         sentry_client.captureException()
         return connexion.problem(500,
                                  title='Execution Error',
                                  detail=error.output,
                                  headers=_make_headers())
-    except Exception:
+    except (Overloaded, ClientDisconnected):
+        raise
+    except Exception as error:
+        metrics.count_error(error)
         sentry_client.captureException()
         raise
 
 
+@decorator
+def admitted(func, *args, **kwargs):
+    """
+    Serves the request only if the admission controller accepts it, answering
+    with 429 and a Retry-After header otherwise. The commands the request runs
+    are attributed to its user in the execution history.
+    """
+    user = getattr(connexion.request, 'user', None)
+    try:
+        with ADMISSION.admit(user), acting_user(user):
+            return func(*args, **kwargs)
+    except Overloaded as exception:
+        headers = _make_headers()
+        headers['Retry-After'] = str(exception.retry_after)
+        return connexion.problem(429, 'Too Many Requests', exception.message,
+                                 headers=headers)
+
+
+def _status_code(response) -> int:
+    if isinstance(response, tuple):
+        return response[1]
+    return getattr(response, 'status_code', 200)
+
+
+def _replayed(response):
+    """
+    Marks a stored response as replayed with the X-Lizzy-Idempotent-Replayed
+    header.
+    """
+    if isinstance(response, tuple):
+        body, status, headers = response
+        return body, status, dict(headers, **{'X-Lizzy-Idempotent-Replayed': 'true'})
+    return ConnexionResponse(status_code=response.status_code,
+                             mimetype=response.mimetype,
+                             content_type=response.content_type,
+                             body=response.body,
+                             headers=dict(response.headers,
+                                          **{'X-Lizzy-Idempotent-Replayed': 'true'}))
+
+
+@decorator
+def idempotent(func, *args, **kwargs):
+    """
+    Requests repeating the Idempotency-Key header of a previous request
+    receive its stored response instead of running the operation again, or
+    wait for it if it is still running. Server errors are not stored so the
+    operation can be retried, neither are streamed responses.
+    """
+    idempotency_key = connexion.request.headers.get('Idempotency-Key')
+    if not idempotency_key:
+        return func(*args, **kwargs)
+
+    request = connexion.request
+    key = (getattr(request, 'user', None), request.method, request.path,
+           idempotency_key)
+    fingerprint = hashlib.sha256(request.get_data() +
+                                 request.headers.get('Prefer', '').encode()).hexdigest()
+    executed = []
+
+    def execute():
+        stored = IDEMPOTENT_RESPONSES.peek(key)
+        if stored is None:
+            executed.append(True)
+            response = func(*args, **kwargs)
+            stored = (fingerprint, response)
+            if (_status_code(response) < 500 and
+                    not getattr(response, 'is_streamed', False)):
+                IDEMPOTENT_RESPONSES.set(key, stored)
+        return stored
+
+    stored_fingerprint, response = IDEMPOTENT_FLIGHTS.do(key, execute)
+    if executed:
+        return response
+    if stored_fingerprint != fingerprint:
+        return connexion.problem(422, 'Unprocessable Entity',
+                                 'Idempotency key was used for a different request',
+                                 headers=_make_headers())
+    logger.info('Replaying response of idempotent request.',
+                extra={'idempotency_key': idempotency_key,
+                       'path': request.path})
+    return _replayed(response)
+
+
 @bouncer
+@admitted
 @exception_to_connexion_problem
-def all_stacks(references: str=None, region: str=None) -> dict:
+def all_stacks(  # pylint: disable=too-many-branches,too-many-return-statements
+        references: str=None, region: List[str]=None,
+        limit: Optional[int]=None, cursor: Optional[str]=None,
+        status: Optional[List[str]]=None, name_prefix: Optional[str]=None,
+        created_after: Optional[str]=None, created_before: Optional[str]=None,
+        fields: Optional[List[str]]=None, since: Optional[str]=None) -> dict:
     """
     GET /stacks/
+
+    Several regions (or "all" for the configured ones) are listed
+    concurrently, regions that fail are reported in the
+    X-Lizzy-Failed-Regions header.
+
+    Stacks are listed by creation time. With a ``limit`` the cursor of the
+    next page is returned in the X-Lizzy-Next-Cursor header. With ``since``
+    only the changes of the inventory after that revision are returned.
     """
     sentry_client.capture_breadcrumb(data={
         'references': references,
@@ -60,12 +248,166 @@ def all_stacks(references: str=None, region: str=None) -> dict:
     })
     if not references:
         references = []
-    stacks = Stack.list(*references, region=region or config.region)
-    stacks.sort(key=lambda stack: stack.creation_time)
-    return stacks, 200, _make_headers()
+    regions = _requested_regions(region)
+    if since is not None and (references or len(regions) > 1 or limit or cursor):
+        return connexion.problem(400, 'Invalid Query',
+                                 'since lists the changes of a single region, '
+                                 'without references, limit or cursor',
+                                 headers=_make_headers())
+    try:
+        query = StackQuery(statuses=status,
+                           name_prefix=name_prefix,
+                           created_after=_timestamp(created_after),
+                           created_before=_timestamp(created_before),
+                           after=decode_cursor(cursor) if cursor else None,
+                           # one more tells if there is a next page
+                           limit=limit + 1 if limit else None)
+    except ValueError as error:
+        return connexion.problem(400, 'Invalid Query', str(error),
+                                 headers=_make_headers())
+
+    # listings of the inventory are known to be unchanged while its revision
+    # is, the revision is read before the listing so it is never newer
+    revision = (INVENTORY.revision(regions[0])
+                if len(regions) == 1 and not references else None)
+    if revision is not None:
+        headers = _inventory_headers(regions[0])
+        not_modified = _not_modified(_etag(revision, _query_arguments()),
+                                     headers)
+        if not_modified is not None:
+            return not_modified
+        if since is not None:
+            return _stack_changes(regions[0], since, revision, query,
+                                  fields), 200, headers
+
+    if len(regions) == 1:
+        stacks = Stack.list(*references, region=regions[0], query=query)
+        if revision is None:
+            headers = (_make_headers() if references
+                       else _inventory_headers(regions[0]))
+    else:
+        stacks, errors = Stack.list_regions(regions, *references, query=query)
+        if errors and len(errors) == len(regions):
+            raise next(iter(errors.values()))
+        headers = _make_headers()
+        if errors:
+            logger.error('Failed to list stacks in some regions.',
+                         extra={'errors': {region: str(error)
+                                           for region, error in errors.items()}})
+            headers['X-Lizzy-Failed-Regions'] = ','.join(sorted(errors))
+    stacks.sort(key=lambda stack: stack.sort_key(regions[0]))
+    if limit and len(stacks) > limit:
+        stacks = stacks[:limit]
+        headers['X-Lizzy-Next-Cursor'] = encode_cursor(
+            stacks[-1].sort_key(regions[0]))
+    if since is not None:
+        # the region is not in the inventory, there are no changes to list
+        return {'revision': None, 'full': True,
+                'created': _project(stacks, fields), 'changed': [],
+                'removed': []}, 200, headers
+    if revision is None:
+        not_modified = _not_modified(
+            _etag([stack.to_dict() for stack in stacks], _query_arguments(),
+                  headers.get('X-Lizzy-Failed-Regions')),
+            headers)
+        if not_modified is not None:
+            return not_modified
+    return _project(stacks, fields), 200, headers
+
+
+def _stack_changes(region: str, since: str, revision: str, query: StackQuery,
+                   fields: Optional[List[str]]) -> dict:
+    """
+    Stacks of the inventory of the region created, changed and removed after
+    the ``since`` revision. When those changes are not known, e.g. because the
+    revision is from another process, all the stacks are returned as created
+    and ``full`` is set, so clients replace the stacks they have.
+
+    Changed stacks that don't match the query anymore are returned as
+    removed.
+    """
+    changes = INVENTORY.changes(region, since)
+    if changes is None:
+        stacks = Stack.list(region=region, query=query)
+        return {'revision': revision, 'full': True,
+                'created': _project(stacks, fields), 'changed': [],
+                'removed': []}
+    created = query.select(changes.created, region)
+    changed = query.select(changes.changed, region)
+    removed = changes.removed + [{'stack_name': stack['stack_name'],
+                                  'version': stack['version']}
+                                 for stack in changes.changed
+                                 if not query.matches(stack)]
+    return {'revision': changes.revision, 'full': False,
+            'created': _project([Stack(**stack) for stack in created], fields),
+            'changed': _project([Stack(**stack) for stack in changed], fields),
+            'removed': removed}
+
+
+def _project(stacks: List[Stack], fields: Optional[List[str]]) -> List:
+    """
+    Only keeps the given fields of the stacks, all of them without any.
+    """
+    if not fields:
+        return stacks
+    return [{field: value for field, value in stack.to_dict().items()
+             if field in fields}
+            for stack in stacks]
+
+
+def _query_arguments() -> List[Tuple[str, str]]:
+    return sorted(connexion.request.args.items(multi=True))
+
+
+def _etag(*parts: Any) -> str:
+    """
+    Strong entity tag of a response whose body is determined by the parts.
+    """
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _not_modified(etag: str, headers: dict) -> Optional[Response]:
+    """
+    Adds the ETag header to the response headers and returns the 304 Not
+    Modified response when the If-None-Match header of the request has the
+    entity tag, so the response body is neither built nor serialized.
+    """
+    headers['ETag'] = '"{}"'.format(etag)
+    if connexion.request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    return None
+
+
+def _timestamp(date_time: Optional[str]) -> Optional[int]:
+    """
+    Parses an ISO 8601 date, UTC unless it has a time zone, to a timestamp.
+
+    :raises ValueError: when the date is invalid
+    """
+    if date_time is None:
+        return None
+    return calendar.timegm(parse_date(date_time).utctimetuple())
+
+
+def _requested_regions(regions: Optional[List[str]]) -> List[str]:
+    """
+    Expands the requested regions, "all" stands for the configured regions.
+    """
+    if not regions:
+        return [config.region]
+    expanded = []  # type: List[str]
+    for region in regions:
+        if region == 'all':
+            expanded.extend(config.regions or [config.region])
+        else:
+            expanded.append(region)
+    # remove duplicates keeping the order
+    return list(OrderedDict.fromkeys(expanded))
 
 
 @bouncer
+@admitted
+@idempotent
 @exception_to_connexion_problem
 def create_stack(new_stack: dict) -> dict:
     """
@@ -112,49 +454,93 @@ def create_stack(new_stack: dict) -> dict:
                                     headers=_make_headers())
         return problem
 
-    # Create the Stack
-    logger.info("Creating stack %s...", stack_name)
-
-    senza = Senza(region)
     tags = ['LizzyKeepStacks={}'.format(keep_stacks),
             'LizzyTargetTraffic={}'.format(new_traffic),
             *tags]
+    arguments = {'senza_yaml': senza_yaml,
+                 'stack_name': stack_name,
+                 'stack_version': stack_version,
+                 'parameters': parameters,
+                 'disable_rollback': disable_rollback,
+                 'dry_run': dry_run,
+                 'tags': tags,
+                 'region': region}
+
+    if _prefers_async():
+        return _submit_job('create_stack', arguments)
+
+    if _prefers_stream():
+        return _stream(lambda on_output: (
+            _create_stack(**arguments, on_output=on_output)[0], 201))
+
+    stack_dict, output = _create_stack(**arguments)
+    return stack_dict, 201, _output_headers(output)
+
+
+def _create_stack(senza_yaml: str, stack_name: str, stack_version: str,
+                  parameters: List[str], disable_rollback: bool,
+                  dry_run: bool, tags: List[str], region: str,
+                  on_output: Optional[OutputCallback]=None):
+    logger.info("Creating stack %s...", stack_name)
 
+    senza = Senza(region)
     output = senza.create(senza_yaml, stack_version, parameters, disable_rollback,
-                          dry_run, tags)
+                          dry_run, tags, **_relay(on_output))
 
     logger.info("Stack created.", extra={'stack_name': stack_name,
                                          'stack_version': stack_version,
                                          'parameters': parameters})
-    stack_dict = (Stack.get(stack_name, stack_version, region=region)
+    stack_dict = (Stack.refresh(stack_name, stack_version, region=region)
                   if not dry_run
                   else {'stack_name': stack_name,
                         'creation_time': '',
                         'description': '',
                         'status': 'DRY-RUN',
                         'version': stack_version})
-
-
-    return stack_dict, 201, _make_headers(output=output)
+    return stack_dict, output
 
 
 @bouncer
+@admitted
 @exception_to_connexion_problem
-def get_stack(stack_id: str, region: Optional[str]=None) -> dict:
+def get_stack(stack_id: str, region: Optional[str]=None,
+              wait_for: Optional[List[str]]=None,
+              timeout: Optional[int]=None) -> dict:
     """
     GET /stacks/{id}
+
+    With ``wait_for`` the request waits up to ``timeout`` seconds for the
+    stack to reach one of the statuses, only taking an admission slot while
+    it reads the stack.
     """
     sentry_client.capture_breadcrumb(data={
         'stack_id': stack_id,
         'region': region,
+        'wait_for': wait_for,
     })
 
     stack_name, stack_version = stack_id.rsplit('-', 1)
-    stack_dict = Stack.get(stack_name, stack_version, region=region or config.region)
-    return stack_dict, 200, _make_headers()
+    region = region or config.region
+    if wait_for:
+        timeout = min(config.stack_wait_timeout if timeout is None else timeout,
+                      config.stack_wait_timeout)
+        user = getattr(connexion.request, 'user', None)
+        with ADMISSION.idle(user):
+            stack = Stack.wait(stack_name, stack_version, wait_for, timeout,
+                               region=region,
+                               admit=lambda: ADMISSION.admit(user))
+    else:
+        stack = Stack.get(stack_name, stack_version, region=region)
+    headers = _inventory_headers(region)
+    not_modified = _not_modified(_etag(stack.to_dict()), headers)
+    if not_modified is not None:
+        return not_modified
+    return stack, 200, headers
 
 
 @bouncer
+@admitted
+@idempotent
 @exception_to_connexion_problem
 def patch_stack(stack_id: str, stack_patch: dict) -> dict:
     """
@@ -169,22 +555,41 @@ def patch_stack(stack_id: str, stack_patch: dict) -> dict:
 
     stack_patch = filter_empty_values(stack_patch)
 
+    if _prefers_async():
+        return _submit_job('patch_stack', {'stack_id': stack_id,
+                                           'stack_patch': stack_patch})
+
+    if _prefers_stream():
+        return _stream(lambda on_output: (
+            _patch_stack(stack_id, stack_patch, on_output=on_output)[0], 202))
+
+    stack_dict, _ = _patch_stack(stack_id, stack_patch)
+    return stack_dict, 202, _make_headers()
+
+
+def _patch_stack(stack_id: str, stack_patch: dict,
+                 on_output: Optional[OutputCallback]=None):
     stack_name, stack_version = stack_id.rsplit('-', 1)
     use_region = stack_patch.get('region', config.region)
     senza = Senza(use_region)
     log_info = {'stack_id': stack_id,
                 'stack_name': stack_name}
+    output = ''
+
+    # the stack changes even if one of the steps fails
+    Stack.invalidate(stack_name, stack_version, region=use_region)
 
     if 'new_scale' in stack_patch:
         new_scale = stack_patch['new_scale']
-        senza.scale(stack_name, stack_version, new_scale)
+        output = senza.scale(stack_name, stack_version, new_scale)
 
     if 'new_ami_image' in stack_patch:
         # Change the AMI image of the Auto Scaling Group (ASG) and respawn the
         # instances to use new image.
         new_ami_image = stack_patch['new_ami_image']
         senza.patch(stack_name, stack_version, new_ami_image)
-        senza.respawn_instances(stack_name, stack_version)
+        senza.respawn_instances(stack_name, stack_version,
+                                **_relay(on_output))
 
     if 'new_traffic' in stack_patch:
         new_traffic = stack_patch['new_traffic']
@@ -201,12 +606,12 @@ def patch_stack(stack_id: str, stack_patch: dict) -> dict:
             raise TrafficNotUpdated("App does not have a domain.")
 
     # refresh the dict
-    stack_dict = Stack.get(stack_name, stack_version, region=use_region)
-
-    return stack_dict, 202, _make_headers()
+    stack_dict = Stack.refresh(stack_name, stack_version, region=use_region)
+    return stack_dict, output
 
 
 @bouncer
+@admitted
 @exception_to_connexion_problem
 def get_stack_traffic(stack_id: str, region: str=None) -> Tuple[dict, int, dict]:
     """
@@ -233,6 +638,7 @@ def get_stack_traffic(stack_id: str, region: str=None) -> Tuple[dict, int, dict]
 
 
 @bouncer
+@admitted
 @exception_to_connexion_problem
 def delete_stack(stack_id: str, delete_options: dict) -> dict:
     """
@@ -247,16 +653,176 @@ def delete_stack(stack_id: str, delete_options: dict) -> dict:
     dry_run = delete_options.get('dry_run', False)
     force = delete_options.get('force', False)
     region = delete_options.get('region', config.region)  # type: Optional[str]
+    arguments = {'stack_id': stack_id,
+                 'dry_run': dry_run,
+                 'force': force,
+                 'region': region}
 
+    if _prefers_async():
+        return _submit_job('delete_stack', arguments)
+
+    if _prefers_stream():
+        return _stream(lambda on_output: (
+            _delete_stack(**arguments, on_output=on_output)[0], 204))
+
+    _, output = _delete_stack(**arguments)
+    return '', 204, _output_headers(output)
+
+
+def _delete_stack(stack_id: str, dry_run: bool, force: bool, region: str,
+                  on_output: Optional[OutputCallback]=None):
     senza = Senza(region)
 
     logger.info("Removing stack %s...", stack_id)
 
     output = senza.remove(stack_id,
-                          dry_run=dry_run, force=force)
+                          dry_run=dry_run, force=force, **_relay(on_output))
+    if not dry_run:
+        Stack.invalidate(*stack_id.rsplit('-', 1), region=region)
 
     logger.info("Stack %s removed.", stack_id)
-    return '', 204, _make_headers(output=output)
+    return None, output
+
+
+def _admitted_job(operation: Callable) -> Callable:
+    """
+    Runs a job operation within an admission slot, so background jobs count
+    against ADMISSION_CONCURRENCY like the requests running commands.
+    """
+    def run(**arguments):
+        with ADMISSION.background():
+            return operation(**arguments)
+    return run
+
+
+JOBS.register('create_stack', _admitted_job(_create_stack))
+JOBS.register('patch_stack', _admitted_job(_patch_stack))
+JOBS.register('delete_stack', _admitted_job(_delete_stack))
+
+
+def _prefers_async() -> bool:
+    """
+    Checks if the client asked for the operation to run in the background
+    with the "Prefer: respond-async" header (RFC 7240).
+    """
+    preferences = connexion.request.headers.get('Prefer', '')
+    return 'respond-async' in [preference.strip().lower()
+                               for preference in preferences.split(',')]
+
+
+def _submit_job(operation: str, arguments: dict) -> Tuple[Job, int, dict]:
+    job = JOBS.submit(operation, **arguments)
+    headers = _make_headers()
+    headers['Location'] = '/api/jobs/{}'.format(job.job_id)
+    return job, 202, headers
+
+
+def _prefers_stream() -> bool:
+    """
+    Checks if the client asked for the senza output as Server-Sent Events
+    with the "Accept: text/event-stream" header.
+    """
+    return EVENT_STREAM in connexion.request.headers.get('Accept', '')
+
+
+def _relay(on_output: Optional[OutputCallback]) -> dict:
+    """
+    Keyword arguments passing senza output lines to ``on_output`` when the
+    output is streamed.
+    """
+    return {'on_output': on_output} if on_output else {}
+
+
+def _stream(respond: Callable[[OutputCallback], Tuple[Any, int]]) -> Response:
+    """
+    Runs the operation in the background, streaming senza output lines as
+    ``output`` events while it runs. The response the operation would have
+    had is sent as a ``result`` event with its status and body, or as an
+    ``error`` event with the problem. The admission slot of the request is
+    kept until the operation finishes. When the client goes away the senza
+    command is killed as soon as it writes another line.
+
+    :param respond: Runs the operation passing the output lines to the
+                    callback it receives and returns the response body and
+                    status
+    """
+
+    @exception_to_connexion_problem
+    def run(on_output: OutputCallback):
+        return respond(on_output)
+
+    user = current_user()
+    release = ADMISSION.detach(user)
+
+    def operation(stream: OutputStream):
+        try:
+            with acting_user(user):
+                response = run(stream.write)
+        except ClientDisconnected:
+            logger.info('Stopped streamed operation of disconnected client.',
+                        extra={'user': user})
+            return
+        finally:
+            release()
+        if isinstance(response, ConnexionResponse):
+            stream.finish('error', response.body)
+        else:
+            body, status = response
+            stream.finish('result', {'status': status, 'body': body})
+
+    stream = OutputStream().run(operation)
+    headers = _make_headers()
+    headers['Cache-Control'] = 'no-cache'
+    # tells nginx not to buffer the events
+    headers['X-Accel-Buffering'] = 'no'
+    return Response(stream.events(), status=200, mimetype=EVENT_STREAM,
+                    headers=headers)
+
+
+@bouncer
+@exception_to_connexion_problem
+def get_job(job_id: str) -> Tuple[Job, int, dict]:
+    """
+    GET /jobs/{id}
+    """
+    try:
+        job = JOBS.get(job_id)
+    except ObjectNotFound:
+        return connexion.problem(404, 'Not Found',
+                                 'Job not found: {}'.format(job_id),
+                                 headers=_make_headers())
+    return job, 200, _make_headers()
+
+
+@bouncer
+@exception_to_connexion_problem
+def get_execution_output(execution_id: str) -> Response:
+    """
+    GET /executions/{id}/output
+
+    Complete output of a senza command, while it is kept in the output store.
+    """
+    try:
+        chunks = OUTPUTS.read(execution_id)
+    except ObjectNotFound:
+        return connexion.problem(404, 'Not Found',
+                                 'Execution output not found: {}'.format(execution_id),
+                                 headers=_make_headers())
+    return Response(chunks, status=200, mimetype='text/plain',
+                    headers=_make_headers())
+
+
+@bouncer
+def get_execution_timings(window: int=3600, subcommand: Optional[str]=None,
+                          region: Optional[str]=None) -> Tuple[dict, int, dict]:
+    """
+    GET /executions/timings
+
+    Duration percentiles of the commands run in the last ``window`` seconds,
+    by subcommand and region.
+    """
+    timings = HISTORY.timings(window, subcommand=subcommand, region=region)
+    return {'window': window, 'timings': timings}, 200, _make_headers()
 
 
 def not_found_path_handler(error):
@@ -275,16 +841,22 @@ def expose_api_schema():
 
 
 def get_app_status():
-    status = 'OK'
-    try:
-        Senza(config.region).list()
-    except ExecutionError:
-        status = 'NOK'
+    health = HEALTH.result()
 
     status_info = {
         'version': os.environ.get("APPLICATION_VERSION", ""),
         'senza_version': SENZA_VERSION,
-        'status': status,
+        'status': 'OK' if health.healthy else 'NOK',
+        'health': HEALTH.stats(),
+        'stack_cache': STACK_CACHE.stats(),
+        'coalesced_reads': READ_FLIGHTS.stats(),
+        'stack_watches': WATCHER.stats(),
+        'admission': ADMISSION.stats(),
+        'execution': {lane.name: lane.stats() for lane in LANES},
+        'circuit_breakers': BREAKERS.stats(),
+        'aws_budget': BUDGET.stats(),
+        'aws_clients': CLIENTS.stats(),
+        'inventory': INVENTORY.stats(),
         'config': {
             name: getattr(config, name)
             for name in dir(config) if not name.startswith('__')
@@ -293,8 +865,24 @@ def get_app_status():
     return status_info, 200, _make_headers()
 
 
-@exception_to_connexion_problem
 def health_check():
-    Senza(config.region).list()
+    """
+    Readiness check, answered from the last outcome of the background health
+    checker.
+    """
+    health = HEALTH.result()
+    if not health.healthy:
+        return connexion.problem(500,
+                                 title='Execution Error',
+                                 detail=health.error,
+                                 headers=_make_headers())
+    return Response(status=200,
+                    headers=_make_headers())
+
+
+def liveness_check():
+    """
+    Liveness check, only tells that the process is serving requests.
+    """
     return Response(status=200,
                     headers=_make_headers())
@@ -0,0 +1,103 @@
+"""
+boto3 clients shared by the threads of the process.
+"""
+
+import os
+from logging import getLogger
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple  # NOQA pylint: disable=unused-import
+
+import boto3
+from botocore.config import Config
+
+from ..configuration import config
+
+logger = getLogger('lizzy.app.aws')  # pylint: disable=invalid-name
+
+
+class ClientRegistry:
+    """
+    Keeps a boto3 client per service and region, so requests don't pay for
+    resolving credentials and opening TLS connections each time.
+
+    All clients come from a single session of the process, whose credentials
+    are resolved once and refreshed by botocore before they expire. Clients
+    are thread safe and keep up to ``max_pool_connections`` connections, which
+    should match the number of threads serving requests. Forked processes
+    create their own session and clients since connections can't be shared
+    with the parent.
+    """
+
+    def __init__(self, max_pool_connections: int=10,
+                 session_factory=boto3.session.Session):
+        self.max_pool_connections = max_pool_connections
+        self.session_factory = session_factory
+        self._session = None  # type: Optional[boto3.session.Session]
+        self._clients = {}  # type: Dict[Tuple[str, str], Any]
+        self._pid = None  # type: Optional[int]
+        self._lock = Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _reset(self):
+        self._session = self.session_factory()
+        # resolves the credentials now so clients share them
+        self._session.get_credentials()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    def client(self, service: str, region: str):
+        key = (service, region)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            client = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+            # creating clients from a session isn't thread safe
+            client = self._session.client(
+                service, region_name=region,
+                config=Config(max_pool_connections=self.max_pool_connections,
+                              retries={'mode': 'standard'}))
+            self._clients[key] = client
+            self.created += 1
+            logger.debug('Created AWS client.',
+                         extra={'service': service, 'region': region})
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._session = None
+            self._clients = {}
+            self._pid = None
+
+    @staticmethod
+    def _connections(client) -> Dict[str, int]:
+        """
+        Requests sent by the client and connections it opened for them, from
+        its urllib3 connection pools.
+        """
+        try:
+            pools = client._endpoint.http_session._manager.pools  # pylint: disable=protected-access
+            pools = [pools[key] for key in pools.keys()]
+        except AttributeError:
+            pools = []
+        requests = sum(getattr(pool, 'num_requests', 0) for pool in pools)
+        connections = sum(getattr(pool, 'num_connections', 0) for pool in pools)
+        return {'requests': requests,
+                'connections': connections,
+                'reused_connections': max(0, requests - connections)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients = dict(self._clients)
+            stats = {'created': self.created,
+                     'reused': self.reused,
+                     'max_pool_connections': self.max_pool_connections}
+        stats['clients'] = {'{}:{}'.format(service, region): self._connections(client)
+                            for (service, region), client in clients.items()}
+        return stats
+
+
+CLIENTS = ClientRegistry(config.aws_pool_connections)
@@ -0,0 +1,175 @@
+import math
+import re
+import time
+from logging import getLogger
+from threading import Lock
+from typing import Any, Callable, Dict, Optional  # NOQA pylint: disable=unused-import
+
+from ..configuration import config
+from ..exceptions import CircuitOpen
+from .executors import ExecutionResult
+
+logger = getLogger('lizzy.app.breaker')  # pylint: disable=invalid-name
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Failures meaning AWS couldn't be reached or couldn't answer, as opposed to
+# failures caused by the request itself (e.g. a stack that doesn't exist)
+UNAVAILABLE = re.compile(r'ServiceUnavailable|InternalFailure|InternalError|'
+                         r'EndpointConnectionError|ConnectTimeout|ReadTimeout|'
+                         r'Read timed out|Could not connect|'
+                         r'Connection (?:reset|refused|aborted)|'
+                         r'Max retries exceeded')
+
+
+def unavailable(result: ExecutionResult) -> bool:
+    """
+    Tells if a command failed because AWS was unavailable.
+    """
+    if result.returncode == 0:
+        return False
+    return bool(UNAVAILABLE.search(result.stdout) or
+                UNAVAILABLE.search(result.stderr or ''))
+
+
+class CircuitBreaker:  # pylint: disable=too-many-instance-attributes
+    """
+    Fails commands fast once ``failure_threshold`` consecutive commands failed
+    because AWS was unavailable, instead of letting each of them wait for
+    AWS timeouts.
+
+    After ``reset_timeout`` seconds the breaker lets a single command through
+    as a probe: it closes again if the probe works and stays open for another
+    ``reset_timeout`` otherwise. A ``failure_threshold`` of zero or less never
+    opens the breaker.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float,
+                 clock: Callable[[], float]=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None  # type: Optional[float]
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = Lock()
+
+    def _retry_after(self) -> int:
+        remaining = self.opened_at + self.reset_timeout - self.clock()
+        return max(1, math.ceil(remaining))
+
+    def acquire(self):
+        """
+        Lets a command run if the breaker allows it.
+
+        :raises CircuitOpen: when the command must not run
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if (self.state == OPEN and
+                    self.clock() >= self.opened_at + self.reset_timeout):
+                self.state = HALF_OPEN
+                logger.info('Circuit half open, probing.',
+                            extra={'circuit': self.name})
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpen(self.name, self._retry_after())
+
+    def success(self):
+        with self._lock:
+            self._probing = False
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info('Circuit closed.', extra={'circuit': self.name})
+                self.state = CLOSED
+                self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._probing = False
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or (
+                    self.state == CLOSED and
+                    0 < self.failure_threshold <= self.consecutive_failures):
+                logger.warning('Circuit opened.',
+                               extra={'circuit': self.name,
+                                      'consecutive_failures': self.consecutive_failures})
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self.trips += 1
+
+    def cancel(self):
+        """
+        Releases a command that ended without telling if AWS is available.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record(self, result: ExecutionResult):
+        if unavailable(result):
+            self.failure()
+        else:
+            self.success()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'state': self.state,
+                    'consecutive_failures': self.consecutive_failures,
+                    'trips': self.trips,
+                    'rejected': self.rejected,
+                    'retry_after': (self._retry_after() if self.state != CLOSED
+                                    else 0)}
+
+
+class CircuitBreakers:
+    """
+    Circuit breakers by region or, with the "command" scope, by region and
+    senza subcommand.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 scope: str='region',
+                 clock: Callable[[], float]=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.scope = scope
+        self.clock = clock
+        self._breakers = {}  # type: Dict[str, CircuitBreaker]
+        self._lock = Lock()
+
+    def get(self, region: str, subcommand: str) -> CircuitBreaker:
+        name = (region if self.scope == 'region'
+                else '{}:{}'.format(region, subcommand))
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(
+                    name, self.failure_threshold, self.reset_timeout,
+                    self.clock)
+            return breaker
+
+    def clear(self):
+        with self._lock:
+            self._breakers.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+# Breaker of commands that aren't bound to a region, it never opens
+UNGUARDED = CircuitBreaker('unguarded', 0, 0)
+
+BREAKERS = CircuitBreakers(config.circuit_breaker_failures,
+                           config.circuit_breaker_reset_timeout,
+                           config.circuit_breaker_scope)
@@ -0,0 +1,164 @@
+"""
+Stack reads straight from CloudFormation, without running senza.
+"""
+
+import calendar
+import re
+from logging import getLogger
+from typing import Dict, Iterable, List, Optional, Tuple  # NOQA pylint: disable=unused-import
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from ..exceptions import ExecutionError, Throttled
+from .aws import CLIENTS
+from .breaker import BREAKERS
+from .throttling import BUDGET, THROTTLED
+
+logger = getLogger('lizzy.app.cloudformation')  # pylint: disable=invalid-name
+
+# Stacks listed by ``senza list``, i.e. all but the deleted ones and the ones
+# senza doesn't know about
+ACTIVE_STATUSES = ['CREATE_IN_PROGRESS', 'CREATE_FAILED', 'CREATE_COMPLETE',
+                   'ROLLBACK_IN_PROGRESS', 'ROLLBACK_FAILED',
+                   'ROLLBACK_COMPLETE', 'DELETE_IN_PROGRESS', 'DELETE_FAILED',
+                   'UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+                   'UPDATE_COMPLETE', 'UPDATE_ROLLBACK_IN_PROGRESS',
+                   'UPDATE_ROLLBACK_FAILED',
+                   'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
+                   'UPDATE_ROLLBACK_COMPLETE']
+
+# References without regular expression characters name a single stack
+LITERAL = re.compile(r'^[\w-]+$')
+
+StackReference = Tuple[str, Optional[str]]
+
+
+def stack_references(refs: Iterable[str]) -> List[StackReference]:
+    """
+    Pairs stack names and versions the way ``senza list`` does: a name is
+    followed by its version, and further versions starting with "v" are
+    versions of the same name.
+    """
+    refs = list(refs)
+    refs.reverse()
+    references = []  # type: List[StackReference]
+    last_name = None  # type: Optional[str]
+    while refs:
+        ref = refs.pop()
+        if last_name is not None and re.match(r'v[0-9][a-zA-Z0-9-]*$', ref):
+            references.append((last_name, ref))
+            continue
+        version = refs.pop() if refs else None
+        references.append((ref, version))
+        last_name = ref
+    return references
+
+
+def split_stack_name(cf_stack_name: str) -> Tuple[str, str]:
+    name, _, version = cf_stack_name.rpartition('-')
+    if not name:
+        return version, ''
+    return name, version
+
+
+def matches_any(cf_stack_name: str, references: List[StackReference]) -> bool:
+    """
+    Checks if the stack matches any of the references, whose names and
+    versions are regular expressions.
+    """
+    name, version = split_stack_name(cf_stack_name)
+    return any(re.match(ref_name + '$', name) and
+               (not ref_version or re.match(ref_version + '$', version))
+               for ref_name, ref_version in references)
+
+
+def to_stack_dict(stack: Dict) -> Dict:
+    """
+    Converts a stack summary, or a stack description, to the fields of
+    ``senza list -o json``.
+    """
+    name, version = split_stack_name(stack['StackName'])
+    return {'stack_name': name,
+            'version': version,
+            'status': stack['StackStatus'],
+            'creation_time': calendar.timegm(stack['CreationTime'].utctimetuple()),
+            'description': stack.get('TemplateDescription',
+                                     stack.get('Description'))}
+
+
+class CloudFormation:
+    """
+    Reads stacks with the CloudFormation API, returning the same stack dicts
+    as :meth:`lizzy.apps.senza.Senza.list`.
+
+    Reads are guarded by the circuit breaker and take from the AWS budget of
+    the region like senza commands do.
+    """
+
+    def __init__(self, region: str, client=None):
+        self.region = region
+        self.client = client or CLIENTS.client('cloudformation', region)
+
+    def list(self, *stack_ref: str) -> List[Dict]:
+        """
+        Lists the stacks matching the references, all of them without any.
+        A single name and version without regular expression characters is
+        looked up directly instead of listing every stack.
+        """
+        references = stack_references(stack_ref)
+        if len(references) == 1:
+            name, version = references[0]
+            if version and LITERAL.match(name) and LITERAL.match(version):
+                return self._call(self._describe, '{}-{}'.format(name, version))
+        return self._call(self._list, references)
+
+    def _list(self, references: List[StackReference]) -> List[Dict]:
+        paginator = self.client.get_paginator('list_stacks')
+        stacks = [to_stack_dict(summary)
+                  for page in paginator.paginate(StackStatusFilter=ACTIVE_STATUSES)
+                  for summary in page['StackSummaries']
+                  if not references or matches_any(summary['StackName'],
+                                                   references)]
+        stacks.sort(key=lambda stack: (stack['stack_name'], stack['version']))
+        return stacks
+
+    def _describe(self, cf_stack_name: str) -> List[Dict]:
+        try:
+            response = self.client.describe_stacks(StackName=cf_stack_name)
+        except ClientError as error:
+            if 'does not exist' in str(error):
+                return []
+            raise
+        return [to_stack_dict(stack) for stack in response['Stacks']
+                if stack['StackStatus'] in ACTIVE_STATUSES]
+
+    def _call(self, read, *args):
+        """
+        :raises CircuitOpen: when AWS is known to be unavailable
+        :raises Throttled: when AWS throttled the read or the AWS budget of
+                           the region is exhausted
+        :raises ExecutionError: when the read failed
+        """
+        breaker = BREAKERS.get(self.region, 'list')
+        breaker.acquire()
+        try:
+            BUDGET.take(self.region)
+            stacks = read(*args)
+        except ClientError as error:
+            status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            if status >= 500:
+                breaker.failure()
+            else:
+                breaker.success()
+            if THROTTLED.search(str(error)):
+                raise Throttled(self.region, 1)
+            raise ExecutionError(error.response.get('Error', {}).get('Code', 'ClientError'),
+                                 str(error))
+        except BotoCoreError as error:
+            breaker.failure()
+            raise ExecutionError(type(error).__name__, str(error))
+        except BaseException:
+            breaker.cancel()
+            raise
+        breaker.success()
+        return stacks
@@ -0,0 +1,76 @@
+import functools
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable  # NOQA pylint: disable=unused-import
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.done = Event()
+        self.result = None  # type: Any
+        self.error = None  # type: Exception
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: while a call is running,
+    other callers with the same key wait for it and receive its result (or
+    its exception) instead of running it again. Results are never reused
+    after the call finishes.
+    """
+
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self._calls = {}  # type: Dict[Hashable, _Call]
+        self._lock = Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as exception:
+            call.error = exception
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'executions': self.executions,
+                    'coalesced': self.coalesced,
+                    'in_flight': len(self._calls)}
+
+
+def coalesced(flight: SingleFlight):
+    """
+    Decorates an :class:`~lizzy.apps.common.Application` method so concurrent
+    calls with the same arguments on the same application and parameters
+    (e.g. region) share a single execution.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = (self.application, tuple(self.extra_parameters),
+                   method.__name__, args, tuple(sorted(kwargs.items())))
+            return flight.do(key, lambda: method(self, *args, **kwargs))
+        return wrapper
+
+    return decorator
@@ -1,42 +1,177 @@
 import json
+import math
+import time
 from logging import getLogger
-from subprocess import PIPE, STDOUT, Popen
-from typing import Iterable, Optional
+from typing import Iterable, List, Optional
 
-from .. import sentry_client
-from ..exceptions import ExecutionError
+from .. import metrics, sentry_client
+from ..configuration import config
+from ..exceptions import ExecutionError, ExecutionTimeout, Throttled
+from .breaker import BREAKERS, UNGUARDED, CircuitBreaker
+from .executors import (ExecutionResult, Executor, OutputCallback,
+                        get_executor)
+from .history import HISTORY, Execution
+from .limits import MUTATION_LANE, ConcurrencyLimit
+from .output import OUTPUTS, OutputCapture, summarize
+from .throttling import BUDGET, MAX_BACKOFF, backoff, throttled
 
 
 class Application:  # pylint: disable=too-few-public-methods
     def __init__(self, application: str,
-                 extra_parameters: Optional[Iterable[str]]=None):
+                 extra_parameters: Optional[Iterable[str]]=None,
+                 executor: Optional[Executor]=None,
+                 limit: Optional[ConcurrencyLimit]=None,
+                 region: Optional[str]=None):
+        """
+        :param region: AWS region the commands call, if any. Its circuit
+                       breaker and AWS budget apply to the commands.
+        """
         self.logger = getLogger('lizzy.app.{}'.format(application))
         self.application = application
         self.extra_parameters = extra_parameters or []  # type: Iterable[str]
+        self.executor = executor or get_executor(config.execution_backend)
+        # commands not known to be fast run in the slow lane
+        self.limit = limit or MUTATION_LANE
+        self.region = region
 
-    def _execute(self, subcommand: str, *args: Iterable[str],
-                 expect_json: bool=False,
-                 accept_empty: bool=True):
+    def _breaker(self, subcommand: str) -> CircuitBreaker:
+        if self.region is None:
+            return UNGUARDED
+        return BREAKERS.get(self.region, subcommand)
+
+    def _take_budget(self, breaker: CircuitBreaker):
+        if self.region is None:
+            return
+        try:
+            BUDGET.take(self.region)
+        except BaseException:
+            breaker.cancel()
+            raise
+
+    def _command(self, subcommand: str, *args: Iterable[str],
+                 expect_json: bool=False) -> List[str]:
         command = [self.application, subcommand]
         command.extend(self.extra_parameters)
         if expect_json:
             command += ['-o', 'json']
-            stderr_to = PIPE
-        else:
-            stderr_to = STDOUT
         command += args
         command = [arg for arg in command if arg is not None]
         self.logger.debug('Executing %s.', self.application,
                           extra={'command': ' '.join(command)})
-        process = Popen(command, stdout=PIPE, stderr=stderr_to)
-        stdout, stderr = process.communicate()
-        output = stdout.decode()
+        return command
+
+    def _execute(self, subcommand: str, *args: Iterable[str],
+                 expect_json: bool=False,
+                 accept_empty: bool=True,
+                 lane: Optional[ConcurrencyLimit]=None,
+                 retry: bool=True,
+                 on_output: Optional[OutputCallback]=None):
+        """
+        :param lane: Execution lane of the command, the application limit by
+                     default
+        :param retry: Retries the command when AWS throttles it, only for
+                      commands that are safe to repeat
+        :param on_output: Called with each output line of the command as
+                          soon as it is written
+        :raises CircuitOpen: when AWS is known to be unavailable
+        :raises Throttled: when AWS keeps throttling the command or the AWS
+                           budget of the region is exhausted
+        """
+        command = self._command(subcommand, *args, expect_json=expect_json)
+        lane = lane or self.limit
+        execution = Execution(self.application, subcommand, args, self.region)
+        attempt = 0
+        try:
+            while True:
+                breaker = self._breaker(subcommand)
+                breaker.acquire()
+                self._take_budget(breaker)
+                capture = OutputCapture(OUTPUTS, keep_all=expect_json,
+                                        on_output=on_output)
+                try:
+                    with capture, lane.slot(), metrics.command_in_flight(subcommand):
+                        result = self.executor.execute(command,
+                                                       merge_stderr=not expect_json,
+                                                       on_output=self._relay(capture))
+                except ExecutionTimeout:
+                    execution.attempted()
+                    breaker.failure()
+                    raise
+                except BaseException:
+                    breaker.cancel()
+                    raise
+                result = self._captured(result, capture, execution)
+                breaker.record(result)
+                delay = self._retry_delay(command, result, attempt, retry)
+                if delay is None:
+                    break
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            execution.finish()
+            self._record(execution)
+            HISTORY.record(execution)
+        return self._handle_result(command, result, expect_json=expect_json,
+                                   accept_empty=accept_empty)
+
+    @staticmethod
+    def _record(execution: Execution):
+        if execution.attempts:
+            metrics.observe_command(execution.subcommand, execution.region,
+                                    execution.duration)
+
+    @staticmethod
+    def _relay(capture: OutputCapture) -> Optional[OutputCallback]:
+        """
+        Callback the executor passes the output lines to, if any. Unless it
+        is streamed, JSON output is read at once since it is needed whole.
+        """
+        if capture.output.keep_all and capture.on_output is None:
+            return None
+        return capture.write
+
+    @staticmethod
+    def _captured(result: ExecutionResult, capture: OutputCapture,
+                  execution: Execution) -> ExecutionResult:
+        """
+        Replaces the output of the result with the captured one, recording
+        the attempt in the execution.
+        """
+        if result.stdout:
+            # executors that don't relay the output lines return them
+            capture.write(result.stdout)
+        execution.attempted(result, capture.output.size)
+        return result._replace(stdout=capture.getvalue())
+
+    def _retry_delay(self, command: List[str], result: ExecutionResult,
+                     attempt: int, retry: bool) -> Optional[float]:
+        """
+        Seconds to wait before retrying a throttled command, None when the
+        command wasn't throttled.
+
+        :raises Throttled: when the throttled command can't be retried
+        """
+        if not throttled(result):
+            return None
+        self.logger.warning('Command throttled by AWS.',
+                            extra={'command': ' '.join(command),
+                                   'attempt': attempt + 1,
+                                   'command.output': result.stdout.strip()})
+        if not retry or attempt >= config.throttling_retries:
+            ceiling = min(MAX_BACKOFF, config.throttling_backoff * 2 ** attempt)
+            raise Throttled(self.region or self.application,
+                            max(1, math.ceil(ceiling)))
+        return backoff(attempt, config.throttling_backoff)
+
+    def _handle_result(self, command: List[str], result: ExecutionResult,
+                       expect_json: bool, accept_empty: bool):
+        output = result.stdout
         sentry_client.capture_breadcrumb(data={
             'command': ' '.join(command),
-            'command_return_code': process.returncode,
-            'output': output
+            'command_return_code': result.returncode,
+            'output': summarize(output)
         })
-        if process.returncode == 0:
+        if result.returncode == 0:
             if expect_json and (output or not accept_empty):
                 try:
                     return json.loads(output)
@@ -48,8 +183,8 @@ class Application:  # pylint: disable=too-few-public-methods
                 return output
         else:
             if expect_json:
-                output += '\n' + stderr.decode()
+                output = summarize(output + '\n' + result.stderr)
             self.logger.error("Error executing command.",
                               extra={'command': ' '.join(command),
                                      'command.output': output.strip()})
-            raise ExecutionError(process.returncode, output)
+            raise ExecutionError(result.returncode, output)
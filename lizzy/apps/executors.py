@@ -0,0 +1,598 @@
+"""
+Backends used by :class:`lizzy.apps.common.Application` to run commands.
+
+The default backend spawns a new process for every command, the in-process
+backend runs the command line tool entry point inside the lizzy process,
+the pool backend keeps long-lived worker processes that run the entry point
+for each command they receive and the asyncio backend drives child processes
+from an event loop, killing them when they miss their deadline.
+"""
+
+import asyncio
+import io
+import multiprocessing
+import os
+import queue
+import resource
+import signal
+import sys
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from multiprocessing import forkserver
+from logging import getLogger
+from subprocess import DEVNULL, PIPE, STDOUT, Popen
+from threading import Lock, Thread
+from typing import (Any, Awaitable, Callable, Dict,  # NOQA pylint: disable=unused-import
+                    Iterable, List, NamedTuple, Optional, Tuple)
+
+import pkg_resources
+
+from ..configuration import config
+from ..exceptions import ExecutionTimeout
+
+logger = getLogger('lizzy.apps.executors')  # pylint: disable=invalid-name
+
+
+# Receives output lines of a command, with their line ending, as they are
+# written
+OutputCallback = Callable[[str], None]
+
+# Tells the thread of a worker pool to exit
+_STOP = object()
+
+# Bytes of command output the asyncio backend reads at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ExecutionResult(NamedTuple):
+    """Return code and decoded output of an executed command."""
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+class Executor:
+    """Base class for command execution backends."""
+
+    name = None  # type: str
+
+    def execute(self, command: List[str], merge_stderr: bool,
+                on_output: Optional[OutputCallback]=None) -> ExecutionResult:
+        """
+        Runs the command and returns its result.
+
+        :param command: Command line with the executable name as first item
+        :param merge_stderr: Whether stderr should be redirected to stdout
+        :param on_output: Called with each line the command writes to stdout
+                          as soon as it is written, the lines are then not
+                          kept in the result
+        """
+        raise NotImplementedError
+
+    def start(self):
+        """
+        Prepares the backend in the current process, e.g. its worker
+        processes, before the first command.
+        """
+
+
+class SubprocessExecutor(Executor):
+    """Runs every command in a new process."""
+
+    name = 'subprocess'
+
+    def execute(self, command: List[str], merge_stderr: bool,
+                on_output: Optional[OutputCallback]=None) -> ExecutionResult:
+        process = Popen(command, stdout=PIPE,
+                        stderr=STDOUT if merge_stderr else PIPE)
+        if on_output is None:
+            stdout, stderr = process.communicate()
+        else:
+            stdout, stderr = self._relay(process, on_output)
+        return ExecutionResult(process.returncode, stdout.decode(),
+                               (stderr or b'').decode())
+
+    @staticmethod
+    def _relay(process: Popen,
+               on_output: OutputCallback) -> Tuple[bytes, bytes]:
+        """
+        Reads the output of the process line by line, passing each line to
+        ``on_output`` instead of keeping it.
+        """
+        stderr = []  # type: List[bytes]
+        # stderr is read concurrently so a full pipe can't block the process
+        reader = None
+        if process.stderr is not None:
+            reader = Thread(target=lambda: stderr.append(process.stderr.read()),
+                            daemon=True)
+            reader.start()
+        try:
+            for line in iter(process.stdout.readline, b''):
+                on_output(line.decode(errors='replace'))
+        except BaseException:
+            # e.g. the client of a streamed operation went away
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            process.stdout.close()
+        if reader is not None:
+            reader.join()
+            process.stderr.close()
+        process.wait()
+        return b'', b''.join(stderr)
+
+
+class LineWriter(io.TextIOBase):
+    """
+    Text stream passing each complete line written to it to ``on_output``.
+    Errors of ``on_output`` are kept in ``error``, since the command writing
+    the line may catch them.
+    """
+
+    def __init__(self, on_output: OutputCallback):
+        super().__init__()
+        self.on_output = on_output
+        self.error = None  # type: Optional[BaseException]
+        self._line = ''
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        lines = (self._line + text).split('\n')
+        self._line = lines.pop()
+        for line in lines:
+            self._relay(line + '\n')
+        return len(text)
+
+    def _relay(self, line: str):
+        if self.error is not None:
+            raise self.error
+        try:
+            self.on_output(line)
+        except BaseException as error:
+            self.error = error
+            raise
+
+    def getvalue(self) -> str:
+        return ''
+
+    def finish(self):
+        """Passes the last line on even if it doesn't end with a newline."""
+        if self._line:
+            self._relay(self._line)
+            self._line = ''
+
+
+class InProcessExecutor(Executor):
+    """
+    Runs the console script entry point of the command inside the current
+    process, capturing its output and exit code.
+
+    The standard streams and ``sys.argv`` are process wide, so only one
+    command can run at a time. A failing ``on_output`` callback stops the
+    command the next time it writes a line.
+    """
+
+    name = 'inprocess'
+
+    def __init__(self):
+        self.lock = Lock()
+        self.entry_points = {}  # type: Dict[str, Callable]
+
+    def load_entry_point(self, application: str) -> Callable:
+        if application not in self.entry_points:
+            entry_points = list(pkg_resources.iter_entry_points(
+                'console_scripts', application))
+            if not entry_points:
+                raise ValueError('No entry point for {}'.format(application))
+            self.entry_points[application] = entry_points[0].load()
+        return self.entry_points[application]
+
+    def execute(self, command: List[str], merge_stderr: bool,
+                on_output: Optional[OutputCallback]=None) -> ExecutionResult:
+        main = self.load_entry_point(command[0])
+        stdout = io.StringIO() if on_output is None else LineWriter(on_output)
+        stderr = stdout if merge_stderr else io.StringIO()
+        with self.lock:
+            original_argv, original_stdin = sys.argv, sys.stdin
+            sys.argv, sys.stdin = list(command), io.StringIO()
+            try:
+                with redirect_stdout(stdout), redirect_stderr(stderr):
+                    returncode = self.run(main)
+            finally:
+                sys.argv, sys.stdin = original_argv, original_stdin
+        if isinstance(stdout, LineWriter):
+            if stdout.error is not None:
+                raise stdout.error
+            stdout.finish()
+        return ExecutionResult(returncode, stdout.getvalue(),
+                               '' if merge_stderr else stderr.getvalue())
+
+    @staticmethod
+    def run(main: Callable) -> int:
+        """
+        Calls the entry point translating its exit the same way the python
+        interpreter would.
+        """
+        try:
+            main()
+        except SystemExit as exit_request:
+            code = exit_request.code
+            if code is None:
+                return 0
+            elif isinstance(code, int):
+                return code
+            else:
+                print(code, file=sys.stderr)
+                return 1
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            return 1
+        return 0
+
+
+def _max_rss_megabytes() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_loop(connection, entry_points: Dict[str, Callable]):
+    """
+    Main loop of pool worker processes, running commands with the given
+    entry points or the console scripts of the applications. Receives ``(command, merge_stderr,
+    stream)`` requests and answers with ``('result', result, memory)``, the
+    execution result and the peak memory used by the worker, until it
+    receives ``None`` or the pipe is closed. When ``stream`` is set, the
+    output lines are sent as ``('output', line)`` while the command runs.
+    """
+    executor = InProcessExecutor()
+    executor.entry_points.update(entry_points)
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        command, merge_stderr, stream = request
+        on_output = ((lambda line: connection.send(('output', line)))
+                     if stream else None)
+        try:
+            result = executor.execute(command, merge_stderr, on_output)
+        except Exception as exception:  # pylint: disable=broad-except
+            result = ExecutionResult(1, '', str(exception))
+        connection.send(('result', tuple(result), _max_rss_megabytes()))
+    connection.close()
+
+
+class PoolWorker:
+    """Handle for a single worker process of the pool."""
+
+    def __init__(self, context, entry_points: Dict[str, Callable]):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_loop,
+                                       args=(child_connection, entry_points),
+                                       name='lizzy-executor',
+                                       daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.commands = 0
+        self.memory = 0.0
+
+    def execute(self, command: List[str], merge_stderr: bool,
+                on_output: Optional[OutputCallback]=None) -> ExecutionResult:
+        self.connection.send((command, merge_stderr, on_output is not None))
+        while True:
+            message = self.connection.recv()
+            if message[0] == 'output':
+                on_output(message[1])
+            else:
+                break
+        _, result, self.memory = message
+        self.commands += 1
+        return ExecutionResult(*result)
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.connection.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+class WorkerPoolExecutor(Executor):
+    """
+    Runs commands in a pool of ``size`` worker processes that already
+    imported the command line tools, so each command only pays for its own
+    work. Commands wait for an idle worker.
+
+    The workers are forked by a fork server, a single threaded process
+    started by :meth:`start` that imported the modules of the tools once.
+    Workers don't copy locks held by threads of lizzy, or its sockets and
+    other file descriptors, so they can't deadlock or keep the port of a
+    killed lizzy process bound. A thread of the pool asks for the workers
+    when the pool starts, and for a replacement when a worker exits, runs
+    ``max_commands`` commands or its peak memory usage goes over
+    ``max_memory`` megabytes.
+    """
+
+    name = 'pool'
+
+    def __init__(self, size: Optional[int]=None,
+                 max_commands: Optional[int]=None,
+                 max_memory: Optional[int]=None,
+                 preload: Iterable[str]=('senza',)):
+        """
+        :param preload: Applications whose console script modules the fork
+                        server imports
+        """
+        self.size = size or config.execution_pool_size
+        self.max_commands = max_commands or config.execution_pool_max_commands
+        self.max_memory = max_memory or config.execution_pool_max_memory
+        self.context = multiprocessing.get_context('forkserver')
+        self.preload = [entry_point.module_name
+                        for application in preload
+                        for entry_point in pkg_resources.iter_entry_points(
+                            'console_scripts', application)]
+        # entry points passed to the workers, by application name, e.g. of
+        # applications without console scripts; they must be picklable
+        self.entry_points = {}  # type: Dict[str, Callable]
+        self.idle_workers = queue.LifoQueue()  # type: queue.LifoQueue
+        # one item for each worker the pool thread has to start
+        self._forks = queue.Queue()  # type: queue.Queue
+        self._thread = None  # type: Optional[Thread]
+        self._pid = None  # type: Optional[int]
+        self._lock = Lock()
+
+    def start(self):
+        """
+        Starts the fork server and the thread starting the workers of the
+        current process. It should be called before lizzy starts any other
+        thread.
+        """
+        with self._lock:
+            # threads and workers don't survive forks, e.g. of uwsgi workers
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.context.set_forkserver_preload([__name__] + self.preload)
+            forkserver.ensure_running()
+            self.idle_workers = queue.LifoQueue()
+            self._forks = queue.Queue()
+            for _ in range(self.size):
+                self._forks.put(None)
+            self._thread = Thread(target=self._fork_workers,
+                                  args=(self._forks,), name='lizzy-pool',
+                                  daemon=True)
+            self._thread.start()
+
+    def _fork_workers(self, forks: queue.Queue):
+        while True:
+            if forks.get() is _STOP:
+                return
+            try:
+                worker = PoolWorker(self.context, self.entry_points)
+            except OSError:
+                logger.exception('Could not start executor worker.')
+                forks.put(None)
+                time.sleep(1)
+                continue
+            logger.debug('Started executor worker.',
+                         extra={'pid': worker.process.pid})
+            self.idle_workers.put(worker)
+
+    def _replace(self, worker: PoolWorker):
+        worker.stop()
+        self._forks.put(None)
+
+    def execute(self, command: List[str], merge_stderr: bool,
+                on_output: Optional[OutputCallback]=None) -> ExecutionResult:
+        self.start()
+        worker = self.idle_workers.get()
+        try:
+            result = worker.execute(command, merge_stderr, on_output)
+        except (EOFError, OSError):
+            self._replace(worker)
+            logger.error('Executor worker exited unexpectedly.',
+                         extra={'pid': worker.process.pid,
+                                'exit_code': worker.process.exitcode})
+            return ExecutionResult(worker.process.exitcode or -1,
+                                   'Executor worker exited unexpectedly',
+                                   '')
+        except BaseException:
+            # e.g. the output callback failed, the command must not outlive it
+            worker.process.terminate()
+            self._replace(worker)
+            raise
+        if (worker.commands >= self.max_commands or
+                worker.memory >= self.max_memory):
+            logger.debug('Recycling executor worker.',
+                         extra={'pid': worker.process.pid,
+                                'commands': worker.commands,
+                                'memory': worker.memory})
+            self._replace(worker)
+        else:
+            self.idle_workers.put(worker)
+        return result
+
+    def close(self):
+        """Stops the pool thread and the idle workers."""
+        self._forks.put(_STOP)
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        while True:
+            try:
+                self.idle_workers.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+async def _read_pipe(pipe,
+                     on_output: Optional[OutputCallback]=None) -> bytes:
+    reader = asyncio.StreamReader()
+    loop = asyncio.get_event_loop()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    try:
+        if on_output is None:
+            return await reader.read()
+        # lines are split here, readline() fails on lines over the buffer limit
+        pending = []  # type: List[bytes]
+        while True:
+            chunk = await reader.read(READ_CHUNK_SIZE)
+            if not chunk:
+                if pending:
+                    on_output(b''.join(pending).decode(errors='replace'))
+                return b''
+            *lines, rest = chunk.split(b'\n')
+            for line in lines:
+                pending.append(line + b'\n')
+                on_output(b''.join(pending).decode(errors='replace'))
+                pending = []
+            if rest:
+                pending.append(rest)
+    finally:
+        transport.close()
+
+
+class AsyncioExecutor(Executor):
+    """
+    Runs every command in a new process group driven by an asyncio event
+    loop. Commands that don't finish within ``timeout`` seconds, or whose
+    coroutine is cancelled, are killed together with their children.
+
+    :meth:`run` can be awaited to run several commands concurrently, while
+    :meth:`execute` runs it in an event loop thread owned by the executor so
+    the backend can be used by synchronous code.
+    """
+
+    name = 'asyncio'
+
+    def __init__(self, timeout: Optional[float]=None):
+        self.timeout = config.execution_timeout if timeout is None else timeout
+        self._loop = None  # type: asyncio.AbstractEventLoop
+        self._pid = None  # type: Optional[int]
+        self._lock = Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Event loop running in a background thread of the current process.
+        """
+        with self._lock:
+            # threads don't survive forks, e.g. of uwsgi workers
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                Thread(target=self._loop.run_forever, name='lizzy-asyncio',
+                       daemon=True).start()
+            return self._loop
+
+    async def run(self, command: List[str], merge_stderr: bool,
+                  timeout: Optional[float]=None,
+                  on_output: Optional[OutputCallback]=None) -> ExecutionResult:
+        """
+        Runs the command and returns its result.
+
+        :param timeout: Seconds the command can run, the executor timeout by
+                        default and no limit if zero
+        :param on_output: Called with each line the command writes to stdout
+        :raises ExecutionTimeout: when the command doesn't finish in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        # child watchers only work in the main thread before python 3.8, so
+        # the event loop reads the pipes of a regular process instead
+        process = Popen(command, stdin=DEVNULL, stdout=PIPE,
+                        stderr=STDOUT if merge_stderr else PIPE,
+                        start_new_session=True)
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                self._communicate(process, on_output), timeout or None)
+        except asyncio.TimeoutError:
+            self._kill(process)
+            logger.error('Command timed out.',
+                         extra={'command': ' '.join(command),
+                                'timeout': timeout})
+            raise ExecutionTimeout(timeout)
+        except asyncio.CancelledError:
+            self._kill(process)
+            logger.info('Command cancelled.',
+                        extra={'command': ' '.join(command)})
+            raise
+        except BaseException:
+            # e.g. an output callback failed, the command must not outlive it
+            self._kill(process)
+            raise
+        return ExecutionResult(process.returncode, stdout.decode(),
+                               stderr.decode())
+
+    @staticmethod
+    async def _communicate(process: Popen,
+                           on_output: Optional[OutputCallback]=None) -> Tuple[bytes, bytes]:
+        readers = [_read_pipe(process.stdout, on_output)]
+        if process.stderr:
+            readers.append(_read_pipe(process.stderr))
+        outputs = await asyncio.gather(*readers)
+        while process.poll() is None:
+            await asyncio.sleep(0.01)
+        return outputs[0], (outputs[1] if len(outputs) > 1 else b'')
+
+    @staticmethod
+    def _kill(process: Popen):
+        """Kills the process group of the command."""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+    def wait(self, coroutine: Awaitable) -> Any:
+        """
+        Runs the coroutine in the event loop of the executor and waits for
+        its result. The coroutine is cancelled, killing its commands, if the
+        waiting thread is interrupted.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def execute(self, command: List[str], merge_stderr: bool,
+                on_output: Optional[OutputCallback]=None) -> ExecutionResult:
+        return self.wait(self.run(command, merge_stderr, on_output=on_output))
+
+
+EXECUTORS = {executor.name: executor
+             for executor in (SubprocessExecutor,
+                              InProcessExecutor,
+                              WorkerPoolExecutor,
+                              AsyncioExecutor)}  # type: Dict[str, type]
+
+_instances = {}  # type: Dict[str, Executor]
+_instances_lock = Lock()
+
+
+def get_executor(name: str) -> Executor:
+    """
+    Returns the shared executor instance for the backend name.
+
+    :raises ValueError: when the backend is unknown
+    """
+    with _instances_lock:
+        if name not in _instances:
+            try:
+                executor_class = EXECUTORS[name]
+            except KeyError:
+                raise ValueError('Unknown execution backend: {}'.format(name))
+            logger.debug('Using %s execution backend.', name)
+            _instances[name] = executor_class()
+        return _instances[name]
@@ -0,0 +1,221 @@
+"""
+History of the executed commands, for timing analytics.
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing, contextmanager
+from itertools import groupby
+from logging import getLogger
+from threading import local
+from typing import (Any, Dict, Iterable, Iterator,  # NOQA pylint: disable=unused-import
+                    List, Optional)
+
+from ..configuration import config
+from .executors import ExecutionResult
+
+logger = getLogger('lizzy.app.history')  # pylint: disable=invalid-name
+
+PERCENTILES = (50, 90, 95, 99)
+
+_context = local()  # pylint: disable=invalid-name
+
+
+@contextmanager
+def acting_user(user: Optional[str]):
+    """
+    Attributes the commands executed by the current thread to the user.
+    """
+    previous = current_user()
+    _context.user = user
+    try:
+        yield
+    finally:
+        _context.user = previous
+
+
+def current_user() -> Optional[str]:
+    return getattr(_context, 'user', None)
+
+
+def percentile(durations: List[float], rank: float) -> float:
+    """
+    Nearest-rank percentile of the sorted durations.
+    """
+    index = max(0, math.ceil(rank / 100 * len(durations)) - 1)
+    return durations[index]
+
+
+class Execution:  # pylint: disable=too-many-instance-attributes
+    """
+    A command being executed, including the retries of throttled attempts.
+    """
+
+    def __init__(self, application: str, subcommand: str,
+                 args: Iterable[str], region: Optional[str],
+                 user: Optional[str]=None):
+        self.application = application
+        self.subcommand = subcommand
+        self.args_hash = hashlib.sha256('\0'.join(
+            arg for arg in args if arg is not None).encode()).hexdigest()[:16]
+        self.region = region
+        self.user = user if user is not None else current_user()
+        self.started_at = time.time()
+        self.duration = None  # type: Optional[float]
+        self.returncode = None  # type: Optional[int]
+        self.output_size = 0
+        self.attempts = 0
+        self._started = time.monotonic()
+
+    def attempted(self, result: Optional[ExecutionResult]=None,
+                  output_size: int=0):
+        """
+        Records the outcome of an attempt that ran the command, without a
+        result when it timed out.
+        """
+        self.attempts += 1
+        self.returncode = result.returncode if result is not None else None
+        self.output_size = output_size
+
+    def finish(self):
+        self.duration = time.monotonic() - self._started
+
+
+class ExecutionHistory:
+    """
+    Keeps the ``size`` most recent executions in a SQLite database on local
+    disk, shared by the processes of the host. A ``size`` of zero or less
+    disables the history.
+
+    Executions that didn't run the command, e.g. rejected by an open circuit
+    breaker, aren't recorded. Commands that timed out have no return code.
+    Executions are recorded while the request that ran them waits, so they
+    are dropped when the database stays locked for ``record_timeout``
+    seconds. Reads don't lock out the writers.
+    """
+
+    columns = ('started_at', 'application', 'subcommand', 'region',
+               'args_hash', 'duration', 'returncode', 'output_size',
+               'attempts', 'user')
+
+    def __init__(self, path: str, size: int, timeout: float=30,
+                 record_timeout: float=0.5):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.record_timeout = record_timeout
+        self._created = None  # type: Optional[str]
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    @contextmanager
+    def _transaction(self, write: bool=True,
+                     timeout: Optional[float]=None) -> Iterator[sqlite3.Connection]:
+        """
+        Runs a transaction, holding the database write lock unless it only
+        reads.
+
+        :param timeout: Seconds to wait for the lock, ``timeout`` by default
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with closing(sqlite3.connect(self.path, timeout=timeout,
+                                     isolation_level=None)) as connection:
+            if self._created != self.path:
+                self._create(connection)
+            connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def _create(self, connection: sqlite3.Connection):
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS executions ('
+                           'id INTEGER PRIMARY KEY, '
+                           'started_at REAL NOT NULL, '
+                           'application TEXT NOT NULL, '
+                           'subcommand TEXT NOT NULL, '
+                           'region TEXT, '
+                           'args_hash TEXT NOT NULL, '
+                           'duration REAL NOT NULL, '
+                           'returncode INTEGER, '
+                           'output_size INTEGER NOT NULL, '
+                           'attempts INTEGER NOT NULL, '
+                           'user TEXT)')
+        connection.execute('CREATE INDEX IF NOT EXISTS executions_started_at '
+                           'ON executions (started_at)')
+        self._created = self.path
+
+    def record(self, execution: Execution):
+        """
+        Stores the finished execution, forgetting the oldest ones over the
+        history size. Failures are logged, they never fail the command.
+        """
+        if not self.enabled or not execution.attempts:
+            return
+        if execution.duration is None:
+            execution.finish()
+        row = tuple(getattr(execution, column) for column in self.columns)
+        try:
+            with self._transaction(timeout=self.record_timeout) as connection:
+                cursor = connection.execute(
+                    'INSERT INTO executions ({}) VALUES ({})'.format(
+                        ', '.join(self.columns),
+                        ', '.join('?' * len(self.columns))), row)
+                connection.execute('DELETE FROM executions WHERE id <= ?',
+                                   (cursor.lastrowid - self.size,))
+        except sqlite3.Error:
+            logger.exception('Failed to record command execution.',
+                             extra={'path': self.path})
+
+    def timings(self, window: float, subcommand: Optional[str]=None,
+                region: Optional[str]=None) -> List[Dict[str, Any]]:
+        """
+        Duration percentiles, in seconds, of the executions of the last
+        ``window`` seconds by subcommand and region.
+        """
+        if not self.enabled:
+            return []
+        where = ['started_at >= ?']
+        parameters = [time.time() - window]  # type: List[Any]
+        if subcommand is not None:
+            where.append('subcommand = ?')
+            parameters.append(subcommand)
+        if region is not None:
+            where.append('region = ?')
+            parameters.append(region)
+        query = ('SELECT subcommand, region, duration, returncode '
+                 'FROM executions WHERE {} '
+                 'ORDER BY subcommand, region, duration'.format(' AND '.join(where)))
+        with self._transaction(write=False) as connection:
+            rows = connection.execute(query, parameters).fetchall()
+
+        timings = []
+        for (group_subcommand, group_region), group in groupby(
+                rows, key=lambda row: (row[0], row[1])):
+            group = list(group)
+            durations = [row[2] for row in group]
+            timing = {'subcommand': group_subcommand,
+                      'region': group_region,
+                      'count': len(durations),
+                      'failures': sum(1 for row in group if row[3] != 0),
+                      'mean': sum(durations) / len(durations),
+                      'max': durations[-1]}
+            for rank in PERCENTILES:
+                timing['p{}'.format(rank)] = percentile(durations, rank)
+            timings.append(timing)
+        return timings
+
+
+HISTORY = ExecutionHistory(config.history_store or
+                           os.path.join(tempfile.gettempdir(),
+                                        'lizzy-history.sqlite'),
+                           config.history_size)
@@ -0,0 +1,78 @@
+import time
+from contextlib import contextmanager
+from threading import Condition
+from typing import Any, Callable, Dict, Iterator  # NOQA pylint: disable=unused-import
+
+from ..configuration import config
+
+
+class ConcurrencyLimit:
+    """
+    Execution lane bounding how many commands run at the same time,
+    independently of how many requests are being served. Callers over the
+    limit wait for a free slot. A ``size`` of zero or less doesn't limit
+    anything.
+    """
+
+    def __init__(self, name: str, size: int,
+                 clock: Callable[[], float]=time.monotonic):
+        self.name = name
+        self.size = size
+        self.clock = clock
+        self.running = 0
+        self.queued = 0
+        self.max_running = 0
+        self.max_queued = 0
+        self.commands = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._condition = Condition()
+
+    def acquire(self):
+        started = self.clock()
+        with self._condition:
+            if 0 < self.size <= self.running:
+                self.queued += 1
+                self.max_queued = max(self.max_queued, self.queued)
+                try:
+                    while 0 < self.size <= self.running:
+                        self._condition.wait()
+                finally:
+                    self.queued -= 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            waited = self.clock() - started
+            self.commands += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def release(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {'size': self.size,
+                    'running': self.running,
+                    'queued': self.queued,
+                    'max_running': self.max_running,
+                    'max_queued': self.max_queued,
+                    'commands': self.commands,
+                    'wait_seconds_mean': (self.wait_total / self.commands
+                                          if self.commands else 0.0),
+                    'wait_seconds_max': self.wait_max}
+
+
+# Fast read only commands don't wait behind slow stack changes
+READ_LANE = ConcurrencyLimit('read', config.execution_read_concurrency)
+MUTATION_LANE = ConcurrencyLimit('mutation', config.execution_mutation_concurrency)
+LANES = (READ_LANE, MUTATION_LANE)
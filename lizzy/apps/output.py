@@ -0,0 +1,227 @@
+"""
+Capture of command output: bounded in memory, complete on disk.
+"""
+
+import gzip
+import os
+import re
+import tempfile
+import uuid
+from logging import getLogger
+from threading import Lock
+from typing import IO, Iterator, List, Optional  # NOQA pylint: disable=unused-import
+
+from ..configuration import config
+from ..exceptions import ObjectNotFound
+from .executors import OutputCallback
+
+logger = getLogger('lizzy.app.output')  # pylint: disable=invalid-name
+
+EXECUTION_ID = re.compile(r'^[0-9a-f]{32}$')
+
+TRUNCATED = '\n[... {} characters truncated ...]\n'
+
+
+class BoundedOutput:
+    """
+    Output written incrementally of which only the first ``head`` and the
+    last ``tail`` characters are kept, unless ``keep_all`` is set.
+    """
+
+    def __init__(self, head: int, tail: int, keep_all: bool=False):
+        self.head = head
+        self.tail = tail
+        self.keep_all = keep_all
+        self.size = 0
+        self._head = []  # type: List[str]
+        self._head_size = 0
+        self._tail = ''
+
+    def write(self, text: str):
+        self.size += len(text)
+        if self.keep_all:
+            self._head.append(text)
+            self._head_size += len(text)
+            return
+        if self._head_size < self.head:
+            kept = text[:self.head - self._head_size]
+            self._head.append(kept)
+            self._head_size += len(kept)
+            text = text[len(kept):]
+        if text and self.tail > 0:
+            self._tail = (self._tail + text)[-self.tail:]
+
+    @property
+    def truncated(self) -> int:
+        """Characters left out of the middle of the output."""
+        return self.size - self._head_size - len(self._tail)
+
+    def getvalue(self) -> str:
+        head = ''.join(self._head)
+        if self.truncated:
+            return head + TRUNCATED.format(self.truncated) + self._tail
+        return head + self._tail
+
+
+def summarize(text: str, head: Optional[int]=None,
+              tail: Optional[int]=None) -> str:
+    """
+    Shortens the text to its beginning and end, e.g. to log it.
+    """
+    output = BoundedOutput(config.output_head_size if head is None else head,
+                           config.output_tail_size if tail is None else tail)
+    output.write(text)
+    return output.getvalue()
+
+
+class CommandOutput(str):
+    """
+    Output of a command that knows the id of its complete output in the
+    :class:`OutputStore`, if it was stored.
+    """
+
+    execution_id = None  # type: Optional[str]
+
+
+class OutputStore:
+    """
+    Compressed command outputs in a directory, keeping the ``size`` most
+    recent ones. Outputs are written while the command runs and only become
+    visible when they are complete, the directory can be shared by several
+    processes.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _file_name(self, execution_id: str) -> str:
+        if not EXECUTION_ID.match(execution_id):
+            raise ObjectNotFound(execution_id)
+        return os.path.join(self.path, execution_id + '.gz')
+
+    def create(self) -> 'StoredOutput':
+        os.makedirs(self.path, exist_ok=True)
+        return StoredOutput(self, uuid.uuid4().hex)
+
+    def read(self, execution_id: str,
+             chunk_size: int=64 * 1024) -> Iterator[str]:
+        """
+        Reads the output in chunks.
+
+        :raises ObjectNotFound: when there is no output with the id
+        """
+        try:
+            output_file = gzip.open(self._file_name(execution_id), 'rt',
+                                    encoding='utf-8', errors='replace')
+        except FileNotFoundError:
+            raise ObjectNotFound(execution_id)
+
+        def chunks():
+            with output_file:
+                while True:
+                    chunk = output_file.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return chunks()
+
+    def prune(self):
+        """Removes the oldest outputs over the store size."""
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.path)
+                           if entry.name.endswith('.gz')]
+            except FileNotFoundError:
+                return
+            if len(entries) <= self.size:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.size]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    # removed by another process
+                    pass
+
+
+class StoredOutput:
+    """Output of a single command being written to the store."""
+
+    def __init__(self, store: OutputStore, execution_id: str):
+        self.store = store
+        self.execution_id = execution_id
+        self._temporary_name = os.path.join(
+            store.path, '.{}.{}.tmp'.format(execution_id, os.getpid()))
+        self._file = gzip.open(self._temporary_name, 'wt',
+                               encoding='utf-8')  # type: IO[str]
+
+    def write(self, text: str):
+        self._file.write(text)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._temporary_name,
+                   self.store._file_name(self.execution_id))  # pylint: disable=protected-access
+        self.store.prune()
+
+
+class OutputCapture:
+    """
+    Captures the output of a command as it is written: the beginning and the
+    end in memory, all of it in the output store. Output is also passed on to
+    ``on_output``, if given.
+
+    Outputs that must be parsed, e.g. JSON, are kept whole in memory and not
+    stored.
+    """
+
+    def __init__(self, store: Optional[OutputStore], keep_all: bool=False,
+                 on_output: Optional[OutputCallback]=None):
+        self.output = BoundedOutput(config.output_head_size,
+                                    config.output_tail_size, keep_all)
+        self.on_output = on_output
+        self.stored = None  # type: Optional[StoredOutput]
+        if store is not None and store.enabled and not keep_all:
+            try:
+                self.stored = store.create()
+            except OSError:
+                logger.exception('Failed to store command output.')
+
+    def write(self, text: str):
+        self.output.write(text)
+        if self.stored is not None:
+            self.stored.write(text)
+        if self.on_output is not None:
+            self.on_output(text)
+
+    def close(self):
+        if self.stored is not None:
+            try:
+                self.stored.close()
+            except OSError:
+                logger.exception('Failed to store command output.')
+                self.stored = None
+
+    def __enter__(self) -> 'OutputCapture':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def getvalue(self) -> CommandOutput:
+        output = CommandOutput(self.output.getvalue())
+        if self.stored is not None:
+            output.execution_id = self.stored.execution_id
+        return output
+
+
+OUTPUTS = OutputStore(config.output_store_path or
+                      os.path.join(tempfile.gettempdir(), 'lizzy-outputs'),
+                      config.output_store_size)
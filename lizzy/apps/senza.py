@@ -1,20 +1,30 @@
 import tempfile
 from typing import Dict, List, Optional
 
-from ..exceptions import (ExecutionError, SenzaDomainsError, SenzaPatchError,
+from ..exceptions import (ExecutionError, ExecutionTimeout,
+                          SenzaDomainsError, SenzaPatchError,
                           SenzaRenderError, SenzaRespawnInstancesError,
-                          SenzaTrafficError, SenzaScaleError)
+                          SenzaTrafficError, SenzaScaleError,
+                          TemporarilyUnavailable)
 from ..version import VERSION
+from .coalescing import SingleFlight, coalesced
 from .common import Application
+from .executors import Executor, OutputCallback
+from .limits import READ_LANE
+
+# Read only commands that are running, shared by concurrent identical calls
+READ_FLIGHTS = SingleFlight()
 
 
 class Senza(Application):
-    def __init__(self, region: str):
-        super().__init__('senza', extra_parameters=['--region', region])
+    def __init__(self, region: str, executor: Optional[Executor]=None):
+        super().__init__('senza', extra_parameters=['--region', region],
+                         executor=executor, region=region)
 
     def create(self, senza_yaml: str, stack_version: str,
                parameters: List[str], disable_rollback: bool, dry_run: bool,
-               tags: List[str]) -> str:
+               tags: List[str],
+               on_output: Optional[OutputCallback]=None) -> str:
         """
         Create a new stack
 
@@ -23,6 +33,7 @@ class Senza(Application):
         :param parameters: Extra parameters for the deployment
         :param disable_rollback: Disables stack rollback on creation failure
         :param tags: Extra tags to add to the stack
+        :param on_output: Called with each output line of senza
         :return: Success of the operation
         """
         with tempfile.NamedTemporaryFile() as temp_yaml:
@@ -42,9 +53,12 @@ class Senza(Application):
                 cli_tags.extend(['-t', tag])
 
             args.append('--stacktrace-visible')
+            # throttled creations aren't retried, the stack might exist
             return self._execute('create', *args, *cli_tags, temp_yaml.name,
-                                 stack_version, *parameters)
+                                 stack_version, *parameters, retry=False,
+                                 on_output=on_output)
 
+    @coalesced(READ_FLIGHTS)
     def domains(self, stack_name: Optional[str]=None) -> List[Dict[str, str]]:
         """
         Get domain names for applications. If stack name is provided then it
@@ -58,27 +72,33 @@ class Senza(Application):
         try:
             if stack_name:
                 stack_domains = self._execute('domains', stack_name,
-                                              expect_json=True)
+                                              expect_json=True, lane=READ_LANE)
             else:
-                stack_domains = self._execute('domains', expect_json=True)
+                stack_domains = self._execute('domains', expect_json=True,
+                                              lane=READ_LANE)
             return stack_domains
+        except (TemporarilyUnavailable, ExecutionTimeout):
+            raise
         except ExecutionError as exception:
             raise SenzaDomainsError(exception.error, exception.output)
 
+    @coalesced(READ_FLIGHTS)
     def list(self, *args, **kwargs) -> List[Dict]:
         """
         Returns a list of all the stacks
         """
         return self._execute('list', *args, **kwargs,
-                             expect_json=True)  # type: list
+                             expect_json=True, lane=READ_LANE)  # type: list
 
-    def remove(self, stack_id: str, dry_run: bool, force: bool) -> bool:
+    def remove(self, stack_id: str, dry_run: bool, force: bool,
+               on_output: Optional[OutputCallback]=None) -> bool:
         """
         Removes a stack
 
         :param stack_name: Name of the application stack
         :param stack_version: Name of the application version that will
                               be removed
+        :param on_output: Called with each output line of senza
         :raises: ExecutionError
         :return: Success of the operation
         """
@@ -88,12 +108,15 @@ class Senza(Application):
             options.append('--dry-run')
         if force:
             options.append('--force')
-        return self._execute('delete', *options, *stack_id.rsplit("-", 1))
+        return self._execute('delete', *options, *stack_id.rsplit("-", 1),
+                             on_output=on_output)
 
     def traffic(self, stack_name: str, stack_version: Optional[str]=None,
                 percentage: Optional[int]=None) -> List[Dict]:
         """
-        Changes the application traffic percentage.
+        Changes the application traffic percentage. Without a percentage it
+        only reads the traffic weights, sharing the result with concurrent
+        identical reads.
 
         :param stack_name: Name of the application stack
         :param stack_version: Name of the application version that will be
@@ -103,6 +126,17 @@ class Senza(Application):
         :raises SenzaTrafficError: when a ExecutionError is thrown to allow
                                    more specific error handing.
         """
+        if percentage is None:
+            return self._traffic_weights(stack_name, stack_version)
+        return self._traffic(stack_name, stack_version, percentage)
+
+    @coalesced(READ_FLIGHTS)
+    def _traffic_weights(self, stack_name: str,
+                         stack_version: Optional[str]) -> List[Dict]:
+        return self._traffic(stack_name, stack_version, None)
+
+    def _traffic(self, stack_name: str, stack_version: Optional[str],
+                 percentage: Optional[int]) -> List[Dict]:
         try:
             arguments = []
             if stack_version is not None:
@@ -110,27 +144,36 @@ class Senza(Application):
             if percentage is not None:
                 arguments.append(str(percentage))
 
+            # without a percentage the traffic is only read
             traffic_weights = self._execute('traffic', stack_name, *arguments,
-                                            expect_json=True)
+                                            expect_json=True,
+                                            lane=(READ_LANE if percentage is None
+                                                  else None))
             return traffic_weights
+        except (TemporarilyUnavailable, ExecutionTimeout):
+            raise
         except ExecutionError as exception:
             raise SenzaTrafficError(exception.error, exception.output)
 
-    def respawn_instances(self, stack_name: str, stack_version: str):
+    def respawn_instances(self, stack_name: str, stack_version: str,
+                          on_output: Optional[OutputCallback]=None):
         """
         Replace all EC2 instances in Auto Scaling Group(s).
 
         :param stack_name: Name of the application stack
         :param stack_version: Name of the application version that will
                               be changed
+        :param on_output: Called with each output line of senza
         :raises SenzaRespawnInstancesError: when a ExecutionError is thrown
                                             to allow more specific error handing.
         """
         try:
 
             self._execute('respawn-instances', stack_name, stack_version,
-                          expect_json=True)
+                          expect_json=True, retry=False, on_output=on_output)
 
+        except (TemporarilyUnavailable, ExecutionTimeout):
+            raise
         except ExecutionError as exception:
             raise SenzaRespawnInstancesError(exception.error, exception.output)
 
@@ -151,6 +194,8 @@ class Senza(Application):
             self._execute('patch', stack_name, stack_version, image_argument,
                           expect_json=True)
 
+        except (TemporarilyUnavailable, ExecutionTimeout):
+            raise
         except ExecutionError as exception:
             raise SenzaPatchError(exception.error, exception.output)
 
@@ -171,7 +216,9 @@ class Senza(Application):
                 return self._execute('print', '--force',
                                      temp_yaml.name, stack_version,
                                      image_version, *parameters,
-                                     expect_json=True)
+                                     expect_json=True, lane=READ_LANE)
+            except (TemporarilyUnavailable, ExecutionTimeout):
+                raise
             except ExecutionError as exception:
                 self.logger.error('Failed to render CloudFormation defition.',
                                   extra={'command.output': exception.output})
@@ -198,5 +245,7 @@ class Senza(Application):
             arguments.append('--force')
 
             return self._execute('scale', stack_name, stack_version, *arguments)
+        except (TemporarilyUnavailable, ExecutionTimeout):
+            raise
         except ExecutionError as exception:
             raise SenzaScaleError(exception.error, exception.output)
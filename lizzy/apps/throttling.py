@@ -0,0 +1,148 @@
+import fcntl
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import time
+from logging import getLogger
+from threading import Lock
+from typing import Any, Callable, Dict, Optional  # NOQA pylint: disable=unused-import
+
+from ..configuration import config
+from ..exceptions import Throttled
+from .executors import ExecutionResult
+
+logger = getLogger('lizzy.app.throttling')  # pylint: disable=invalid-name
+
+# Error codes and messages of AWS APIs rejecting calls over their rate limit
+THROTTLED = re.compile(r'Throttling|Rate exceeded|RequestLimitExceeded|'
+                       r'TooManyRequestsException|SlowDown|'
+                       r'PriorRequestNotComplete')
+
+MAX_BACKOFF = 20
+
+
+def throttled(result: ExecutionResult) -> bool:
+    """
+    Tells if a command failed because AWS throttled its calls.
+    """
+    if result.returncode == 0:
+        return False
+    return bool(THROTTLED.search(result.stdout) or
+                THROTTLED.search(result.stderr or ''))
+
+
+def backoff(attempt: int, base: float,
+            jitter: Callable[[], float]=random.random) -> float:
+    """
+    Seconds to wait before retrying a throttled command for the ``attempt``
+    time (starting with zero), growing exponentially up to ``MAX_BACKOFF``
+    with full jitter so retries of concurrent commands are spread out.
+    """
+    return jitter() * min(MAX_BACKOFF, base * 2 ** attempt)
+
+
+class AWSBudget:
+    """
+    Token bucket per region bounding how many commands calling AWS start per
+    second, shared by all threads and processes on the host through a file
+    locked while it is updated. A ``rate`` of zero or less doesn't limit
+    anything.
+
+    Commands wait for the budget up to ``max_wait`` seconds.
+    """
+
+    def __init__(self, path: str, rate: float, burst: int, max_wait: float,
+                 clock: Callable[[], float]=time.time,
+                 sleep: Callable[[float], None]=time.sleep):
+        self.path = path
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._stats = {}  # type: Dict[str, Dict[str, Any]]
+        self._lock = Lock()
+
+    def _reserve(self, region: str) -> float:
+        """
+        Takes a token of the region if there is one.
+
+        :return: zero when a token was taken, otherwise the seconds until
+                 there is one
+        """
+        descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(descriptor, 'r+') as budget_file:
+            fcntl.flock(budget_file, fcntl.LOCK_EX)
+            try:
+                buckets = json.loads(budget_file.read() or '{}')
+            except ValueError:
+                logger.warning('Resetting corrupted AWS budget.',
+                               extra={'path': self.path})
+                buckets = {}
+            now = self.clock()
+            tokens, updated = buckets.get(region, (self.burst, now))
+            tokens = min(self.burst, tokens + max(0, now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            buckets[region] = (tokens, now)
+            budget_file.seek(0)
+            budget_file.truncate()
+            budget_file.write(json.dumps(buckets))
+            # the lock is released when the file is closed
+        return wait
+
+    def take(self, region: str):
+        """
+        Waits until a command of the region can call AWS.
+
+        :raises Throttled: when the budget doesn't allow a command in time
+        """
+        if self.rate <= 0:
+            return
+        started = self.clock()
+        waited = 0.0
+        while True:
+            wait = self._reserve(region)
+            if not wait:
+                break
+            if waited + wait > self.max_wait:
+                self._count(region, waited, exhausted=True)
+                raise Throttled(region, max(1, math.ceil(wait)))
+            self.sleep(wait)
+            waited = self.clock() - started
+        self._count(region, waited)
+
+    def _count(self, region: str, waited: float, exhausted: bool=False):
+        with self._lock:
+            stats = self._stats.setdefault(region, {'commands': 0,
+                                                    'waited': 0,
+                                                    'wait_seconds': 0.0,
+                                                    'exhausted': 0})
+            if exhausted:
+                stats['exhausted'] += 1
+            else:
+                stats['commands'] += 1
+            if waited:
+                stats['waited'] += 1
+                stats['wait_seconds'] += waited
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Commands of this process that took from the budget of each region,
+        waited for it or gave up waiting.
+        """
+        with self._lock:
+            return {region: dict(stats) for region, stats in self._stats.items()}
+
+
+BUDGET = AWSBudget(config.aws_budget_file or
+                   os.path.join(tempfile.gettempdir(), 'lizzy-aws-budget.json'),
+                   rate=config.aws_budget_rate,
+                   burst=config.aws_budget_burst,
+                   max_wait=config.aws_budget_max_wait)
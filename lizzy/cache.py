@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import (Any, Callable, Dict, Hashable,  # NOQA pylint: disable=unused-import
+                    Iterator, Optional, Tuple)
+
+from . import metrics
+
+
+class TTLCache:
+    """
+    Thread safe cache whose entries expire ``ttl`` seconds after being stored.
+
+    It holds at most ``maxsize`` entries, evicting the least recently used
+    ones first. A ``ttl`` of zero or less disables the cache. Lookups of
+    caches with a ``name`` are counted in the metrics.
+    """
+
+    def __init__(self, ttl: float, maxsize: int,
+                 clock: Callable[[], float]=time.monotonic,
+                 name: Optional[str]=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = Lock()
+
+    def _lookup(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, _ = entry
+        if self.clock() - stored_at >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        """
+        Returns the value stored for the key, counting it as hit or miss.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if self.name is not None:
+            metrics.count_cache_lookup(self.name, hit=entry is not None)
+        return default if entry is None else entry[1]
+
+    def peek(self, key: Hashable, default: Any=None) -> Any:
+        """
+        Returns the value stored for the key without affecting the counters.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            return default if entry is None else entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def replace(self, key: Hashable, value: Any):
+        """
+        Replaces the value of an existing entry keeping its original expiry
+        time. Does nothing if the key is not stored.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], value)
+
+    def pop(self, key: Hashable, default: Any=None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def keys(self) -> Iterator[Hashable]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_ratio': self.hits / total if total else 0.0,
+                    'size': len(self._entries),
+                    'maxsize': self.maxsize,
+                    'ttl': self.ttl}
@@ -5,12 +5,100 @@ class Configuration:  # pylint: disable=too-few-public-methods
     """
     Configuration parameters to be fetched from the environment
     """
+    # Requests served at the same time
+    admission_concurrency = environmental.Int('ADMISSION_CONCURRENCY', 16)
+    # Requests waiting to be served
+    admission_queue_size = environmental.Int('ADMISSION_QUEUE_SIZE', 8)
+    # Seconds requests can wait
+    admission_queue_timeout = environmental.Float('ADMISSION_QUEUE_TIMEOUT', 10)
+    # Requests per minute, 0 disables the limit
+    admission_rate = environmental.Float('ADMISSION_RATE', 0)
+    # Requests of a user at once, 0 disables the limit
+    admission_user_concurrency = environmental.Int('ADMISSION_USER_CONCURRENCY', 0)
+    # Requests per minute of a user
+    admission_user_rate = environmental.Float('ADMISSION_USER_RATE', 0)
     allowed_users = environmental.List('ALLOWED_USERS', None)
     allowed_user_pattern = environmental.Str('ALLOWED_USER_PATTERN', None)  # Username pattern
+    # Commands calling AWS at once per region
+    aws_budget_burst = environmental.Int('AWS_BUDGET_BURST', 10)
+    # File sharing the budget between processes
+    aws_budget_file = environmental.Str('AWS_BUDGET_FILE', None)
+    # Seconds commands wait for the budget
+    aws_budget_max_wait = environmental.Float('AWS_BUDGET_MAX_WAIT', 30)
+    # Commands calling AWS per second per region, 0 disables
+    aws_budget_rate = environmental.Float('AWS_BUDGET_RATE', 0)
+    # Connections of each AWS client, e.g. threads
+    aws_pool_connections = environmental.Int('AWS_POOL_CONNECTIONS', 32)
+    # Failures opening the circuit
+    circuit_breaker_failures = environmental.Int('CIRCUIT_BREAKER_FAILURES', 5)
+    # Seconds before probing
+    circuit_breaker_reset_timeout = environmental.Int('CIRCUIT_BREAKER_RESET_TIMEOUT', 30)
+    # Breakers by region or command
+    circuit_breaker_scope = environmental.Str('CIRCUIT_BREAKER_SCOPE', 'region')
     deployer_scope = environmental.Str('DEPLOYER_SCOPE')  # OAUTH scope needed to deploy
+    # How senza commands are run
+    execution_backend = environmental.Str('EXECUTION_BACKEND', 'subprocess')
+    # Stack changes at once
+    execution_mutation_concurrency = environmental.Int('EXECUTION_MUTATION_CONCURRENCY', 4)
+    # Worker processes of the pool backend
+    execution_pool_size = environmental.Int('EXECUTION_POOL_SIZE', 4)
+    # Commands before recycling
+    execution_pool_max_commands = environmental.Int('EXECUTION_POOL_MAX_COMMANDS', 100)
+    # MB before recycling
+    execution_pool_max_memory = environmental.Int('EXECUTION_POOL_MAX_MEMORY', 512)
+    # Read only commands at once
+    execution_read_concurrency = environmental.Int('EXECUTION_READ_CONCURRENCY', 8)
+    # Seconds before asyncio commands are killed
+    execution_timeout = environmental.Int('EXECUTION_TIMEOUT', 270)
+    # Seconds between health checks
+    health_check_interval = environmental.Int('HEALTH_CHECK_INTERVAL', 30)
+    # Command executions kept, 0 disables the history
+    history_size = environmental.Int('HISTORY_SIZE', 100000)
+    # SQLite database of the command executions
+    history_store = environmental.Str('HISTORY_STORE', None)
+    # Stored idempotent responses
+    idempotency_key_size = environmental.Int('IDEMPOTENCY_KEY_SIZE', 1000)
+    # Seconds idempotency keys are kept
+    idempotency_key_ttl = environmental.Int('IDEMPOTENCY_KEY_TTL', 3600)
+    # Seconds, 0 disables polling
+    inventory_refresh_interval = environmental.Int('INVENTORY_REFRESH_INTERVAL', 0)
+    # Regions polled, defaults to REGIONS
+    inventory_regions = environmental.List('INVENTORY_REGIONS', None)
+    # Unfinished background jobs accepted
+    job_queue_size = environmental.Int('JOB_QUEUE_SIZE', 20)
+    # SQLite database of jobs, in memory if unset
+    job_store = environmental.Str('JOB_STORE', None)
+    # Background jobs running at the same time
+    job_workers = environmental.Int('JOB_WORKERS', 2)
     log_level = environmental.Str('LOG_LEVEL', 'INFO')
     log_format = environmental.Str('LOG_FORMAT', 'default')
+    # Characters kept of the output beginning
+    output_head_size = environmental.Int('OUTPUT_HEAD_SIZE', 2048)
+    # Directory of the complete command outputs
+    output_store_path = environmental.Str('OUTPUT_STORE_PATH', None)
+    # Complete command outputs kept, 0 disables
+    output_store_size = environmental.Int('OUTPUT_STORE_SIZE', 1000)
+    # Characters kept of the output end
+    output_tail_size = environmental.Int('OUTPUT_TAIL_SIZE', 2048)
     region = environmental.Str('REGION', 'eu-west-1')  # AWS Region
+    # Regions listed with region=all, defaults to REGION
+    regions = environmental.List('REGIONS', None)
+    # How stacks are read, senza or cloudformation
+    stack_backend = environmental.Str('STACK_BACKEND', 'senza')
+    # Seconds stack listings are cached
+    stack_cache_ttl = environmental.Int('STACK_CACHE_TTL', 10)
+    # Cached stack listings
+    stack_cache_size = environmental.Int('STACK_CACHE_SIZE', 1000)
+    # Requests waiting for stacks at once
+    stack_wait_concurrency = environmental.Int('STACK_WAIT_CONCURRENCY', 4)
+    # Seconds between reads of awaited stacks
+    stack_wait_interval = environmental.Float('STACK_WAIT_INTERVAL', 5)
+    # Maximum seconds requests wait for a status
+    stack_wait_timeout = environmental.Int('STACK_WAIT_TIMEOUT', 60)
+    # Seconds before the first retry
+    throttling_backoff = environmental.Float('THROTTLING_BACKOFF', 1)
+    # Retries of throttled commands
+    throttling_retries = environmental.Int('THROTTLING_RETRIES', 3)
     token_url = environmental.Str('TOKEN_URL')
     token_info_url = environmental.Str('TOKENINFO_URL')
     kairosdb_url = environmental.Str('KAIROSDB_URL', None)
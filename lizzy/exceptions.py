@@ -26,6 +26,59 @@ class ExecutionError(LizzyError):
         return '({error}): {output}'.format_map(vars(self))
 
 
+class ExecutionTimeout(ExecutionError):
+    """Raised when a command doesn't finish before its deadline."""
+
+    def __init__(self, timeout: float):
+        """
+        :param timeout: Seconds the command was allowed to run
+        """
+        self.timeout = timeout
+        super().__init__('TIMEOUT',
+                         'Command did not finish in {} seconds'.format(timeout))
+
+
+class TemporarilyUnavailable(ExecutionError):
+    """Raised when a command can't run now but can be retried later."""
+
+    def __init__(self, error: str, output: str, retry_after: int):
+        """
+        :param retry_after: Seconds the client should wait before retrying
+        """
+        self.retry_after = retry_after
+        super().__init__(error, output)
+
+
+class CircuitOpen(TemporarilyUnavailable):
+    """Raised when commands aren't run because AWS is unavailable."""
+
+    def __init__(self, circuit: str, retry_after: int):
+        """
+        :param circuit: Name of the open circuit breaker, e.g. the region
+        :param retry_after: Seconds until the breaker lets a command through
+        """
+        self.circuit = circuit
+        super().__init__('CIRCUIT OPEN',
+                         'AWS is unavailable in {}, retry in {} '
+                         'seconds'.format(circuit, retry_after),
+                         retry_after)
+
+
+class Throttled(TemporarilyUnavailable):
+    """Raised when AWS calls of a region are over their rate limit."""
+
+    def __init__(self, region: str, retry_after: int):
+        """
+        :param region: Region of the throttled command
+        :param retry_after: Seconds to wait before retrying
+        """
+        self.region = region
+        super().__init__('THROTTLED',
+                         'Too many AWS calls in {}, retry in {} '
+                         'seconds'.format(region, retry_after),
+                         retry_after)
+
+
 class SenzaDomainsError(ExecutionError):
     """Raised when `senza domains` command returns an unexpected error."""
 
@@ -59,6 +112,44 @@ class ObjectNotFound(LizzyError):
         self.uid = uid
 
 
+class JobQueueFull(LizzyError):
+    """Raised when there are too many unfinished background jobs."""
+
+    def __init__(self, queue_size: int):
+        super().__init__("Too many unfinished jobs ({})".format(queue_size))
+        self.queue_size = queue_size
+
+
+class Overloaded(LizzyError):
+    """Raised when a request is rejected to protect lizzy from overload."""
+
+    messages = {'rate': 'Too many requests',
+                'user_rate': 'Too many requests from the user',
+                'user_concurrency': 'Too many concurrent requests from the user',
+                'queue_full': 'Too many requests waiting to be served',
+                'queue_timeout': 'Timed out waiting to be served',
+                'idle_full': 'Too many requests waiting for stacks'}
+
+    def __init__(self, reason: str, retry_after: int):
+        """
+        :param reason: Limit that was reached
+        :param retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(self.messages.get(reason, reason))
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(LizzyError):
+    """
+    Raised when output is written for a client that went away, stopping the
+    operation writing it.
+    """
+
+    def __init__(self):
+        super().__init__('Client disconnected')
+
+
 class AMIImageNotUpdated(LizzyError):
     """Raised when 'senza patch' command to update Taupage image does
     not succeed."""
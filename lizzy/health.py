@@ -0,0 +1,163 @@
+import time
+from datetime import datetime  # NOQA pylint: disable=unused-import
+from logging import getLogger
+from threading import Event, Lock, RLock, Thread
+from typing import Any, Callable, Dict, NamedTuple, Optional  # NOQA pylint: disable=unused-import
+
+from .exceptions import ExecutionError
+from .util import now
+
+logger = getLogger('lizzy.health')  # pylint: disable=invalid-name
+
+
+class HealthCheck(NamedTuple):
+    """Outcome of a single health check."""
+    healthy: bool
+    checked_at: datetime
+    latency: float
+    error: Optional[str]
+
+
+class HealthChecker:
+    """
+    Runs a health check in a background thread every ``interval`` seconds
+    and keeps its last outcome in memory.
+
+    While the thread runs, requests are always answered with the last
+    outcome, or wait for the first one. An outcome older than twice the
+    interval plus the latency of the check means the thread is stuck, e.g.
+    in a hanging check, and is answered as unhealthy. Without the thread,
+    outcomes older than ``interval`` are refreshed when they are requested
+    and an ``interval`` of zero or less checks on every request.
+    """
+
+    def __init__(self, check: Callable[[], Any], interval: float,
+                 clock: Callable[[], float]=time.monotonic):
+        self.check_function = check
+        self.interval = interval
+        self.clock = clock
+        self.checks = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self._last = None  # type: Optional[HealthCheck]
+        self._last_clock = 0.0
+        self._checked = Event()
+        self._lock = Lock()
+        self._check_lock = RLock()
+        self._stopped = Event()
+        self._thread = None  # type: Thread
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='lizzy-health',
+                              daemon=True)
+        self._thread.start()
+        logger.info('Started health checker.',
+                    extra={'interval': self.interval})
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.check()
+            self._stopped.wait(self.interval)
+
+    def check(self) -> HealthCheck:
+        """
+        Runs the health check, recording its outcome.
+        """
+        with self._check_lock:
+            started = self.clock()
+            error = None  # type: Optional[str]
+            try:
+                self.check_function()
+            except ExecutionError as exception:
+                error = exception.output
+            except Exception as exception:  # pylint: disable=broad-except
+                logger.exception('Health check failed unexpectedly.')
+                error = str(exception)
+            finished = self.clock()
+            result = HealthCheck(healthy=error is None, checked_at=now(),
+                                 latency=finished - started, error=error)
+            with self._lock:
+                self.checks += 1
+                if result.healthy:
+                    self.consecutive_successes += 1
+                    self.consecutive_failures = 0
+                else:
+                    self.failures += 1
+                    self.consecutive_failures += 1
+                    self.consecutive_successes = 0
+                self._last = result
+                self._last_clock = finished
+            self._checked.set()
+        if not result.healthy:
+            logger.warning('Health check failed.',
+                           extra={'error': error,
+                                  'consecutive_failures': self.consecutive_failures})
+        return result
+
+    def _fresh(self) -> Optional[HealthCheck]:
+        with self._lock:
+            if self._last is None or self.clock() - self._last_clock >= self.interval:
+                return None
+            return self._last
+
+    def _background_result(self) -> HealthCheck:
+        self._checked.wait()
+        with self._lock:
+            last, age = self._last, self.clock() - self._last_clock
+        if age <= 2 * self.interval + last.latency:
+            return last
+        return last._replace(healthy=False,
+                             error='Health check overdue by {:.0f} seconds'.format(
+                                 age - self.interval))
+
+    def result(self) -> HealthCheck:
+        """
+        Returns the last outcome of the background thread or, without it,
+        checks again when the outcome is too old. Concurrent callers share a
+        single check.
+        """
+        if self.running:
+            return self._background_result()
+        result = self._fresh()
+        if result is not None:
+            return result
+        with self._check_lock:
+            result = self._fresh()
+            return result if result is not None else self.check()
+
+    def reset(self):
+        with self._lock:
+            self.checks = 0
+            self.failures = 0
+            self.consecutive_failures = 0
+            self.consecutive_successes = 0
+            self._last = None
+            self._last_clock = 0.0
+            self._checked.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            last = self._last
+            return {'healthy': None if last is None else last.healthy,
+                    'checked_at': None if last is None else last.checked_at,
+                    'latency': None if last is None else last.latency,
+                    'error': None if last is None else last.error,
+                    'checks': self.checks,
+                    'failures': self.failures,
+                    'consecutive_failures': self.consecutive_failures,
+                    'consecutive_successes': self.consecutive_successes,
+                    'interval': self.interval}
@@ -0,0 +1,523 @@
+"""
+Background execution of long running stack operations.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from datetime import datetime  # NOQA pylint: disable=unused-import
+from logging import getLogger
+from threading import Condition, Event, Lock, Thread
+from typing import (Any, Callable, Dict, Iterator,  # NOQA pylint: disable=unused-import
+                    List, Optional, Tuple)
+
+from . import sentry_client
+from .configuration import config
+from .exceptions import (ExecutionError, ExecutionTimeout, JobQueueFull,
+                         LizzyError, ObjectNotFound, TemporarilyUnavailable)
+from .serialization import JSONEncoder
+from .util import now, parse_date
+
+logger = getLogger('lizzy.jobs')  # pylint: disable=invalid-name
+
+QUEUED = 'QUEUED'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+INTERRUPTED = 'INTERRUPTED'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, INTERRUPTED)
+
+INTERRUPTED_ERROR = {'title': 'Interrupted',
+                     'detail': 'The process running the job exited before it '
+                               'finished. The stack might have been changed.'}
+
+# Operations return their result and the output of the commands they ran
+Operation = Callable[..., Tuple[Any, str]]
+
+
+def _start_time(pid: int) -> Optional[str]:
+    """
+    Start time of the process in clock ticks after boot, None when it isn't
+    running or there is no /proc.
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+            # the command name before it may contain spaces and parentheses
+            return stat.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def process_owner() -> str:
+    """
+    Identifies the current process in the job store by host, pid and start
+    time, since pids are reused, e.g. by a restarted container.
+    """
+    pid = os.getpid()
+    started = _start_time(pid)
+    if started is None:
+        return '{}:{}'.format(socket.gethostname(), pid)
+    return '{}:{}:{}'.format(socket.gethostname(), pid, started)
+
+
+def owner_alive(owner: str) -> bool:
+    """
+    Checks if the process owning a job is still running. Processes of other
+    hosts are assumed to be alive.
+    """
+    hostname, pid, *started = owner.split(':')
+    if hostname != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # the pid may belong to a newer process
+    return not started or started[0] == _start_time(int(pid))
+
+
+class Job:  # pylint: disable=too-many-instance-attributes
+    def __init__(self, *, operation: str, arguments: Dict[str, Any],
+                 job_id: Optional[str]=None):
+        """
+        Stack operation executed in the background
+
+        :param operation: Name of the registered operation
+        :param arguments: Keyword arguments of the operation
+        :param job_id: Unique id, generated when not provided
+        """
+        self.job_id = job_id or uuid.uuid4().hex
+        self.operation = operation
+        self.arguments = arguments
+        self.state = QUEUED
+        self.owner = None  # type: Optional[str]
+        self.created_at = now()  # type: datetime
+        self.started_at = None  # type: Optional[datetime]
+        self.finished_at = None  # type: Optional[datetime]
+        self.result = None  # type: Any
+        self.output = ''
+        self.error = None  # type: Optional[Dict[str, str]]
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.job_id,
+                'operation': self.operation,
+                'state': self.state,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'result': self.result,
+                'output': self.output,
+                'error': self.error}
+
+
+class MemoryJobStore:
+    """
+    Keeps the most recent jobs of the process in memory. Jobs are lost when
+    the process exits.
+    """
+
+    def __init__(self, max_jobs: int=1000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # type: OrderedDict
+        self._lock = Lock()
+
+    def _pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def add(self, job: Job, queue_size: int):
+        """
+        :raises JobQueueFull: when there are ``queue_size`` unfinished jobs
+        """
+        with self._lock:
+            if self._pending() >= queue_size:
+                raise JobQueueFull(queue_size)
+            self._jobs[job.job_id] = job
+            self._evict()
+
+    def _evict(self):
+        """Forgets the oldest finished jobs when holding too many."""
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def claim(self, owner: str) -> Optional[Job]:
+        """
+        Marks the oldest queued job as running and returns it.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.state == QUEUED:
+                    job.state = RUNNING
+                    job.owner = owner
+                    job.started_at = now()
+                    return job
+        return None
+
+    def save(self, job: Job):
+        with self._lock:
+            self._jobs[job.job_id] = job
+
+    def get(self, job_id: str) -> Job:
+        """
+        :raises ObjectNotFound: when the job is unknown
+        """
+        with self._lock:
+            try:
+                return self._jobs[job_id]
+            except KeyError:
+                raise ObjectNotFound(job_id)
+
+    def recover(self) -> List[Job]:
+        """Jobs in memory can't outlive their process."""
+        return []
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending()
+
+
+class SQLiteJobStore:
+    """
+    Keeps jobs in a SQLite database on local disk so queued jobs survive
+    restarts and several processes can share the queue. Each job is claimed
+    by exactly one process with a conditional update of its row.
+    """
+
+    columns = ('job_id', 'operation', 'arguments', 'state', 'owner',
+               'created_at', 'started_at', 'finished_at', 'result', 'output',
+               'error')
+
+    def __init__(self, path: str, max_jobs: int=1000, timeout: float=30):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        with self._transaction() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                               'job_id TEXT PRIMARY KEY, '
+                               'operation TEXT NOT NULL, '
+                               'arguments TEXT NOT NULL, '
+                               'state TEXT NOT NULL, '
+                               'owner TEXT, '
+                               'created_at TEXT NOT NULL, '
+                               'started_at TEXT, '
+                               'finished_at TEXT, '
+                               'result TEXT, '
+                               "output TEXT NOT NULL DEFAULT '', "
+                               'error TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_state '
+                               'ON jobs (state)')
+
+    @contextmanager
+    def _transaction(self, write: bool=True) -> Iterator[sqlite3.Connection]:
+        """
+        Opens a connection (they can't be shared with forked processes) and
+        runs a transaction, holding the database write lock unless it only
+        reads.
+        """
+        with closing(sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None)) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    @staticmethod
+    def _dump_date(date: Optional[datetime]) -> Optional[str]:
+        return None if date is None else date.isoformat()
+
+    @staticmethod
+    def _load_date(date: Optional[str]) -> Optional[datetime]:
+        return None if date is None else parse_date(date)
+
+    def _to_row(self, job: Job) -> Tuple:
+        return (job.job_id,
+                job.operation,
+                json.dumps(job.arguments),
+                job.state,
+                job.owner,
+                self._dump_date(job.created_at),
+                self._dump_date(job.started_at),
+                self._dump_date(job.finished_at),
+                json.dumps(job.result, cls=JSONEncoder),
+                job.output,
+                json.dumps(job.error))
+
+    def _from_row(self, row: Tuple) -> Job:
+        values = dict(zip(self.columns, row))
+        job = Job(operation=values['operation'],
+                  arguments=json.loads(values['arguments']),
+                  job_id=values['job_id'])
+        job.state = values['state']
+        job.owner = values['owner']
+        job.created_at = self._load_date(values['created_at'])
+        job.started_at = self._load_date(values['started_at'])
+        job.finished_at = self._load_date(values['finished_at'])
+        job.result = json.loads(values['result'] or 'null')
+        job.output = values['output']
+        job.error = json.loads(values['error'] or 'null')
+        return job
+
+    def _select(self, connection: sqlite3.Connection, where: str,
+                *parameters, limit: int=-1) -> List[Job]:
+        query = 'SELECT {} FROM jobs WHERE {} ORDER BY rowid LIMIT {:d}'.format(
+            ', '.join(self.columns), where, limit)
+        return [self._from_row(row)
+                for row in connection.execute(query, parameters)]
+
+    def add(self, job: Job, queue_size: int):
+        """
+        :raises JobQueueFull: when there are ``queue_size`` unfinished jobs
+        """
+        with self._transaction() as connection:
+            pending, = connection.execute(
+                'SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)',
+                (QUEUED, RUNNING)).fetchone()
+            if pending >= queue_size:
+                raise JobQueueFull(queue_size)
+            connection.execute('INSERT INTO jobs ({}) VALUES ({})'.format(
+                ', '.join(self.columns), ', '.join('?' * len(self.columns))),
+                               self._to_row(job))
+            # forgets the oldest finished jobs when holding too many
+            connection.execute(
+                'DELETE FROM jobs WHERE rowid IN ('
+                'SELECT rowid FROM jobs WHERE state IN (?, ?, ?) '
+                'ORDER BY rowid LIMIT MAX((SELECT COUNT(*) FROM jobs) - ?, 0))',
+                (*FINISHED_STATES, self.max_jobs))
+
+    def claim(self, owner: str) -> Optional[Job]:
+        """
+        Marks the oldest queued job as running and returns it.
+        """
+        # idle workers poll without taking the write lock
+        with self._transaction(write=False) as connection:
+            if not connection.execute('SELECT 1 FROM jobs WHERE state = ? LIMIT 1',
+                                      (QUEUED,)).fetchone():
+                return None
+        with self._transaction() as connection:
+            queued = self._select(connection, 'state = ?', QUEUED, limit=1)
+            if not queued:
+                return None
+            job, = queued
+            job.state = RUNNING
+            job.owner = owner
+            job.started_at = now()
+            cursor = connection.execute(
+                'UPDATE jobs SET state = ?, owner = ?, started_at = ? '
+                'WHERE job_id = ? AND state = ?',
+                (RUNNING, owner, self._dump_date(job.started_at), job.job_id,
+                 QUEUED))
+            return job if cursor.rowcount == 1 else None
+
+    def save(self, job: Job):
+        with self._transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO jobs ({}) VALUES ({})'.format(
+                ', '.join(self.columns), ', '.join('?' * len(self.columns))),
+                               self._to_row(job))
+
+    def get(self, job_id: str) -> Job:
+        """
+        :raises ObjectNotFound: when the job is unknown
+        """
+        with self._transaction(write=False) as connection:
+            jobs = self._select(connection, 'job_id = ?', job_id)
+        if not jobs:
+            raise ObjectNotFound(job_id)
+        return jobs[0]
+
+    def recover(self) -> List[Job]:
+        """
+        Marks the running jobs whose process exited as interrupted. Queued
+        jobs are kept and picked up by the next free worker.
+        """
+        interrupted = []
+        with self._transaction() as connection:
+            for job in self._select(connection, 'state = ?', RUNNING):
+                if job.owner and owner_alive(job.owner):
+                    continue
+                job.state = INTERRUPTED
+                job.error = INTERRUPTED_ERROR
+                job.finished_at = now()
+                connection.execute(
+                    'UPDATE jobs SET state = ?, error = ?, finished_at = ? '
+                    'WHERE job_id = ? AND state = ?',
+                    (INTERRUPTED, json.dumps(job.error),
+                     self._dump_date(job.finished_at), job.job_id, RUNNING))
+                interrupted.append(job)
+        return interrupted
+
+    def pending(self) -> int:
+        with self._transaction(write=False) as connection:
+            pending, = connection.execute(
+                'SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)',
+                (QUEUED, RUNNING)).fetchone()
+        return pending
+
+
+class JobRunner:  # pylint: disable=too-many-instance-attributes
+    """
+    Runs registered operations in a bounded number of background threads,
+    taking the jobs from a job store so their state can be queried.
+
+    With a :class:`SQLiteJobStore` several processes can share the queue and
+    queued jobs are resumed after a restart. Jobs of processes that exited
+    are marked as interrupted when the runner starts and then every
+    ``recovery_interval`` seconds.
+    """
+
+    def __init__(self, workers: int, queue_size: int, max_jobs: int=1000,
+                 store=None, poll_interval: float=1,
+                 recovery_interval: float=60):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.store = store or MemoryJobStore(max_jobs=max_jobs)
+        self.poll_interval = poll_interval
+        self.recovery_interval = recovery_interval
+        self._recovered_at = 0.0
+        self.operations = {}  # type: Dict[str, Operation]
+        self._lock = Lock()
+        self._wakeup = Condition()
+        self._signals = 0
+        self._stopped = Event()
+        self._threads = []  # type: List[Thread]
+        self._pid = None  # type: Optional[int]
+
+    def register(self, name: str, operation: Operation):
+        self.operations[name] = operation
+
+    @property
+    def pending(self) -> int:
+        return self.store.pending()
+
+    @property
+    def running(self) -> bool:
+        return self._pid == os.getpid() and any(thread.is_alive()
+                                                for thread in self._threads)
+
+    def start(self):
+        """
+        Starts the worker threads of the current process, marking the jobs of
+        processes that exited as interrupted.
+        """
+        with self._lock:
+            if self.running:
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._recover()
+            self._threads = [Thread(target=self._work, args=(number == 0,),
+                                    name='lizzy-jobs-{}'.format(number),
+                                    daemon=True)
+                             for number in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _recover(self):
+        self._recovered_at = time.monotonic()
+        for job in self.store.recover():
+            logger.warning('Job was interrupted.',
+                           extra={'job_id': job.job_id,
+                                  'operation': job.operation})
+
+    def _work(self, recovers: bool):
+        """
+        Runs queued jobs until the runner stops. Only the worker that
+        ``recovers`` looks for interrupted jobs while idle.
+        """
+        owner = process_owner()
+        while not self._stopped.is_set():
+            job = self.store.claim(owner)
+            if job is not None:
+                self.run(job)
+                continue
+            with self._wakeup:
+                # jobs queued by other processes are picked up on timeout
+                if not self._signals:
+                    self._wakeup.wait(self.poll_interval)
+                self._signals = max(self._signals - 1, 0)
+            if (recovers and
+                    time.monotonic() - self._recovered_at >= self.recovery_interval):
+                self._recover()
+
+    def submit(self, operation: str, **arguments) -> Job:
+        """
+        Queues the operation for background execution.
+
+        :raises JobQueueFull: when there are too many unfinished jobs
+        """
+        if operation not in self.operations:
+            raise ValueError('Unknown operation: {}'.format(operation))
+        job = Job(operation=operation, arguments=arguments)
+        self.store.add(job, self.queue_size)
+        logger.info('Queued %s job.', operation, extra={'job_id': job.job_id})
+        self.start()
+        with self._wakeup:
+            self._signals += 1
+            self._wakeup.notify()
+        return job
+
+    def run(self, job: Job):
+        if job.state != RUNNING:
+            job.state = RUNNING
+            job.started_at = now()
+        try:
+            operation = self.operations[job.operation]
+            job.result, job.output = operation(**job.arguments)
+        except TemporarilyUnavailable as error:
+            job.error = {'title': 'Service Unavailable', 'detail': error.output}
+        except ExecutionTimeout as error:
+            job.error = {'title': 'Execution Timeout', 'detail': error.output}
+        except ExecutionError as error:
+            job.error = {'title': 'Execution Error', 'detail': error.output}
+            job.output = error.output
+        except ObjectNotFound as error:
+            job.error = {'title': 'Not Found',
+                         'detail': 'Stack not found: {}'.format(error.uid)}
+        except LizzyError as error:
+            job.error = {'title': type(error).__name__, 'detail': error.message}
+        except Exception as error:  # pylint: disable=broad-except
+            sentry_client.captureException()
+            logger.exception('Job failed unexpectedly.',
+                             extra={'job_id': job.job_id})
+            job.error = {'title': 'Internal Error', 'detail': str(error)}
+        job.state = FAILED if job.error else SUCCEEDED
+        job.finished_at = now()
+        self.store.save(job)
+        logger.info('Finished %s job.', job.operation,
+                    extra={'job_id': job.job_id, 'state': job.state})
+
+    def get(self, job_id: str) -> Job:
+        """
+        :raises ObjectNotFound: when the job is unknown
+        """
+        return self.store.get(job_id)
+
+
+JOBS = JobRunner(workers=config.job_workers,
+                 queue_size=config.job_queue_size,
+                 store=(SQLiteJobStore(config.job_store)
+                        if config.job_store else None))
@@ -0,0 +1,149 @@
+"""
+Prometheus metrics of the requests, senza commands, errors and caches.
+
+Metrics are only collected when ``prometheus_client`` is installed. With the
+``PROMETHEUS_MULTIPROC_DIR`` environment variable pointing to a directory
+shared by the processes of the host (e.g. uwsgi workers), ``/metrics``
+aggregates the metrics of all of them.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Dict, Iterator, Optional
+
+from flask import Flask, Response, g, request
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover
+    prometheus_client = None  # pylint: disable=invalid-name
+
+logger = getLogger('lizzy.metrics')  # pylint: disable=invalid-name
+
+ENABLED = prometheus_client is not None
+
+# senza commands take from a fraction of a second (list) to several minutes
+# (create waiting for the stack)
+COMMAND_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+if ENABLED:
+    REQUEST_LATENCY = prometheus_client.Histogram(
+        'lizzy_request_duration_seconds',
+        'Latency of the API requests by operation and status',
+        ['operation', 'status'])
+    COMMAND_LATENCY = prometheus_client.Histogram(
+        'lizzy_senza_command_duration_seconds',
+        'Latency of the senza commands by subcommand and region, including '
+        'retries of throttled commands',
+        ['subcommand', 'region'], buckets=COMMAND_BUCKETS)
+    COMMANDS_IN_FLIGHT = prometheus_client.Gauge(
+        'lizzy_senza_commands_in_flight',
+        'senza commands running by subcommand',
+        ['subcommand'], multiprocess_mode='livesum')
+    ERRORS = prometheus_client.Counter(
+        'lizzy_errors_total',
+        'Errors answered by the API by exception class',
+        ['exception'])
+    CACHE_REQUESTS = prometheus_client.Counter(
+        'lizzy_cache_requests_total',
+        'Cache lookups by cache and result (hit or miss)',
+        ['cache', 'result'])
+
+
+def observe_command(subcommand: str, region: Optional[str], duration: float):
+    if ENABLED:
+        COMMAND_LATENCY.labels(subcommand, region or '').observe(duration)
+
+
+@contextmanager
+def command_in_flight(subcommand: str) -> Iterator[None]:
+    if not ENABLED:
+        yield
+        return
+    gauge = COMMANDS_IN_FLIGHT.labels(subcommand)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def count_error(error: BaseException):
+    if ENABLED:
+        ERRORS.labels(type(error).__name__).inc()
+
+
+def count_cache_lookup(cache: str, hit: bool):
+    if ENABLED:
+        CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def _operations(specification: dict) -> Dict[str, str]:
+    """
+    Operation ids of the API keyed by the name of their Flask endpoint.
+    """
+    operations = {}
+    for path in specification.get('paths', {}).values():
+        for operation in path.values():
+            if isinstance(operation, dict) and 'operationId' in operation:
+                operation_id = operation['operationId']
+                operations[operation_id.replace('.', '_')] = operation_id
+    return operations
+
+
+def instrument(app: Flask, specification: dict):
+    """
+    Measures the latency of the requests to the operations of the API
+    specification, labeled with their operation id, and serves the metrics
+    at ``/metrics``.
+
+    Streamed responses are measured until their headers are sent.
+    """
+    if not ENABLED:
+        logger.info('prometheus_client is not installed, metrics are disabled.')
+        return
+
+    operations = _operations(specification)
+
+    def start_timer():
+        g.request_started = time.monotonic()
+
+    def observe_request(response):
+        started = getattr(g, 'request_started', None)
+        if started is None:
+            return response
+        endpoint = request.url_rule.endpoint if request.url_rule else None
+        if endpoint is None:
+            operation = 'unknown'
+        else:
+            name = endpoint.rsplit('.', 1)[-1]
+            operation = operations.get(name, name)
+        REQUEST_LATENCY.labels(operation, str(response.status_code)).observe(
+            time.monotonic() - started)
+        return response
+
+    app.before_request(start_timer)
+    app.after_request(observe_request)
+    app.add_url_rule('/metrics', 'metrics_endpoint', expose_metrics)
+
+
+def expose_metrics() -> Response:
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), status=200,
+                    content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+def process_exited(pid: Optional[int]=None):
+    """
+    Forgets the in flight commands of a process that exited, the current one
+    by default, in the multiprocess mode.
+    """
+    if ENABLED and 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
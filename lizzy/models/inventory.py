@@ -0,0 +1,297 @@
+import os
+import time
+import uuid
+from collections import OrderedDict
+from logging import getLogger
+from threading import Condition, Event, Lock, Thread
+from typing import (Callable, Dict, Iterable, List,  # NOQA pylint: disable=unused-import
+                    NamedTuple, Optional, Tuple)
+
+logger = getLogger('lizzy.inventory')  # pylint: disable=invalid-name
+
+
+class Snapshot(NamedTuple):
+    """Stack listing of a region and the time it was read."""
+    refreshed_at: float
+    stacks: List[Dict]
+
+
+class Changes(NamedTuple):
+    """
+    Stacks of a region created, changed and removed after a revision, and the
+    revision they bring the listing to.
+    """
+    revision: str
+    created: List[Dict]
+    changed: List[Dict]
+    removed: List[Dict]
+
+
+StackKey = Tuple[str, str]
+
+
+def stack_key(stack: Dict) -> StackKey:
+    return stack['stack_name'], str(stack['version'])
+
+
+def matches_stack(stack: Dict, stack_name: str,
+                  stack_version: Optional[str]) -> bool:
+    return (stack['stack_name'] == stack_name and
+            (stack_version is None or
+             str(stack['version']) == str(stack_version)))
+
+
+def replace_stack(stacks: List[Dict], stack_name: str,
+                  stack_version: Optional[str],
+                  replacement: Optional[List[Dict]]) -> List[Dict]:
+    """
+    Returns a copy of the stack listing with the stack (or all versions of
+    it when no version is given) replaced.
+    """
+    stacks = [stack for stack in stacks
+              if not matches_stack(stack, stack_name, stack_version)]
+    stacks.extend(replacement or [])
+    return stacks
+
+
+class RevisionLog:
+    """
+    Revisions of the stack listing of a region. The revision increases
+    whenever stacks are created, changed or removed, and the log keeps the
+    revisions each stack was created and last changed at, and the last
+    ``max_removed`` removed stacks.
+
+    Revisions are counted by each process, so their tokens start with a
+    random epoch to tell them apart from the ones of other processes.
+    """
+
+    def __init__(self, max_removed: int=1000):
+        self.max_removed = max_removed
+        self.epoch = uuid.uuid4().hex[:8]
+        self.revision = 0
+        # changes after older revisions were forgotten
+        self.horizon = 0
+        self._stacks = {}  # type: Dict[StackKey, Dict]
+        self._revisions = {}  # type: Dict[StackKey, Tuple[int, int]]
+        self._removed = OrderedDict()  # type: OrderedDict
+
+    @property
+    def token(self) -> str:
+        return '{}.{}'.format(self.epoch, self.revision)
+
+    def update(self, stacks: List[Dict]):
+        current = {stack_key(stack): stack for stack in stacks}
+        created = [key for key in current if key not in self._stacks]
+        changed = [key for key, stack in current.items()
+                   if key in self._stacks and self._stacks[key] != stack]
+        removed = [key for key in self._stacks if key not in current]
+        self._stacks = current
+        if not (created or changed or removed):
+            return
+        self.revision += 1
+        for key in created:
+            self._revisions[key] = (self.revision, self.revision)
+            self._removed.pop(key, None)
+        for key in changed:
+            self._revisions[key] = (self._revisions[key][0], self.revision)
+        for key in removed:
+            del self._revisions[key]
+            self._removed[key] = self.revision
+        while len(self._removed) > self.max_removed:
+            _, revision = self._removed.popitem(last=False)
+            self.horizon = max(self.horizon, revision)
+
+    def changes(self, since: str) -> Optional[Changes]:
+        """
+        Changes after the revision of the token, ``None`` when they are not
+        known because the token is from another process or too old.
+        """
+        epoch, _, revision = since.partition('.')
+        try:
+            since_revision = int(revision)
+        except ValueError:
+            return None
+        if epoch != self.epoch or not self.horizon <= since_revision <= self.revision:
+            return None
+        created = []  # type: List[Dict]
+        changed = []  # type: List[Dict]
+        for key, stack in self._stacks.items():
+            created_at, changed_at = self._revisions[key]
+            if created_at > since_revision:
+                created.append(stack)
+            elif changed_at > since_revision:
+                changed.append(stack)
+        removed = [{'stack_name': stack_name, 'version': version}
+                   for (stack_name, version), removed_at in self._removed.items()
+                   if removed_at > since_revision]
+        return Changes(self.token, created, changed, removed)
+
+
+class InventoryPoller:
+    """
+    Keeps an in-memory snapshot of the stacks of each region, refreshed in a
+    background thread every ``interval`` seconds.
+
+    Snapshots older than ``max_age`` seconds (e.g. because senza keeps
+    failing) are not served. Changes of the snapshots are tracked in a
+    :class:`RevisionLog` per region.
+    """
+
+    def __init__(self, regions: Iterable[str], interval: float,
+                 list_function: Callable[[str], List[Dict]],
+                 max_age: Optional[float]=None):
+        self.regions = list(regions)
+        self.interval = interval
+        self.max_age = max_age or 3 * interval
+        self.list_function = list_function
+        self.errors = {}  # type: Dict[str, str]
+        self._snapshots = {}  # type: Dict[str, Snapshot]
+        self._logs = {}  # type: Dict[str, RevisionLog]
+        self._pid = os.getpid()
+        self._lock = Lock()
+        self._changed = Condition(self._lock)
+        self._stopped = Event()
+        self._thread = None  # type: Thread
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='lizzy-inventory',
+                              daemon=True)
+        self._thread.start()
+        logger.info('Started stack inventory poller.',
+                    extra={'regions': self.regions,
+                           'interval': self.interval})
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.refresh_all()
+            self._stopped.wait(self.interval)
+
+    def refresh_all(self):
+        for region in self.regions:
+            try:
+                self.refresh(region)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to refresh stack inventory.',
+                                 extra={'region': region})
+
+    def refresh(self, region: str) -> Snapshot:
+        try:
+            stacks = self.list_function(region)
+        except Exception as exception:
+            with self._lock:
+                self.errors[region] = str(exception) or type(exception).__name__
+            raise
+        snapshot = Snapshot(time.time(), stacks)
+        with self._lock:
+            self._snapshots[region] = snapshot
+            self._log(region).update(stacks)
+            self._changed.notify_all()
+            self.errors.pop(region, None)
+        return snapshot
+
+    def snapshot(self, region: str) -> Optional[Snapshot]:
+        """
+        Returns the current snapshot of the region or ``None`` when the region
+        is not polled or its snapshot is too old.
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(region)
+        if snapshot is None or time.time() - snapshot.refreshed_at > self.max_age:
+            return None
+        return snapshot
+
+    def age(self, region: str) -> Optional[float]:
+        snapshot = self.snapshot(region)
+        return None if snapshot is None else time.time() - snapshot.refreshed_at
+
+    def update_stack(self, region: str, stack_name: str,
+                     stack_version: Optional[str],
+                     replacement: Optional[List[Dict]]=None):
+        """
+        Replaces a single stack in the snapshot of the region, keeping the
+        snapshot time.
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(region)
+            if snapshot is not None:
+                stacks = replace_stack(snapshot.stacks, stack_name,
+                                       stack_version, replacement)
+                self._snapshots[region] = snapshot._replace(stacks=stacks)
+                self._log(region).update(stacks)
+                self._changed.notify_all()
+
+    def _log(self, region: str) -> RevisionLog:
+        """
+        Revision log of the region, starting a new one for snapshots
+        inherited from the parent of a forked process. Must be called with
+        the lock held.
+        """
+        if self._pid != os.getpid():
+            self._logs = {}
+            self._pid = os.getpid()
+        log = self._logs.get(region)
+        if log is None:
+            log = self._logs[region] = RevisionLog()
+            if region in self._snapshots:
+                log.update(self._snapshots[region].stacks)
+        return log
+
+    def revision(self, region: str) -> Optional[str]:
+        """
+        Token of the revision of the current snapshot of the region, ``None``
+        when it is not served.
+        """
+        if self.snapshot(region) is None:
+            return None
+        with self._lock:
+            return self._log(region).token
+
+    def changes(self, region: str, since: str) -> Optional[Changes]:
+        """
+        Stacks of the snapshot of the region created, changed or removed after
+        the revision of the token, ``None`` when they are not known.
+        """
+        if self.snapshot(region) is None:
+            return None
+        with self._lock:
+            return self._log(region).changes(since)
+
+    def wait_for_change(self, region: str, revision: str,
+                        timeout: float) -> bool:
+        """
+        Waits up to ``timeout`` seconds for the stacks of the region to change
+        after the revision.
+
+        :return: Whether they changed
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self._log(region).token == revision:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.time()
+        with self._lock:
+            return {region: {'age': (now - self._snapshots[region].refreshed_at
+                                     if region in self._snapshots else None),
+                             'stacks': (len(self._snapshots[region].stacks)
+                                        if region in self._snapshots else None),
+                             'error': self.errors.get(region)}
+                    for region in self.regions}
@@ -0,0 +1,75 @@
+"""
+Filtering and keyset pagination of stack listings.
+"""
+
+import base64
+import heapq
+import json
+from typing import (Dict, Iterable, List, NamedTuple,  # NOQA pylint: disable=unused-import
+                    Optional, Tuple)
+
+# Stacks are listed by creation time, ties broken by name, version and region
+SortKey = Tuple[int, str, str, str]
+
+FIELDS = ('creation_time', 'description', 'stack_name', 'status', 'version',
+          'region')
+
+
+def sort_key(stack: Dict, region: str) -> SortKey:
+    """Sort key of a stack dict as listed by senza."""
+    return (int(stack['creation_time']), stack['stack_name'],
+            str(stack['version']), region)
+
+
+def encode_cursor(key: SortKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """
+    :raises ValueError: when the cursor is not one returned by Lizzy
+    """
+    try:
+        creation_time, stack_name, version, region = json.loads(
+            base64.urlsafe_b64decode(cursor.encode()).decode())
+        return int(creation_time), str(stack_name), str(version), str(region)
+    except (TypeError, ValueError, UnicodeDecodeError) as error:
+        raise ValueError('Invalid cursor: {}'.format(cursor)) from error
+
+
+class StackQuery(NamedTuple):
+    """
+    Stacks matching all the given filters, after the ``after`` sort key and
+    at most ``limit`` of them.
+    """
+    statuses: Optional[List[str]] = None
+    name_prefix: Optional[str] = None
+    created_after: Optional[int] = None
+    created_before: Optional[int] = None
+    after: Optional[SortKey] = None
+    limit: Optional[int] = None
+
+    def matches(self, stack: Dict) -> bool:
+        creation_time = int(stack['creation_time'])
+        return ((not self.statuses or stack['status'] in self.statuses) and
+                (not self.name_prefix or
+                 stack['stack_name'].startswith(self.name_prefix)) and
+                (self.created_after is None or
+                 creation_time >= self.created_after) and
+                (self.created_before is None or
+                 creation_time < self.created_before))
+
+    def select(self, stacks: Iterable[Dict], region: str) -> List[Dict]:
+        """
+        The matching stack dicts in listing order, only keeping the first
+        ``limit`` of them in memory.
+        """
+        def key(stack: Dict) -> SortKey:
+            return sort_key(stack, region)
+
+        selected = (stack for stack in stacks
+                    if self.matches(stack) and
+                    (self.after is None or key(stack) > self.after))
+        if self.limit is not None:
+            return heapq.nsmallest(self.limit, selected, key=key)
+        return sorted(selected, key=key)
@@ -1,13 +1,74 @@
-from typing import List, Optional  # NOQA  pylint: disable=unused-import
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock
+from typing import (Callable, ContextManager, Dict, Iterator,  # NOQA pylint: disable=unused-import
+                    List, Optional, Tuple)
 
-from lizzy.exceptions import ObjectNotFound
+from lizzy.exceptions import ExecutionError, ObjectNotFound
 
+from ..apps.cloudformation import CloudFormation
 from ..apps.senza import Senza
+from ..cache import TTLCache
 from ..configuration import config
 from ..util import timestamp_to_uct
+from .inventory import InventoryPoller, matches_stack, replace_stack
+from .query import SortKey, StackQuery
+from .watch import Watcher
 
 REMOVED_STACK = object()
 
+# Parsed `senza list` output keyed by (region, stack references). The entry
+# with empty references is the full inventory of the region.
+STACK_CACHE = TTLCache(ttl=config.stack_cache_ttl,
+                       maxsize=config.stack_cache_size,
+                       name='stack')
+
+
+# Invalidations of each region, listings read while one happened are not
+# cached since they may predate the change
+_GENERATIONS = defaultdict(int)  # type: Dict[str, int]
+_GENERATIONS_LOCK = Lock()
+
+
+@contextmanager
+def _no_admission() -> Iterator[None]:
+    yield
+
+
+def _cache_listing(region: str, key: Tuple, stacks: List[Dict],
+                   generation: int):
+    """
+    Caches a listing of the region read at the generation, unless the region
+    was invalidated since.
+    """
+    with _GENERATIONS_LOCK:
+        if _GENERATIONS[region] == generation:
+            STACK_CACHE.set(key, stacks)
+
+
+def stack_reader(region: str):
+    """
+    Reads the stacks of the region with ``senza list`` or, with
+    ``STACK_BACKEND=cloudformation``, straight from CloudFormation.
+    """
+    if config.stack_backend == 'cloudformation':
+        return CloudFormation(region)
+    return Senza(region)
+
+
+# Regions polled in the background are answered from this snapshot
+INVENTORY = InventoryPoller(regions=(config.inventory_regions or config.regions or
+                                     [config.region]),
+                            interval=config.inventory_refresh_interval,
+                            list_function=lambda region: stack_reader(region).list())
+
+
+# Stacks awaited outside of the inventory are read by one of the requests
+# waiting for them
+WATCHER = Watcher(interval=config.stack_wait_interval)
+
 
 class Stack:
     prefix = 'lizzy_stack'
@@ -19,7 +80,8 @@ class Stack:
                  creation_time: int,
                  description: str,
                  version: str,
-                 status: str):
+                 status: str,
+                 region: Optional[str]=None):
         """
         Stack Model stored in Redis
         :param stack_name: Name of the application
@@ -27,34 +89,218 @@ class Stack:
         :param description: Stack description including parameters
         :param version: Stack Version
         :param status: Stack Status in Cloud Formation
+        :param region: AWS region of the stack, when listing several regions
         """
         self.stack_name = stack_name
         self.creation_time = timestamp_to_uct(creation_time)
         self.description = description
         self.version = version
         self.status = status
+        self.region = region
         self.__cf_stack = None
 
     @classmethod
     def get(cls, stack_name: str, stack_version: str, region: Optional[str]=None) -> 'Stack':
-        stacks = cls.list(stack_name, stack_version, region=region)
+        region = region or config.region
+        snapshot = INVENTORY.snapshot(region)
+        if snapshot is not None:
+            stacks = [stack for stack in snapshot.stacks
+                      if matches_stack(stack, stack_name, stack_version)]
+            if not stacks:
+                raise ObjectNotFound('{}-{}'.format(stack_name, stack_version))
+            return Stack(**stacks[0])
+
+        key = (region, (stack_name, stack_version))
+        stacks = STACK_CACHE.get(key)
+        if stacks is None:
+            generation = _GENERATIONS[region]
+            inventory = STACK_CACHE.peek((region, ()))
+            if inventory is not None:
+                stacks = [stack for stack in inventory
+                          if matches_stack(stack, stack_name, stack_version)]
+            if not stacks:
+                stacks = stack_reader(region).list(stack_name, stack_version)
+            # missing stacks are read again, they may be created any time
+            if stacks:
+                _cache_listing(region, key, stacks, generation)
         if not stacks:
             raise ObjectNotFound('{}-{}'.format(stack_name, stack_version))
         else:
-            return stacks[0]
+            return Stack(**stacks[0])
 
     @classmethod
-    def list(cls, *stack_ref: List[str], region: Optional[str]=None) -> List['Stack']:
+    def list(cls, *stack_ref: List[str], region: Optional[str]=None,
+             query: Optional[StackQuery]=None) -> List['Stack']:
         """
         Returns a List of stack dicts compliant with the API spec.
 
+        With a query, stacks are filtered and paginated before they are
+        built, and returned in listing order.
+
         .. seealso:: lizzy/swagger/lizzy.yaml#/definitions/stack
         """
+        region = region or config.region
+        stacks = None  # type: Optional[List[Dict]]
+        if not stack_ref:
+            snapshot = INVENTORY.snapshot(region)
+            if snapshot is not None:
+                stacks = snapshot.stacks
+
+        if stacks is None:
+            key = (region, tuple(stack_ref))
+            stacks = STACK_CACHE.get(key)
+            if stacks is None:
+                generation = _GENERATIONS[region]
+                stacks = stack_reader(region).list(*stack_ref)
+                _cache_listing(region, key, stacks, generation)
+        if query is not None:
+            stacks = query.select(stacks, region)
+        return [Stack(**stack) for stack in stacks]
+
+    @classmethod
+    def list_regions(cls, regions: List[str], *stack_ref: List[str],
+                     query: Optional[StackQuery]=None) -> Tuple[List['Stack'],
+                                                                Dict[str, ExecutionError]]:
+        """
+        Lists the stacks of several regions concurrently. Stacks are tagged
+        with their region. The query applies to each region.
+
+        :return: Stacks of all regions that could be listed and the errors of
+                 the ones that failed
+        """
+        stacks = []  # type: List[Stack]
+        errors = {}  # type: Dict[str, ExecutionError]
+        with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+            futures = {region: executor.submit(cls.list, *stack_ref,
+                                               region=region, query=query)
+                       for region in regions}
+        for region, future in futures.items():
+            try:
+                region_stacks = future.result()
+            except ExecutionError as exception:
+                errors[region] = exception
+                continue
+            for stack in region_stacks:
+                stack.region = region
+            stacks.extend(region_stacks)
+        return stacks, errors
+
+    @classmethod
+    def refresh(cls, stack_name: str, stack_version: str,
+                region: Optional[str]=None) -> 'Stack':
+        """
+        Reads a single stack and updates it in the cached listings
+        of its region.
+        """
+        region = region or config.region
+        stacks = stack_reader(region).list(stack_name, stack_version)
+        cls.invalidate(stack_name, stack_version, region=region,
+                       replacement=stacks)
+        if stacks:
+            STACK_CACHE.set((region, (stack_name, stack_version)), stacks)
+        if not stacks:
+            raise ObjectNotFound('{}-{}'.format(stack_name, stack_version))
+        return Stack(**stacks[0])
+
+    @classmethod
+    def wait(cls, stack_name: str, stack_version: str, statuses: List[str],
+             timeout: float, region: Optional[str]=None,
+             admit: Optional[Callable[[], ContextManager]]=None) -> 'Stack':
+        """
+        Waits up to ``timeout`` seconds for the stack to reach one of the
+        statuses, returning it as soon as it does or when the timeout expires.
+
+        Stacks of regions in the inventory are checked whenever its snapshot
+        changes. Other stacks are read again every ``STACK_WAIT_INTERVAL``
+        seconds by one of the requests waiting for them, within ``admit``
+        if given. A stack that doesn't exist yet is waited for like one that
+        isn't in the statuses yet.
+
+        :raises ObjectNotFound: when the stack doesn't exist at the end, or
+                                disappears while waiting
+        """
+        region = region or config.region
+        deadline = time.monotonic() + timeout
+        seen = False
+        revision = INVENTORY.revision(region)
+        while revision is not None:
+            try:
+                stack = cls.get(stack_name, stack_version, region=region)
+            except ObjectNotFound:
+                if seen or time.monotonic() >= deadline:
+                    raise
+            else:
+                seen = True
+                if stack.status in statuses or time.monotonic() >= deadline:
+                    return stack
+            INVENTORY.wait_for_change(region, revision,
+                                      max(0.0, deadline - time.monotonic()))
+            revision = INVENTORY.revision(region)
+
+        def read() -> Optional[Stack]:
+            try:
+                with admit() if admit is not None else _no_admission():
+                    return cls.refresh(stack_name, stack_version,
+                                       region=region)
+            except ObjectNotFound:
+                return None
+
+        def done(stack: Optional[Stack]) -> bool:
+            nonlocal seen
+            if stack is None:
+                return seen
+            seen = True
+            return stack.status in statuses
+
+        stack = WATCHER.wait((region, stack_name, stack_version), read, done,
+                             max(0.0, deadline - time.monotonic()))
+        if stack is None:
+            raise ObjectNotFound('{}-{}'.format(stack_name, stack_version))
+        return stack
+
+    @classmethod
+    def invalidate(cls, stack_name: str, stack_version: Optional[str]=None,
+                   region: Optional[str]=None,
+                   replacement: Optional[List[Dict]]=None):
+        """
+        Removes a single stack (or all versions of it when no version is
+        given) from the cached listings and the inventory snapshot of its
+        region, optionally replacing it with fresh data. Listings filtered by
+        stack references are dropped since they might include the stack.
+        """
+        region = region or config.region
+        with _GENERATIONS_LOCK:
+            _GENERATIONS[region] += 1
+        INVENTORY.update_stack(region, stack_name, stack_version, replacement)
+        for key in STACK_CACHE.keys():
+            key_region, stack_ref = key
+            if key_region == region and stack_ref:
+                STACK_CACHE.pop(key)
+        inventory_key = (region, ())
+        inventory = STACK_CACHE.peek(inventory_key)
+        if inventory is not None:
+            STACK_CACHE.replace(inventory_key,
+                                replace_stack(inventory, stack_name,
+                                              stack_version, replacement))
+
+    def sort_key(self, region: str) -> SortKey:
+        """
+        Listing order of the stack, see :func:`lizzy.models.query.sort_key`.
+
+        :param region: Region of the stack when it isn't tagged with it
+        """
+        return (int(self.creation_time.timestamp()), self.stack_name,
+                str(self.version), self.region or region)
 
-        senza = Senza(region or config.region)
-        stacks = [Stack(**stack)
-                  for stack in senza.list(*stack_ref)]
-        return stacks
+    def to_dict(self) -> Dict:
+        stack_dict = {'creation_time': self.creation_time,
+                      'description': self.description,
+                      'stack_name': self.stack_name,
+                      'status': self.status,
+                      'version': self.version}
+        if self.region is not None:
+            stack_dict['region'] = self.region
+        return stack_dict
 
     def generate_id(self) -> str:
         """
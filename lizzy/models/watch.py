@@ -0,0 +1,106 @@
+"""
+Coalesced reads of requests waiting for something to change.
+"""
+
+import time
+from threading import Condition
+from typing import Any, Callable, Dict, Hashable, Optional  # NOQA pylint: disable=unused-import
+
+
+class _Watch:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.waiters = 0
+        self.reading = False
+        self.generation = 0  # increased with each read
+        self.read_at = None  # type: Optional[float]
+        self.result = None  # type: Any
+        self.error = None  # type: Optional[Exception]
+
+
+class Watcher:
+    """
+    Coalesces the reads of requests waiting for the same key, e.g. a stack
+    to reach a status: while requests wait for the key, one of them reads it
+    every ``interval`` seconds and all of them check what it read, so the key
+    is read at the same rate however many requests wait for it.
+    """
+
+    def __init__(self, interval: float,
+                 clock: Callable[[], float]=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.reads = 0
+        self._watches = {}  # type: Dict[Hashable, _Watch]
+        self._condition = Condition()
+
+    def wait(self, key: Hashable, read: Callable[[], Any],
+             done: Callable[[Any], bool], timeout: float) -> Any:
+        """
+        Returns the first result read for the key that is done or, after
+        ``timeout`` seconds, the last one. Errors of the reads are raised to
+        all the requests waiting for the key.
+        """
+        deadline = self.clock() + timeout
+        with self._condition:
+            watch = self._watches.get(key)
+            if watch is None:
+                watch = self._watches[key] = _Watch()
+            watch.waiters += 1
+        try:
+            return self._wait(watch, read, done, deadline)
+        finally:
+            with self._condition:
+                watch.waiters -= 1
+                if not watch.waiters:
+                    del self._watches[key]
+
+    def _wait(self, watch: _Watch, read: Callable[[], Any],
+              done: Callable[[Any], bool], deadline: float) -> Any:
+        checked = 0
+        while True:
+            reader = False
+            with self._condition:
+                while watch.generation == checked:
+                    now = self.clock()
+                    if not watch.reading and (watch.read_at is None or
+                                              now - watch.read_at >= self.interval):
+                        watch.reading = reader = True
+                        break
+                    if checked and now >= deadline:
+                        return watch.result
+                    if watch.reading:
+                        # the first result is awaited even after the deadline
+                        self._condition.wait(deadline - now if deadline > now
+                                             else None)
+                    else:
+                        self._condition.wait(min(deadline, watch.read_at +
+                                                 self.interval) - now)
+
+            if reader:
+                result, error = None, None
+                try:
+                    result = read()
+                except Exception as exception:  # pylint: disable=broad-except
+                    error = exception
+                with self._condition:
+                    watch.result, watch.error = result, error
+                    watch.read_at = self.clock()
+                    watch.generation += 1
+                    watch.reading = False
+                    self.reads += 1
+                    self._condition.notify_all()
+
+            with self._condition:
+                checked = watch.generation
+                result, error = watch.result, watch.error
+            if error is not None:
+                raise error
+            if done(result) or self.clock() >= deadline:
+                return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {'watched': len(self._watches),
+                    'waiting': sum(watch.waiters
+                                   for watch in self._watches.values()),
+                    'reads': self.reads}
@@ -8,7 +8,12 @@ import logging
 import connexion
 import werkzeug.exceptions
 
-from lizzy.api import not_found_path_handler, expose_api_schema, health_check
+from lizzy.api import (HEALTH, not_found_path_handler, expose_api_schema, health_check,
+                       liveness_check)
+from lizzy.apps.executors import get_executor
+from lizzy.jobs import JOBS
+from lizzy.models.stack import INVENTORY
+from . import metrics
 from .serialization import JSONEncoder
 import lizzy.configuration as configuration
 
@@ -24,7 +29,7 @@ def setup_webapp(config: configuration.Configuration):  # pragma: no cover
                         specification_dir='swagger/',
                         arguments=arguments,
                         auth_all_paths=True)
-    app.add_api('lizzy.yaml')
+    api = app.add_api('lizzy.yaml')
 
     flask_app = app.app
     flask_app.json_encoder = JSONEncoder
@@ -40,6 +45,12 @@ def setup_webapp(config: configuration.Configuration):  # pragma: no cover
                            'health_check_endpoint',
                            health_check)
 
+    flask_app.add_url_rule('/health/live',
+                           'liveness_check_endpoint',
+                           liveness_check)
+
+    metrics.instrument(flask_app, api.specification)
+
     return app
 
 
@@ -49,10 +60,24 @@ def main(run=True):  # pragma: no cover
     logger.info('Starting web app')
     app = setup_webapp(config)
     if run:
+        start_background_threads()
         app.run()
     else:
         return app.app
 
 
+def start_background_threads():  # pragma: no cover
+    """
+    Starts the inventory poller, health checker, job workers and the worker
+    processes of the execution backend. Threads don't survive a fork, so
+    application servers forking workers must call it in each worker after
+    the fork.
+    """
+    get_executor(configuration.config.execution_backend).start()
+    INVENTORY.start()
+    HEALTH.start()
+    JOBS.start()
+
+
 if __name__ == '__main__':  # pragma: no cover
     main()
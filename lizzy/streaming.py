@@ -0,0 +1,105 @@
+"""
+Server-Sent Events relaying the output of operations while they run.
+"""
+
+import json
+import queue
+from logging import getLogger
+from threading import Event, Thread
+from typing import Any, Callable, Iterator, Optional  # NOQA pylint: disable=unused-import
+
+from .exceptions import ClientDisconnected
+from .serialization import JSONEncoder
+
+logger = getLogger('lizzy.streaming')  # pylint: disable=invalid-name
+
+MIMETYPE = 'text/event-stream'
+
+# Marks the end of the events in the queue
+_END = object()
+
+
+def format_event(event: str, data: str) -> str:
+    """
+    Formats a Server-Sent Event, each line of ``data`` is sent as a separate
+    data field.
+    """
+    fields = ['event: {}'.format(event)]
+    fields.extend('data: {}'.format(line) for line in data.split('\n'))
+    return '\n'.join(fields) + '\n\n'
+
+
+class OutputStream:
+    """
+    Relays output lines of an operation running in a background thread to
+    the client as ``output`` events, followed by a final ``result`` or
+    ``error`` event.
+
+    At most ``max_pending`` events wait for a slow client, after that the
+    operation waits too, so memory use is bounded no matter how verbose the
+    operation is. Writing a line after the client went away raises
+    :class:`~lizzy.exceptions.ClientDisconnected`, so the command writing it
+    is killed instead of running for nobody. A comment is sent every ``heartbeat`` seconds
+    without events so proxies don't close the connection.
+    """
+
+    def __init__(self, max_pending: int=1000, heartbeat: float=15):
+        self.heartbeat = heartbeat
+        self._events = queue.Queue(maxsize=max_pending)  # type: queue.Queue
+        self._closed = Event()
+
+    def _put(self, item: Any) -> bool:
+        """Queues the item, returns False if the client went away."""
+        while not self._closed.is_set():
+            try:
+                self._events.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def write(self, line: str):
+        """
+        Sends an output line, use it as the ``on_output`` callback.
+
+        :raises ClientDisconnected: when the client went away
+        """
+        if not self._put(format_event('output', line.rstrip('\r\n'))):
+            raise ClientDisconnected()
+
+    def finish(self, event: str, data: Any):
+        """Sends the last event with the JSON encoded data."""
+        self._put(format_event(event, json.dumps(data, cls=JSONEncoder)))
+        self._put(_END)
+
+    def run(self, operation: Callable[['OutputStream'], None]) -> 'OutputStream':
+        """
+        Runs the operation in a background thread, it must call
+        :meth:`finish` when it is done.
+        """
+        def run_operation():
+            try:
+                operation(self)
+            except Exception as exception:  # pylint: disable=broad-except
+                logger.exception('Streamed operation failed unexpectedly.')
+                self.finish('error', {'title': 'Internal Error',
+                                      'detail': str(exception),
+                                      'status': 500})
+
+        Thread(target=run_operation, name='lizzy-stream', daemon=True).start()
+        return self
+
+    def events(self) -> Iterator[str]:
+        try:
+            while True:
+                try:
+                    event = self._events.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event is _END:
+                    return
+                yield event
+        finally:
+            # the client went away or got everything
+            self._closed.set()
@@ -2,6 +2,23 @@
 Expose application to use with uswgi
 """
 
-from .service import main
+import atexit
+
+from . import metrics
+from .service import main, start_background_threads
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:  # not running in uwsgi
+    postfork = None  # pylint: disable=invalid-name
 
 application = main(run=False)  # pylint: disable=invalid-name
+
+# the application is loaded before uwsgi forks its workers, whose background
+# threads are started after the fork
+if postfork is None:
+    start_background_threads()
+else:
+    postfork(start_background_threads)
+
+atexit.register(metrics.process_exited)
@@ -4,8 +4,43 @@ from unittest.mock import MagicMock
 import pytest
 
 from fixtures.senza import mock_senza  # NOQA
+from lizzy.api import HEALTH, IDEMPOTENT_RESPONSES
+from lizzy.apps.aws import CLIENTS
+from lizzy.apps.breaker import BREAKERS
+from lizzy.apps.history import HISTORY
+from lizzy.apps.output import OUTPUTS
+from lizzy.apps.throttling import BUDGET
+from lizzy.models.stack import STACK_CACHE
 
 
 @pytest.fixture(scope='session')
 def debug_level():
     logging.getLogger().setLevel(logging.DEBUG)
+
+
+@pytest.fixture(autouse=True)
+def clear_stack_cache():
+    STACK_CACHE.clear()
+    IDEMPOTENT_RESPONSES.clear()
+    HEALTH.reset()
+    BREAKERS.clear()
+    CLIENTS.clear()
+
+
+@pytest.fixture(autouse=True)
+def aws_budget(monkeypatch, tmpdir):
+    monkeypatch.setattr(BUDGET, 'path', str(tmpdir.join('aws-budget.json')))
+    monkeypatch.setattr(BUDGET, '_stats', {})
+    return BUDGET
+
+
+@pytest.fixture(autouse=True)
+def output_store(monkeypatch, tmpdir):
+    monkeypatch.setattr(OUTPUTS, 'path', str(tmpdir.join('outputs')))
+    return OUTPUTS
+
+
+@pytest.fixture(autouse=True)
+def history(monkeypatch, tmpdir):
+    monkeypatch.setattr(HISTORY, 'path', str(tmpdir.join('history.sqlite')))
+    return HISTORY
@@ -0,0 +1,12 @@
+import pytest
+
+
+def mock_aws():
+    """
+    Mocks AWS with moto: ``mock_aws`` of moto 5 or the CloudFormation mock of
+    older releases, the last ones installable on Python 3.6.
+    """
+    moto = pytest.importorskip('moto')
+    if hasattr(moto, 'mock_aws'):
+        return moto.mock_aws()
+    return moto.mock_cloudformation()
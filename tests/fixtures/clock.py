@@ -0,0 +1,14 @@
+class FakeClock:
+    """
+    Clock of the tests, e.g. for ``time.monotonic``, that only moves when
+    its ``time`` is set or it sleeps.
+    """
+
+    def __init__(self, time: float=0.0):
+        self.time = time
+
+    def __call__(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += seconds
@@ -0,0 +1,16 @@
+import io
+
+
+def pipe_communicate(mock_popen):
+    """
+    Serves the output set with ``communicate.return_value`` through the
+    stdout and stderr pipes of the mocked process too, for commands whose
+    output is read line by line.
+    """
+    mock_type = type(mock_popen)
+    mock_type.stdout = property(
+        lambda mock: io.BytesIO(mock.communicate.return_value[0]))
+    mock_type.stderr = property(
+        lambda mock: io.BytesIO(mock.communicate.return_value[1] or b''))
+    mock_popen.wait.side_effect = lambda: mock_popen.returncode
+    return mock_popen
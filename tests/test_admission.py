@@ -0,0 +1,217 @@
+import threading
+import time
+
+import pytest
+
+from fixtures.clock import FakeClock
+from lizzy.admission import AdmissionController, TokenBucket
+from lizzy.exceptions import Overloaded
+
+
+def controller(**kwargs):
+    limits = dict(concurrency=0, queue_size=0, queue_timeout=0,
+                  user_concurrency=0, rate=0, user_rate=0)
+    limits.update(kwargs)
+    return AdmissionController(**limits)
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)  # one per second, bursts of ten
+    assert all(bucket.take() == 0 for _ in range(10))
+    assert bucket.take() == pytest.approx(1)
+    clock.time = 0.5
+    assert bucket.take() == pytest.approx(0.5)
+    clock.time = 1
+    assert bucket.take() == 0
+    assert not bucket.full
+    clock.time = 100
+    assert bucket.full
+
+
+def test_user_concurrency():
+    admission = controller(user_concurrency=1)
+    with admission.admit('alice'):
+        with pytest.raises(Overloaded) as exc_info:
+            with admission.admit('alice'):
+                pass
+        assert exc_info.value.reason == 'user_concurrency'
+        assert exc_info.value.retry_after >= 1
+        # other users are not affected
+        with admission.admit('bob'):
+            pass
+    with admission.admit('alice'):
+        pass
+    stats = admission.stats()
+    assert stats['admitted'] == 3
+    assert stats['rejected']['user_concurrency'] == 1
+    assert stats['in_flight'] == 0
+
+
+def test_rates():
+    clock = FakeClock()
+    admission = controller(user_rate=6, rate=12, clock=clock)
+    with admission.admit('alice'):
+        pass
+    with pytest.raises(Overloaded) as exc_info:
+        with admission.admit('alice'):
+            pass
+    assert exc_info.value.reason == 'user_rate'
+    assert exc_info.value.retry_after == 10
+
+    with admission.admit('bob'):
+        pass
+    with pytest.raises(Overloaded) as exc_info:
+        with admission.admit('carol'):
+            pass
+    assert exc_info.value.reason == 'rate'
+    assert exc_info.value.retry_after == 5
+
+
+def test_queue():
+    admission = controller(concurrency=1, queue_size=1, queue_timeout=5)
+    release = threading.Event()
+    served = []
+
+    def serve(user):
+        with admission.admit(user):
+            served.append(user)
+            release.wait()
+
+    first = threading.Thread(target=serve, args=('alice',))
+    first.start()
+    while not admission.stats()['in_flight']:
+        time.sleep(0.01)
+    queued = threading.Thread(target=serve, args=('bob',))
+    queued.start()
+    while not admission.stats()['queued']:
+        time.sleep(0.01)
+
+    # the queue is full
+    with pytest.raises(Overloaded) as exc_info:
+        with admission.admit('carol'):
+            pass
+    assert exc_info.value.reason == 'queue_full'
+
+    release.set()
+    first.join()
+    queued.join()
+    assert served == ['alice', 'bob']
+
+
+def test_queue_timeout():
+    admission = controller(concurrency=1, queue_size=1, queue_timeout=0.1)
+    with admission.admit('alice'):
+        with pytest.raises(Overloaded) as exc_info:
+            with admission.admit('bob'):
+                pass
+    assert exc_info.value.reason == 'queue_timeout'
+    assert admission.stats()['queued'] == 0
+
+
+def test_idle():
+    clock = FakeClock()
+    admission = controller(concurrency=1, user_concurrency=1, clock=clock)
+    with admission.admit('alice'):
+        with admission.idle('alice'):
+            assert admission.stats()['in_flight'] == 0
+            clock.time = 30
+            with admission.admit('bob'):
+                clock.time = 32
+            with admission.admit('alice'):
+                pass
+        assert admission.stats()['in_flight'] == 1
+        clock.time = 33
+    assert admission.stats()['in_flight'] == 0
+    # the idle time is not counted in the request durations
+    assert admission.duration < 1.5
+
+
+def test_idle_limit():
+    admission = controller(idle_limit=1)
+    with admission.admit('alice'), admission.idle('alice'):
+        with admission.admit('bob'):
+            with pytest.raises(Overloaded) as exc_info:
+                with admission.idle('bob'):
+                    pass
+            assert exc_info.value.reason == 'idle_full'
+            # the rejected request keeps its slot
+            assert admission.stats()['in_flight'] == 1
+        assert admission.stats()['idle'] == 1
+    assert admission.stats()['idle'] == 0
+    with admission.admit('bob'), admission.idle('bob'):
+        pass
+    assert admission.stats()['rejected']['idle_full'] == 1
+
+
+def test_rejections_keep_rate_tokens():
+    clock = FakeClock()
+    admission = controller(user_concurrency=1, concurrency=1, queue_size=0,
+                           queue_timeout=0.1, user_rate=6, clock=clock)
+    with admission.admit('alice'):
+        # rejected for concurrency before the rate is applied
+        with pytest.raises(Overloaded) as exc_info:
+            with admission.admit('alice'):
+                pass
+        assert exc_info.value.reason == 'user_concurrency'
+        with pytest.raises(Overloaded) as exc_info:
+            with admission.admit('bob'):
+                pass
+        assert exc_info.value.reason == 'queue_full'
+    with admission.admit('bob'):
+        pass
+
+    admission = controller(concurrency=1, queue_size=1, queue_timeout=0.1,
+                           user_rate=6)
+    with admission.admit('carol'):
+        with pytest.raises(Overloaded) as exc_info:
+            with admission.admit('dave'):
+                pass
+        assert exc_info.value.reason == 'queue_timeout'
+    # the token taken while queued was given back
+    with admission.admit('dave'):
+        pass
+
+
+def test_token_bucket_give_back():
+    clock = FakeClock()
+    bucket = TokenBucket(6, clock)  # bursts of one
+    assert bucket.take() == 0
+    bucket.give_back()
+    assert bucket.full
+    bucket.give_back()
+    assert bucket.tokens == 1
+
+
+def test_detach():
+    admission = controller(concurrency=1, queue_size=1, queue_timeout=0.1)
+    with admission.admit('alice'):
+        release = admission.detach('alice')
+    assert admission.stats()['in_flight'] == 1
+    with pytest.raises(Overloaded):
+        with admission.admit('bob'):
+            pass
+    release()
+    assert admission.stats()['in_flight'] == 0
+    with admission.admit('bob'):
+        pass
+
+
+def test_background():
+    admission = controller(concurrency=1, user_concurrency=1)
+    ran = threading.Event()
+
+    def run():
+        with admission.background():
+            ran.set()
+
+    with admission.admit('alice'):
+        job = threading.Thread(target=run)
+        job.start()
+        # waits for the slot instead of being rejected
+        assert not ran.wait(0.1)
+    job.join(5)
+    assert ran.is_set()
+    assert admission.stats()['in_flight'] == 0
+    # background work isn't counted against any user
+    assert not admission.user_in_flight
@@ -1,5 +1,7 @@
 import json
 import os
+import threading
+import time
 from unittest.mock import MagicMock
 from urllib.parse import quote
 
@@ -8,9 +10,15 @@ import pytest
 import requests
 from fixtures.cloud_formation import (BAD_CF_DEFINITION, GOOD_CF_DEFINITION,
                                       GOOD_CF_DEFINITION_WITH_UNUSUAL_AUTOSCALING_RESOURCE)
+from lizzy.admission import AdmissionController
+from lizzy.apps.executors import ExecutionResult
+from lizzy.apps.history import Execution
+from lizzy.apps.output import CommandOutput
 from lizzy.configuration import config
-from lizzy.exceptions import (ExecutionError, SenzaDomainsError,
+from lizzy.exceptions import (CircuitOpen, ClientDisconnected, ExecutionError,
+                              ExecutionTimeout, SenzaDomainsError,
                               SenzaRenderError)
+from lizzy.models.inventory import InventoryPoller
 from lizzy.models.stack import Stack
 from lizzy.service import setup_webapp
 from lizzy.version import VERSION
@@ -296,6 +304,49 @@ def test_new_stack_execution_error(monkeypatch, app, mock_senza):
     error_data = json.loads(request.data.decode())
     assert error_data['detail'] == 'error'
 
+    mock_senza.create.side_effect = ExecutionTimeout(270)
+    request = app.post('/api/stacks',
+                       headers=GOOD_HEADERS,
+                       data=json.dumps(data))  # type: flask.Response
+    assert request.status_code == 504
+    error_data = json.loads(request.data.decode())
+    assert error_data['detail'] == 'Command did not finish in 270 seconds'
+
+
+def test_admission(monkeypatch, app, mock_senza):
+    admission = AdmissionController(concurrency=0, queue_size=0,
+                                    queue_timeout=0, user_concurrency=0,
+                                    rate=0, user_rate=60)
+    monkeypatch.setattr('lizzy.api.ADMISSION', admission)
+
+    for _ in range(10):
+        response = app.get('/api/stacks', headers=GOOD_HEADERS)
+        assert response.status_code == 200
+
+    response = app.get('/api/stacks', headers=GOOD_HEADERS)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    problem = json.loads(response.data.decode())
+    assert problem['title'] == 'Too Many Requests'
+    assert problem['detail'] == 'Too many requests from the user'
+
+    assert admission.stats()['admitted'] == 10
+    assert admission.stats()['rejected']['user_rate'] == 1
+
+    # health checks are always served
+    response = app.get('/health')
+    assert response.status_code == 200
+
+
+def test_circuit_open(app, mock_senza):
+    mock_senza.list.side_effect = CircuitOpen('eu-west-1', 12)
+    response = app.get('/api/stacks', headers=GOOD_HEADERS)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '12'
+    problem = json.loads(response.data.decode())
+    assert problem['title'] == 'Service Unavailable'
+    assert problem['detail'] == 'AWS is unavailable in eu-west-1, retry in 12 seconds'
+
 
 def test_get_stack(app, mock_senza):
     parameters = {'version', 'description', 'stack_name', 'status',
@@ -345,6 +396,368 @@ def test_list_stacks(app, mock_senza):
     mock_senza.list.assert_called_with()
 
 
+def test_list_stacks_pages(app, mock_senza):
+    mock_senza.list.side_effect = lambda *refs: [
+        {'creation_time': 1460635167 + number,
+         'description': 'Lizzy Bus',
+         'stack_name': 'lizzy-bus' if number % 2 else 'lizzy',
+         'status': 'CREATE_COMPLETE' if number < 4 else 'CREATE_IN_PROGRESS',
+         'version': str(number)}
+        for number in reversed(range(5))]
+
+    response = app.get('/api/stacks?limit=2', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert [stack['version'] for stack in json.loads(response.data.decode())] == ['0', '1']
+    cursor = response.headers['X-Lizzy-Next-Cursor']
+
+    response = app.get('/api/stacks?limit=2&cursor={}'.format(quote(cursor)),
+                       headers=GOOD_HEADERS)
+    assert [stack['version'] for stack in json.loads(response.data.decode())] == ['2', '3']
+    cursor = response.headers['X-Lizzy-Next-Cursor']
+
+    response = app.get('/api/stacks?limit=2&cursor={}'.format(quote(cursor)),
+                       headers=GOOD_HEADERS)
+    assert [stack['version'] for stack in json.loads(response.data.decode())] == ['4']
+    assert 'X-Lizzy-Next-Cursor' not in response.headers
+    mock_senza.list.assert_called_once_with()  # pages come from the cache
+
+    response = app.get('/api/stacks?status=CREATE_IN_PROGRESS,ROLLBACK_COMPLETE'
+                       '&fields=stack_name,version', headers=GOOD_HEADERS)
+    assert json.loads(response.data.decode()) == [{'stack_name': 'lizzy',
+                                                   'version': '4'}]
+
+    response = app.get('/api/stacks?name_prefix=lizzy-&created_after={}'.format(
+        quote('2016-04-14T13:59:28+02:00')), headers=GOOD_HEADERS)
+    assert [stack['version'] for stack in json.loads(response.data.decode())] == ['1', '3']
+
+    response = app.get('/api/stacks?cursor=invalid', headers=GOOD_HEADERS)
+    assert response.status_code == 400
+    assert json.loads(response.data.decode())['title'] == 'Invalid Query'
+
+    response = app.get('/api/stacks?limit=0', headers=GOOD_HEADERS)
+    assert response.status_code == 400
+
+    response = app.get('/api/stacks?fields=secret', headers=GOOD_HEADERS)
+    assert response.status_code == 400
+
+
+def test_get_stack_cached(app, mock_senza):
+    response = app.get('/api/stacks/stack-1', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    response = app.get('/api/stacks/stack-1', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    mock_senza.list.assert_called_once_with('stack', '1')
+
+    # changing the stack reads it again
+    response = app.patch('/api/stacks/stack-1', headers=GOOD_HEADERS,
+                         data=json.dumps({'new_scale': 3}))
+    assert response.status_code == 202
+    assert mock_senza.list.call_count == 2
+    response = app.get('/api/stacks/stack-1', headers=GOOD_HEADERS)
+    assert mock_senza.list.call_count == 2
+
+    response = app.delete('/api/stacks/stack-1', headers=GOOD_HEADERS,
+                          data=json.dumps({}))
+    assert response.status_code == 204
+    response = app.get('/api/stacks/stack-1', headers=GOOD_HEADERS)
+    assert mock_senza.list.call_count == 3
+
+
+@pytest.fixture
+def inventory(monkeypatch):
+    stacks = [{'creation_time': 1460635167,
+               'description': 'Lizzy Bus (ImageVersion: 257)',
+               'stack_name': 'inventory',
+               'status': 'CREATE_COMPLETE',
+               'version': '1'}]
+    poller = InventoryPoller([config.region], interval=60,
+                             list_function=lambda region: stacks)
+    poller.refresh(config.region)
+    monkeypatch.setattr('lizzy.api.INVENTORY', poller)
+    monkeypatch.setattr('lizzy.models.stack.INVENTORY', poller)
+    return poller
+
+
+def test_stacks_from_inventory(monkeypatch, app, mock_senza, inventory):
+    monkeypatch.setenv('DEPLOYER_SCOPE', 'can_deploy')
+    monkeypatch.setenv('TOKEN_URL', 'https://tokenservice.example.com')
+    response = app.get('/api/stacks', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    payload = json.loads(response.data.decode())
+    assert [stack['stack_name'] for stack in payload] == ['inventory']
+    assert float(response.headers['X-Lizzy-Inventory-Age']) < 60
+
+    response = app.get('/api/stacks/inventory-1', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert 'X-Lizzy-Inventory-Age' in response.headers
+
+    response = app.get('/api/stacks/inventory-2', headers=GOOD_HEADERS)
+    assert response.status_code == 404
+
+    response = app.get('/api/status', headers=GOOD_HEADERS)
+    payload = json.loads(response.data.decode())
+    assert payload['status'] == 'OK'
+    assert payload['inventory'][config.region]['stacks'] == 1
+
+    assert not mock_senza.list.called
+
+    # other regions are not in the inventory
+    response = app.get('/api/stacks?region=eu-central-1', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert 'X-Lizzy-Inventory-Age' not in response.headers
+    mock_senza.list.assert_called_once_with()
+
+
+def test_conditional_get(app, mock_senza):
+    response = app.get('/api/stacks/stack-1', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = app.get('/api/stacks/stack-1',
+                       headers=dict(GOOD_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    response = app.get('/api/stacks', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    response = app.get('/api/stacks',
+                       headers=dict(GOOD_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+
+    # other query arguments have other entity tags
+    response = app.get('/api/stacks?fields=stack_name',
+                       headers=dict(GOOD_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_inventory_changes(monkeypatch, app, mock_senza, inventory):
+    response = app.get('/api/stacks', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    revision = response.headers['X-Lizzy-Inventory-Revision']
+
+    response = app.get('/api/stacks?since={}'.format(revision), headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert json.loads(response.data.decode()) == {'revision': revision,
+                                                  'full': False,
+                                                  'created': [],
+                                                  'changed': [],
+                                                  'removed': []}
+
+    inventory.list_function = lambda region: [
+        {'creation_time': 1460635167,
+         'description': 'Lizzy Bus (ImageVersion: 257)',
+         'stack_name': 'inventory',
+         'status': 'UPDATE_IN_PROGRESS',
+         'version': '1'},
+        {'creation_time': 1460635168,
+         'description': 'Lizzy Bus (ImageVersion: 258)',
+         'stack_name': 'inventory',
+         'status': 'CREATE_COMPLETE',
+         'version': '2'}]
+    inventory.refresh(config.region)
+
+    response = app.get('/api/stacks',
+                       headers=dict(GOOD_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert len(json.loads(response.data.decode())) == 2
+
+    response = app.get('/api/stacks?since={}&fields=version,status'.format(revision),
+                       headers=GOOD_HEADERS)
+    changes = json.loads(response.data.decode())
+    assert changes['revision'] == response.headers['X-Lizzy-Inventory-Revision']
+    assert changes['created'] == [{'version': '2', 'status': 'CREATE_COMPLETE'}]
+    assert changes['changed'] == [{'version': '1', 'status': 'UPDATE_IN_PROGRESS'}]
+    assert changes['removed'] == []
+
+    # stacks that don't match the query anymore are removed
+    response = app.get('/api/stacks?since={}&status=CREATE_COMPLETE'.format(revision),
+                       headers=GOOD_HEADERS)
+    changes = json.loads(response.data.decode())
+    assert [stack['version'] for stack in changes['created']] == ['2']
+    assert changes['changed'] == []
+    assert changes['removed'] == [{'stack_name': 'inventory', 'version': '1'}]
+
+    # unknown revisions list all the stacks
+    response = app.get('/api/stacks?since=unknown', headers=GOOD_HEADERS)
+    changes = json.loads(response.data.decode())
+    assert changes['full']
+    assert len(changes['created']) == 2
+
+    response = app.get('/api/stacks?since={}&limit=1'.format(revision),
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 400
+    assert not mock_senza.list.called
+
+
+def test_wait_for_status(monkeypatch, app, mock_senza):
+    monkeypatch.setattr('lizzy.models.stack.WATCHER.interval', 0.05)
+    statuses = iter(['CREATE_IN_PROGRESS', 'CREATE_IN_PROGRESS', 'CREATE_COMPLETE'])
+    mock_senza.list.side_effect = lambda *refs: [{'creation_time': 1460635167,
+                                                  'description': '',
+                                                  'stack_name': 'stack',
+                                                  'status': next(statuses),
+                                                  'version': '1'}]
+
+    response = app.get('/api/stacks/stack-1?wait_for=CREATE_COMPLETE,ROLLBACK_COMPLETE',
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert json.loads(response.data.decode())['status'] == 'CREATE_COMPLETE'
+    assert mock_senza.list.call_count == 3
+    assert lizzy.api.ADMISSION.stats()['in_flight'] == 0
+
+    # the timeout is capped by STACK_WAIT_TIMEOUT
+    monkeypatch.setenv('STACK_WAIT_TIMEOUT', '0')
+    mock_senza.list.side_effect = None
+    started = time.monotonic()
+    response = app.get('/api/stacks/stack-1?wait_for=DELETE_COMPLETE&timeout=60',
+                       headers=GOOD_HEADERS)
+    assert time.monotonic() - started < 5
+    assert json.loads(response.data.decode())['status'] == 'CREATE_COMPLETE'
+
+    mock_senza.list.side_effect = lambda *refs: []
+    response = app.get('/api/stacks/stack-1?wait_for=DELETE_COMPLETE',
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 404
+
+
+def test_wait_for_status_in_inventory(app, mock_senza, inventory):
+    updated = dict(inventory.snapshot(config.region).stacks[0],
+                   status='UPDATE_COMPLETE')
+    timer = threading.Timer(0.1, inventory.update_stack,
+                            [config.region, 'inventory', '1', [updated]])
+    timer.start()
+    response = app.get('/api/stacks/inventory-1?wait_for=UPDATE_COMPLETE&timeout=5',
+                       headers=GOOD_HEADERS)
+    timer.join()
+    assert response.status_code == 200
+    assert json.loads(response.data.decode())['status'] == 'UPDATE_COMPLETE'
+
+    response = app.get('/api/stacks/inventory-1?wait_for=DELETE_COMPLETE&timeout=0',
+                       headers=GOOD_HEADERS)
+    assert json.loads(response.data.decode())['status'] == 'UPDATE_COMPLETE'
+    assert not mock_senza.list.called
+
+
+def test_wait_for_stack_to_exist(monkeypatch, app, mock_senza):
+    monkeypatch.setattr('lizzy.models.stack.WATCHER.interval', 0.05)
+    listings = iter([[], [], [{'creation_time': 1460635167,
+                               'description': '',
+                               'stack_name': 'stack',
+                               'status': 'CREATE_IN_PROGRESS',
+                               'version': '1'}], []])
+    mock_senza.list.side_effect = lambda *refs: next(listings)
+
+    # not created yet
+    response = app.get('/api/stacks/stack-1?wait_for=CREATE_COMPLETE&timeout=5',
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 404
+    # created and then deleted before the timeout
+    assert mock_senza.list.call_count == 4
+
+
+def test_wait_for_stack_readmitted(monkeypatch, app, mock_senza):
+    monkeypatch.setattr('lizzy.models.stack.WATCHER.interval', 0.05)
+    admitted = []
+    admit = lizzy.api.ADMISSION.admit
+    monkeypatch.setattr(lizzy.api.ADMISSION, 'admit',
+                        lambda user: admitted.append(user) or admit(user))
+    mock_senza.list.side_effect = None
+
+    response = app.get('/api/stacks/stack-1?wait_for=DELETE_COMPLETE&timeout=1',
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    # the request and each read of the stack while waiting
+    assert len(admitted) == 1 + mock_senza.list.call_count
+    assert lizzy.api.ADMISSION.stats()['in_flight'] == 0
+
+
+def test_wait_for_stack_waiters_limited(monkeypatch, app, mock_senza):
+    admission = AdmissionController(concurrency=0, queue_size=0,
+                                    queue_timeout=0, user_concurrency=0,
+                                    rate=0, user_rate=0, idle_limit=1)
+    monkeypatch.setattr('lizzy.api.ADMISSION', admission)
+
+    with admission.admit('other'), admission.idle('other'):
+        response = app.get('/api/stacks/stack-1?wait_for=DELETE_COMPLETE&timeout=60',
+                           headers=GOOD_HEADERS)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    problem = json.loads(response.data.decode())
+    assert problem['detail'] == 'Too many requests waiting for stacks'
+    assert not mock_senza.list.called
+    assert admission.stats()['in_flight'] == 0
+
+
+def test_wait_for_stack_to_exist_in_inventory(app, mock_senza, inventory):
+    created = {'creation_time': 1460635167,
+               'description': '',
+               'stack_name': 'created',
+               'status': 'CREATE_COMPLETE',
+               'version': '1'}
+    timer = threading.Timer(0.1, inventory.update_stack,
+                            [config.region, 'created', '1', [created]])
+    timer.start()
+    response = app.get('/api/stacks/created-1?wait_for=CREATE_COMPLETE&timeout=5',
+                       headers=GOOD_HEADERS)
+    timer.join()
+    assert response.status_code == 200
+    assert json.loads(response.data.decode())['status'] == 'CREATE_COMPLETE'
+
+    response = app.get('/api/stacks/missing-1?wait_for=CREATE_COMPLETE&timeout=1',
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 404
+    assert not mock_senza.list.called
+
+
+def test_list_stacks_multiple_regions(monkeypatch, app, mock_senza):
+    monkeypatch.setenv('REGIONS', "['eu-west-1', 'eu-central-1', 'us-east-1']")
+    senzas = {}
+
+    def senza_for_region(region):
+        senza = MagicMock()
+        senza.list.return_value = [{'creation_time': 1460635167 + len(senzas),
+                                    'description': '',
+                                    'stack_name': 'lizzy',
+                                    'status': 'CREATE_COMPLETE',
+                                    'version': region}]
+        if region == 'us-east-1':
+            senza.list.side_effect = ExecutionError(1, 'Throttling')
+        senzas[region] = senza
+        return senza
+
+    monkeypatch.setattr('lizzy.models.stack.Senza', senza_for_region)
+
+    response = app.get('/api/stacks?region=eu-west-1,eu-central-1',
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    payload = json.loads(response.data.decode())
+    assert {(stack['region'], stack['version']) for stack in payload} == {
+        ('eu-west-1', 'eu-west-1'), ('eu-central-1', 'eu-central-1')}
+    assert payload[0]['creation_time'] < payload[1]['creation_time']
+    assert 'X-Lizzy-Failed-Regions' not in response.headers
+
+    senzas.clear()
+    response = app.get('/api/stacks?region=all', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert set(senzas) == {'us-east-1'}  # the other regions are cached
+    payload = json.loads(response.data.decode())
+    assert len(payload) == 2
+    assert response.headers['X-Lizzy-Failed-Regions'] == 'us-east-1'
+
+    # only failures
+    response = app.get('/api/stacks?region=us-east-1,all', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    response = app.get('/api/stacks?region=us-east-1,us-east-1', headers=GOOD_HEADERS)
+    assert response.status_code == 500
+
+    response = app.get('/api/stacks?region=eu-west-1,abc', headers=GOOD_HEADERS)
+    assert response.status_code == 400
+
+
 def test_get_stack_404(app, mock_senza):
     mock_senza.list = lambda *a, **k: []
     request = app.get('/api/stacks/stack-404', headers=GOOD_HEADERS)
@@ -408,6 +821,113 @@ def test_delete_error(app, mock_senza, dry_run, force):
                                               dry_run=dry_run, force=force)
 
 
+def parse_events(response) -> list:
+    events = []
+    for block in response.get_data().decode().split('\n\n'):
+        if block and not block.startswith(':'):
+            event, data = block.split('\n', 1)
+            events.append((event[len('event: '):], data[len('data: '):]))
+    return events
+
+
+def test_streamed_output(app, mock_senza):
+    def create(*args, on_output):
+        on_output('Generating Cloud Formation template.. OK')
+        on_output('Creating stack abc-1.. OK')
+        return 'whole output'
+
+    mock_senza.create.side_effect = create
+    data = {'keep_stacks': 0, 'new_traffic': 100, 'stack_version': '1',
+            'senza_yaml': 'SenzaInfo:\n  StackName: abc', 'dry_run': True}
+    headers = dict(GOOD_HEADERS, Accept='text/event-stream')
+    response = app.post('/api/stacks', headers=headers, data=json.dumps(data))
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert 'X-Lizzy-Output' not in response.headers
+    events = parse_events(response)
+    assert events[:2] == [('output', 'Generating Cloud Formation template.. OK'),
+                          ('output', 'Creating stack abc-1.. OK')]
+    event, result = events[2]
+    assert event == 'result'
+    result = json.loads(result)
+    assert result['status'] == 201
+    assert result['body']['status'] == 'DRY-RUN'
+
+    def remove(*args, on_output, **kwargs):
+        on_output('Deleting stack stack-1..')
+        raise ExecutionError(1, 'cannot delete')
+
+    mock_senza.remove.side_effect = remove
+    response = app.delete('/api/stacks/stack-1', headers=headers,
+                          data=json.dumps({}))
+    assert response.status_code == 200
+    events = parse_events(response)
+    assert events[0] == ('output', 'Deleting stack stack-1..')
+    event, problem = events[1]
+    assert event == 'error'
+    problem = json.loads(problem)
+    assert problem['status'] == 500
+    assert problem['detail'] == 'cannot delete'
+
+    mock_senza.respawn_instances.side_effect = (
+        lambda *args, on_output: on_output('Respawning instances..'))
+    response = app.patch('/api/stacks/stack-1', headers=headers,
+                         data=json.dumps({'new_ami_image': 'ami-2323'}))
+    events = parse_events(response)
+    assert events[0] == ('output', 'Respawning instances..')
+    assert events[1][0] == 'result'
+    assert json.loads(events[1][1])['status'] == 202
+
+
+def test_streamed_output_keeps_admission_slot(app, mock_senza):
+    release = threading.Event()
+
+    def remove(*args, on_output, **kwargs):
+        on_output('Deleting stack stack-1..')
+        release.wait(5)
+        return 'removed'
+
+    mock_senza.remove.side_effect = remove
+    headers = dict(GOOD_HEADERS, Accept='text/event-stream')
+    response = app.delete('/api/stacks/stack-1', headers=headers,
+                          data=json.dumps({}))
+    assert response.status_code == 200
+    # senza still runs after the response started
+    assert lizzy.api.ADMISSION.stats()['in_flight'] == 1
+    release.set()
+    assert parse_events(response)[-1][0] == 'result'
+    assert lizzy.api.ADMISSION.stats()['in_flight'] == 0
+
+
+def test_streamed_operation_stopped_on_disconnect(app, mock_senza):
+    release = threading.Event()
+    stopped = threading.Event()
+
+    def remove(*args, on_output, **kwargs):
+        on_output('Deleting stack stack-1..')
+        release.wait(5)
+        try:
+            on_output('Stack deleted.')
+        except ClientDisconnected:
+            stopped.set()
+            raise
+        return 'removed'
+
+    mock_senza.remove.side_effect = remove
+    headers = dict(GOOD_HEADERS, Accept='text/event-stream')
+    response = app.delete('/api/stacks/stack-1', headers=headers,
+                          data=json.dumps({}))
+    assert response.status_code == 200
+    # the client goes away while senza runs
+    response.close()
+    release.set()
+    assert stopped.wait(5)
+    deadline = time.monotonic() + 5
+    while lizzy.api.ADMISSION.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert lizzy.api.ADMISSION.stats()['in_flight'] == 0
+
+
 def test_patch(monkeypatch, app, mock_senza):
     data = {'new_traffic': 50}
 
@@ -479,6 +999,168 @@ def test_patch(monkeypatch, app, mock_senza):
                         data=json.dumps(data))
     assert request.status_code == 500
 
+def wait_for_job(app, location):
+    for _ in range(200):
+        response = app.get(location, headers=GOOD_HEADERS)
+        job = json.loads(response.data.decode())
+        if job['state'] in ('SUCCEEDED', 'FAILED'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('Job did not finish')
+
+
+def test_async_operations(app, mock_senza):
+    async_headers = dict(GOOD_HEADERS, Prefer='respond-async')
+    data = {'keep_stacks': 0,
+            'new_traffic': 100,
+            'stack_version': '42',
+            'senza_yaml': 'SenzaInfo:\n  StackName: abc'}
+    response = app.post('/api/stacks', headers=async_headers,
+                        data=json.dumps(data))
+    assert response.status_code == 202
+    job = json.loads(response.data.decode())
+    assert job['operation'] == 'create_stack'
+    assert response.headers['Location'].endswith('/api/jobs/' + job['id'])
+
+    job = wait_for_job(app, response.headers['Location'])
+    assert job['state'] == 'SUCCEEDED'
+    assert job['output'] == 'output'
+    assert job['result']['stack_name'] == 'abc'
+    assert job['result']['version'] == '42'
+    assert job['started_at'] and job['finished_at']
+    mock_senza.create.assert_called_once_with('SenzaInfo:\n  StackName: abc',
+                                              '42', [], False, False,
+                                              ['LizzyKeepStacks=0',
+                                               'LizzyTargetTraffic=100'])
+
+    mock_senza.scale.return_value = 'scaled'
+    response = app.patch('/api/stacks/abc-42', headers=async_headers,
+                         data=json.dumps({'new_scale': 3}))
+    assert response.status_code == 202
+    job = wait_for_job(app, response.headers['Location'])
+    assert job['operation'] == 'patch_stack'
+    assert job['state'] == 'SUCCEEDED'
+    assert job['output'] == 'scaled'
+    mock_senza.scale.assert_called_once_with('abc', '42', 3)
+
+    mock_senza.remove.side_effect = ExecutionError(1, 'cannot delete')
+    response = app.delete('/api/stacks/abc-42', headers=async_headers,
+                          data=json.dumps({}))
+    assert response.status_code == 202
+    job = wait_for_job(app, response.headers['Location'])
+    assert job['operation'] == 'delete_stack'
+    assert job['state'] == 'FAILED'
+    assert job['error'] == {'title': 'Execution Error',
+                            'detail': 'cannot delete'}
+
+    response = app.get('/api/jobs/does-not-exist', headers=GOOD_HEADERS)
+    assert response.status_code == 404
+    response = app.get('/api/jobs/' + job['id'])
+    assert response.status_code == 401
+
+
+def test_async_operations_admitted(monkeypatch, mock_senza):
+    monkeypatch.setattr(lizzy.api.ADMISSION, 'concurrency', 1)
+    release = lizzy.api.ADMISSION.detach('someone')
+    operation = lizzy.api.JOBS.operations['delete_stack']
+    job = threading.Thread(target=operation, kwargs={
+        'stack_id': 'abc-42', 'dry_run': False, 'force': False,
+        'region': config.region})
+    job.start()
+    # the job waits for a free admission slot
+    job.join(0.2)
+    assert not mock_senza.remove.called
+    release()
+    job.join(5)
+    assert mock_senza.remove.called
+    assert lizzy.api.ADMISSION.stats()['in_flight'] == 0
+
+
+def test_async_queue_full(monkeypatch, app, mock_senza):
+    monkeypatch.setattr(lizzy.api.JOBS, 'queue_size', 0)
+    response = app.delete('/api/stacks/abc-42',
+                          headers=dict(GOOD_HEADERS, Prefer='respond-async'),
+                          data=json.dumps({}))
+    assert response.status_code == 503
+
+
+def test_idempotent_create(app, mock_senza):
+    data = {'keep_stacks': 0,
+            'new_traffic': 100,
+            'stack_version': '42',
+            'senza_yaml': 'SenzaInfo:\n  StackName: abc'}
+    headers = dict(GOOD_HEADERS, **{'Idempotency-Key': 'deploy-abc-42'})
+    response = app.post('/api/stacks', headers=headers, data=json.dumps(data))
+    assert response.status_code == 201
+    assert 'X-Lizzy-Idempotent-Replayed' not in response.headers
+    stack = json.loads(response.data.decode())
+
+    # retries get the stored response without running senza again
+    response = app.post('/api/stacks', headers=headers, data=json.dumps(data))
+    assert response.status_code == 201
+    assert response.headers['X-Lizzy-Idempotent-Replayed'] == 'true'
+    assert json.loads(response.data.decode()) == stack
+    assert mock_senza.create.call_count == 1
+
+    # the same key can't be used for another request
+    response = app.post('/api/stacks', headers=headers,
+                        data=json.dumps(dict(data, stack_version='43')))
+    assert response.status_code == 422
+    assert mock_senza.create.call_count == 1
+
+    # other keys run the operation
+    response = app.post('/api/stacks', headers=dict(GOOD_HEADERS, **{'Idempotency-Key': 'other'}),
+                        data=json.dumps(data))
+    assert response.status_code == 201
+    assert mock_senza.create.call_count == 2
+
+
+def test_idempotent_errors(app, mock_senza):
+    headers = dict(GOOD_HEADERS, **{'Idempotency-Key': 'scale-abc-42'})
+    data = json.dumps({'new_scale': 3})
+
+    # server errors are not stored
+    mock_senza.scale.side_effect = ExecutionError(1, 'throttled')
+    response = app.patch('/api/stacks/abc-42', headers=headers, data=data)
+    assert response.status_code == 500
+    mock_senza.scale.side_effect = None
+    response = app.patch('/api/stacks/abc-42', headers=headers, data=data)
+    assert response.status_code == 202
+    assert 'X-Lizzy-Idempotent-Replayed' not in response.headers
+
+    # client errors are
+    mock_senza.list = lambda *a, **k: []
+    headers['Idempotency-Key'] = 'scale-missing-1'
+    response = app.patch('/api/stacks/missing-1', headers=headers, data=data)
+    assert response.status_code == 404
+    response = app.patch('/api/stacks/missing-1', headers=headers, data=data)
+    assert response.status_code == 404
+    assert response.headers['X-Lizzy-Idempotent-Replayed'] == 'true'
+    assert mock_senza.scale.call_count == 3
+
+
+def test_idempotent_async(app, mock_senza):
+    headers = dict(GOOD_HEADERS, Prefer='respond-async',
+                   **{'Idempotency-Key': 'delete-abc-42'})
+    mock_senza.remove.return_value = 'removed'
+    first = app.delete('/api/stacks/abc-42', headers=headers, data=json.dumps({}))
+    assert first.status_code == 202
+    # DELETE is idempotent already, the header is ignored
+    second = app.delete('/api/stacks/abc-42', headers=headers, data=json.dumps({}))
+    assert second.headers['Location'] != first.headers['Location']
+
+    headers['Idempotency-Key'] = 'scale-abc-42'
+    mock_senza.scale.return_value = 'scaled'
+    first = app.patch('/api/stacks/abc-42', headers=headers,
+                      data=json.dumps({'new_scale': 3}))
+    second = app.patch('/api/stacks/abc-42', headers=headers,
+                       data=json.dumps({'new_scale': 3}))
+    assert second.status_code == 202
+    assert second.headers['Location'] == first.headers['Location']
+    wait_for_job(app, first.headers['Location'])
+    mock_senza.scale.assert_called_once_with('abc', '42', 3)
+
+
 def test_get_traffic(monkeypatch, app, mock_senza):
     traffic_output_from_senza = [
         {
@@ -547,6 +1229,14 @@ def test_application_status_endpoint(app, mock_senza):
 
     payload = json.loads(response.data.decode())
     assert payload['status'] == 'OK'
+    assert set(payload['stack_cache']) == {'hits', 'misses', 'hit_ratio',
+                                           'size', 'maxsize', 'ttl'}
+    assert set(payload['coalesced_reads']) == {'executions', 'coalesced',
+                                               'in_flight'}
+    assert set(payload['stack_watches']) == {'watched', 'waiting', 'reads'}
+    assert payload['health']['healthy'] is True
+    assert payload['health']['checked_at']
+    assert payload['health']['consecutive_failures'] == 0
 
 
 def test_application_status_endpoint_when_nok(app, mock_senza):
@@ -580,3 +1270,87 @@ def test_health_check_failing(app, mock_senza):
 
     response = app.get('/health')
     assert response.status_code == 500
+
+
+def test_health_check_served_from_memory(app, mock_senza):
+    mock_senza.list = MagicMock()
+
+    for _ in range(3):
+        assert app.get('/health').status_code == 200
+    response = app.get('/api/status', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert mock_senza.list.call_count == 1
+
+
+def test_liveness_check_endpoint(app, mock_senza):
+    mock_senza.list = MagicMock(side_effect=ExecutionError(2, "error"))
+
+    response = app.get('/health/live')
+    assert response.status_code == 200
+    mock_senza.list.assert_not_called()
+
+
+def test_execution_output(app, mock_senza, output_store):
+    stored = output_store.create()
+    stored.write('Generating Cloud Formation template.. OK\n')
+    stored.close()
+    output = CommandOutput('Generating Cloud Formation template.. OK')
+    output.execution_id = stored.execution_id
+    mock_senza.remove.return_value = output
+
+    response = app.delete('/api/stacks/stack-1', headers=GOOD_HEADERS,
+                          data=json.dumps({}))
+    assert response.status_code == 204
+    assert response.headers['X-Lizzy-Execution-Id'] == stored.execution_id
+
+    response = app.get('/api/executions/{}/output'.format(stored.execution_id),
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert response.headers['X-Lizzy-Version'] == CURRENT_VERSION
+    assert response.get_data(as_text=True) == \
+        'Generating Cloud Formation template.. OK\n'
+
+    response = app.get('/api/executions/{}/output'.format('0' * 32),
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 404
+
+    response = app.get('/api/executions/not-an-id/output',
+                       headers=GOOD_HEADERS)
+    assert response.status_code in (400, 404)
+
+
+def test_execution_timings(app, history):
+    execution = Execution('senza', 'list', [], 'eu-west-1')
+    execution.attempted(ExecutionResult(0, '[]', ''), 2)
+    history.record(execution)
+
+    response = app.get('/api/executions/timings?subcommand=list',
+                       headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    body = json.loads(response.get_data(as_text=True))
+    assert body['window'] == 3600
+    timing, = body['timings']
+    assert timing['subcommand'] == 'list'
+    assert timing['region'] == 'eu-west-1'
+    assert timing['count'] == 1
+
+    response = app.get('/api/executions/timings?subcommand=create',
+                       headers=GOOD_HEADERS)
+    assert json.loads(response.get_data(as_text=True))['timings'] == []
+
+
+def test_metrics(app, mock_senza):
+    prometheus_client = pytest.importorskip('prometheus_client')
+    labels = {'operation': 'lizzy.api.get_stack', 'status': '200'}
+    count = prometheus_client.REGISTRY.get_sample_value(
+        'lizzy_request_duration_seconds_count', labels) or 0
+
+    response = app.get('/api/stacks/stack-1', headers=GOOD_HEADERS)
+    assert response.status_code == 200
+    assert prometheus_client.REGISTRY.get_sample_value(
+        'lizzy_request_duration_seconds_count', labels) == count + 1
+
+    response = app.get('/metrics')
+    assert response.status_code == 200
+    assert 'lizzy_request_duration_seconds_bucket{' in response.get_data(as_text=True)
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import MagicMock
 import json
 
+from fixtures.popen import pipe_communicate
 from lizzy.apps.common import Application
 from lizzy.exceptions import ExecutionError
 
@@ -11,8 +12,8 @@ def popen(monkeypatch):
     mock_popen = MagicMock()
     mock_popen.return_value = mock_popen
     mock_popen.returncode = 0
-    monkeypatch.setattr('lizzy.apps.common.Popen', mock_popen)
-    return mock_popen
+    monkeypatch.setattr('lizzy.apps.executors.Popen', mock_popen)
+    return pipe_communicate(mock_popen)
 
 
 def test_json_output(monkeypatch, popen):
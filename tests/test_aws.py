@@ -0,0 +1,72 @@
+import os
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from fixtures.aws import mock_aws
+from lizzy.apps.aws import ClientRegistry
+
+pytest.importorskip('moto')
+
+
+@pytest.fixture
+def credentials(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+
+
+def test_clients_are_shared(credentials):
+    registry = ClientRegistry(max_pool_connections=4)
+    client = registry.client('cloudformation', 'eu-west-1')
+    assert registry.client('cloudformation', 'eu-west-1') is client
+    assert registry.client('cloudformation', 'eu-central-1') is not client
+    assert registry.client('autoscaling', 'eu-west-1') is not client
+    assert client.meta.config.max_pool_connections == 4
+
+    stats = registry.stats()
+    assert stats['created'] == 3
+    assert stats['reused'] == 1
+    assert set(stats['clients']) == {'cloudformation:eu-west-1',
+                                     'cloudformation:eu-central-1',
+                                     'autoscaling:eu-west-1'}
+
+
+def test_credentials_resolved_once():
+    session = MagicMock()
+    registry = ClientRegistry(session_factory=lambda: session)
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(
+        registry.client('cloudformation', 'eu-west-1'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    session.get_credentials.assert_called_once_with()
+    session.client.assert_called_once()
+    assert all(client is clients[0] for client in clients)
+
+
+def test_forked_process(monkeypatch):
+    sessions = []
+
+    def session_factory():
+        sessions.append(MagicMock())
+        return sessions[-1]
+
+    registry = ClientRegistry(session_factory=session_factory)
+    client = registry.client('cloudformation', 'eu-west-1')
+    child_pid = os.getpid() + 1
+    monkeypatch.setattr('lizzy.apps.aws.os.getpid', lambda: child_pid)
+    assert registry.client('cloudformation', 'eu-west-1') is not client
+    assert len(sessions) == 2
+
+
+def test_connection_reuse(credentials):
+    registry = ClientRegistry()
+    with mock_aws():
+        client = registry.client('cloudformation', 'eu-west-1')
+        for _ in range(3):
+            client.list_stacks()
+    stats = registry.stats()['clients']['cloudformation:eu-west-1']
+    assert set(stats) == {'requests', 'connections', 'reused_connections'}
+    assert stats['reused_connections'] == stats['requests'] - stats['connections']
@@ -0,0 +1,118 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from fixtures.clock import FakeClock
+from lizzy.apps.breaker import (CLOSED, HALF_OPEN, OPEN, BREAKERS,
+                                CircuitBreaker, CircuitBreakers, unavailable)
+from lizzy.apps.executors import ExecutionResult
+from lizzy.apps.senza import Senza
+from lizzy.exceptions import CircuitOpen, SenzaTrafficError
+
+UNAVAILABLE = ExecutionResult(1, 'botocore.exceptions.EndpointConnectionError: '
+                                 'Could not connect to the endpoint URL', '')
+NOT_FOUND = ExecutionResult(1, 'Stack lizzy-1 does not exist', '')
+OK = ExecutionResult(0, '[]', '')
+
+
+def test_unavailable():
+    assert unavailable(UNAVAILABLE)
+    assert unavailable(ExecutionResult(255, '', 'ServiceUnavailable'))
+    assert not unavailable(NOT_FOUND)
+    assert not unavailable(OK)
+
+
+def test_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker('eu-west-1', 2, 30, clock)
+    breaker.acquire()
+    breaker.record(UNAVAILABLE)
+    breaker.acquire()
+    # failures caused by the request don't count
+    breaker.record(NOT_FOUND)
+    assert breaker.consecutive_failures == 0
+    breaker.acquire()
+    breaker.record(UNAVAILABLE)
+    breaker.acquire()
+    breaker.record(UNAVAILABLE)
+    assert breaker.state == OPEN
+
+    clock.time = 10
+    with pytest.raises(CircuitOpen) as exc_info:
+        breaker.acquire()
+    assert exc_info.value.retry_after == 20
+    assert exc_info.value.circuit == 'eu-west-1'
+
+    # a single probe after the reset timeout
+    clock.time = 30
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert breaker.stats()['retry_after'] == 30
+
+    clock.time = 60
+    breaker.acquire()
+    breaker.record(OK)
+    assert breaker.state == CLOSED
+    breaker.acquire()
+    assert breaker.stats() == {'state': CLOSED, 'consecutive_failures': 0,
+                               'trips': 2, 'rejected': 2, 'retry_after': 0}
+
+
+def test_cancelled_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker('eu-west-1', 1, 30, clock)
+    breaker.failure()
+    clock.time = 30
+    breaker.acquire()
+    breaker.cancel()
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+
+
+def test_disabled_breaker():
+    breaker = CircuitBreaker('eu-west-1', 0, 30)
+    for _ in range(10):
+        breaker.acquire()
+        breaker.failure()
+    assert breaker.state == CLOSED
+
+
+def test_scopes():
+    breakers = CircuitBreakers(1, 30)
+    assert breakers.get('eu-west-1', 'list') is breakers.get('eu-west-1', 'create')
+    assert breakers.get('eu-west-1', 'list') is not breakers.get('eu-central-1', 'list')
+
+    breakers = CircuitBreakers(1, 30, scope='command')
+    assert breakers.get('eu-west-1', 'list') is not breakers.get('eu-west-1', 'create')
+    assert set(breakers.stats()) == {'eu-west-1:list', 'eu-west-1:create'}
+
+
+def test_senza_fails_fast(monkeypatch):
+    popen = MagicMock()
+    popen.return_value = popen
+    popen.returncode = 1
+    popen.communicate.return_value = UNAVAILABLE.stdout.encode(), b''
+    monkeypatch.setattr('lizzy.apps.executors.Popen', popen)
+    monkeypatch.setattr(BREAKERS, 'failure_threshold', 2)
+
+    senza = Senza('eu-west-1')
+    for _ in range(2):
+        with pytest.raises(SenzaTrafficError):
+            senza.traffic('lizzy', 'v1', 50)
+    popen.reset_mock()
+
+    with pytest.raises(CircuitOpen):
+        senza.traffic('lizzy', 'v1', 50)
+    with pytest.raises(CircuitOpen):
+        senza.list()
+    assert not popen.called
+
+    # other regions are not affected
+    popen.returncode = 0
+    popen.communicate.return_value = b'[]', b''
+    assert Senza('eu-central-1').list() == []
+    assert BREAKERS.stats()['eu-west-1']['state'] == OPEN
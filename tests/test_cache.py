@@ -0,0 +1,63 @@
+from fixtures.clock import FakeClock
+from lizzy.cache import TTLCache
+
+
+def test_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, maxsize=10, clock=clock)
+    cache.set('key', 'value')
+    assert cache.get('key') == 'value'
+
+    clock.time = 9.9
+    assert cache.get('key') == 'value'
+
+    clock.time = 10
+    assert cache.get('key') is None
+    assert cache.get('key', 'default') == 'default'
+
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['hit_ratio'] == 0.5
+    assert stats['size'] == 0
+
+
+def test_maxsize():
+    cache = TTLCache(ttl=10, maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # b is now the least recently used
+    cache.set('c', 3)
+    assert cache.peek('b') is None
+    assert cache.peek('a') == 1
+    assert cache.peek('c') == 3
+    assert sorted(cache.keys()) == ['a', 'c']
+
+
+def test_peek_replace_pop():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, maxsize=10, clock=clock)
+    cache.set('key', 'value')
+    assert cache.peek('key') == 'value'
+    assert cache.stats()['hits'] == 0
+
+    clock.time = 5
+    cache.replace('key', 'new value')
+    cache.replace('missing', 'value')
+    assert cache.peek('missing') is None
+
+    clock.time = 10  # replacing doesn't extend the expiry time
+    assert cache.peek('key') is None
+
+    cache.set('key', 'value')
+    assert cache.pop('key') == 'value'
+    assert cache.pop('key') is None
+
+
+def test_disabled():
+    cache = TTLCache(ttl=0, maxsize=10)
+    cache.set('key', 'value')
+    assert cache.get('key') is None
+
+    cache.clear()
+    assert cache.stats()['misses'] == 0
@@ -0,0 +1,131 @@
+import calendar
+import json
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+import pytz
+from botocore.exceptions import ClientError, EndpointConnectionError
+from fixtures.aws import mock_aws
+from lizzy.apps.breaker import BREAKERS
+from lizzy.apps.cloudformation import (CloudFormation, matches_any,
+                                       stack_references, to_stack_dict)
+from lizzy.exceptions import ExecutionError, Throttled
+from lizzy.models.stack import Stack
+
+pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+TEMPLATE = json.dumps({'Description': 'Lizzy Bus (ImageVersion: 257)',
+                       'Resources': {'Handle': {
+                           'Type': 'AWS::CloudFormation::WaitConditionHandle'}}})
+
+
+@pytest.fixture
+def cloud_formation(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_SESSION_TOKEN', 'testing')
+    with mock_aws():
+        client = boto3.client('cloudformation', region_name='eu-west-1')
+        for stack_name in ('lizzy-bus-257', 'lizzy-bus-258', 'other-v1'):
+            client.create_stack(StackName=stack_name, TemplateBody=TEMPLATE)
+        client.create_stack(StackName='deleted-1', TemplateBody=TEMPLATE)
+        client.delete_stack(StackName='deleted-1')
+        yield client
+
+
+def test_stack_references():
+    assert stack_references([]) == []
+    assert stack_references(['lizzy-bus']) == [('lizzy-bus', None)]
+    assert stack_references(['lizzy-bus', '257', 'v2', 'other']) == [
+        ('lizzy-bus', '257'), ('lizzy-bus', 'v2'), ('other', None)]
+
+
+def test_matches_any():
+    assert matches_any('lizzy-bus-257', [('lizzy-bus', None)])
+    assert matches_any('lizzy-bus-257', [('lizzy-.*', '25[0-9]')])
+    assert not matches_any('lizzy-bus-257', [('lizzy-bus', '258')])
+    assert not matches_any('lizzy-bus-257', [('lizzy', None)])
+    assert matches_any('noversion', [('noversion', None)])
+
+
+def test_to_stack_dict():
+    created = datetime(2016, 4, 14, 11, 59, 27, tzinfo=pytz.utc)
+    summary = {'StackName': 'lizzy-bus-257',
+               'StackStatus': 'CREATE_COMPLETE',
+               'CreationTime': created,
+               'TemplateDescription': 'Lizzy Bus (ImageVersion: 257)'}
+    # the same fields senza list writes
+    assert to_stack_dict(summary) == {
+        'stack_name': 'lizzy-bus',
+        'version': '257',
+        'status': 'CREATE_COMPLETE',
+        'creation_time': calendar.timegm(created.timetuple()),
+        'description': 'Lizzy Bus (ImageVersion: 257)'}
+    assert to_stack_dict(summary)['creation_time'] == 1460635167
+
+
+def test_list(cloud_formation):
+    reader = CloudFormation('eu-west-1', client=cloud_formation)
+    stacks = reader.list()
+    assert [(stack['stack_name'], stack['version']) for stack in stacks] == [
+        ('lizzy-bus', '257'), ('lizzy-bus', '258'), ('other', 'v1')]
+    assert stacks[0]['status'] == 'CREATE_COMPLETE'
+    assert stacks[0]['description'] == 'Lizzy Bus (ImageVersion: 257)'
+    assert isinstance(stacks[0]['creation_time'], int)
+
+    assert [stack['version'] for stack in reader.list('lizzy-bus')] == ['257', '258']
+    assert [stack['version'] for stack in reader.list('lizzy-.*', '25[8]')] == ['258']
+
+
+def test_get(cloud_formation, monkeypatch):
+    reader = CloudFormation('eu-west-1', client=cloud_formation)
+    listed = reader.list()
+    # a single stack is described instead of listing all of them
+    monkeypatch.setattr(reader, '_list', None)
+    assert reader.list('lizzy-bus', '257') == [listed[0]]
+    assert reader.list('lizzy-bus', '999') == []
+    assert reader.list('deleted', '1') == []
+
+
+def client_error(code, status):
+    return ClientError({'Error': {'Code': code, 'Message': 'Failed'},
+                        'ResponseMetadata': {'HTTPStatusCode': status}},
+                       'DescribeStacks')
+
+
+def test_errors():
+    client = MagicMock()
+    reader = CloudFormation('eu-west-1', client=client)
+
+    client.describe_stacks.side_effect = client_error('AccessDenied', 403)
+    with pytest.raises(ExecutionError) as error:
+        reader.list('lizzy-bus', '257')
+    assert error.value.error == 'AccessDenied'
+
+    client.describe_stacks.side_effect = client_error('Throttling', 400)
+    with pytest.raises(Throttled):
+        reader.list('lizzy-bus', '257')
+    assert BREAKERS.stats()['eu-west-1']['consecutive_failures'] == 0
+
+    client.describe_stacks.side_effect = client_error('InternalFailure', 500)
+    with pytest.raises(ExecutionError):
+        reader.list('lizzy-bus', '257')
+    client.describe_stacks.side_effect = EndpointConnectionError(
+        endpoint_url='https://cloudformation.eu-west-1.amazonaws.com')
+    with pytest.raises(ExecutionError) as error:
+        reader.list('lizzy-bus', '257')
+    assert error.value.error == 'EndpointConnectionError'
+    assert BREAKERS.stats()['eu-west-1']['consecutive_failures'] == 2
+
+
+def test_stack_backend(cloud_formation, monkeypatch):
+    monkeypatch.setattr('lizzy.models.stack.config.stack_backend',
+                        'cloudformation')
+    monkeypatch.setattr('lizzy.apps.cloudformation.CLIENTS.client',
+                        lambda service, region: cloud_formation)
+    stack = Stack.get('lizzy-bus', '258', region='eu-west-1')
+    assert stack.stack_name == 'lizzy-bus'
+    assert stack.version == '258'
+    assert len(Stack.list(region='eu-west-1')) == 3
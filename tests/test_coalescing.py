@@ -0,0 +1,148 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from lizzy.apps.coalescing import SingleFlight
+from lizzy.apps.executors import ExecutionResult
+from lizzy.apps.senza import Senza
+from lizzy.exceptions import SenzaTrafficError
+
+
+def run_concurrently(function, count=5):
+    results = []
+    errors = []
+
+    def target():
+        try:
+            results.append(function())
+        except Exception as exception:
+            errors.append(exception)
+
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def blocking_function(started: threading.Event, release: threading.Event,
+                      result=None, error=None):
+    def function():
+        started.set()
+        release.wait()
+        if error:
+            raise error
+        return result
+    return function
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    function = MagicMock(wraps=blocking_function(started, release, result=[42]))
+
+    leader = threading.Thread(target=lambda: flight.do('key', function))
+    leader.start()
+    started.wait()
+
+    followers = threading.Thread(target=lambda: run_concurrently(
+        lambda: flight.do('key', function), count=4))
+    followers.start()
+    while flight.stats()['coalesced'] < 4:
+        pass
+    assert flight.stats()['in_flight'] == 1
+    release.set()
+    leader.join()
+    followers.join()
+
+    assert function.call_count == 1
+    assert flight.stats() == {'executions': 1, 'coalesced': 4, 'in_flight': 0}
+
+    # finished calls are not reused
+    assert flight.do('key', lambda: 'new') == 'new'
+
+
+def test_single_flight_shares_error():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    function = blocking_function(started, release, error=ValueError('error'))
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', function)
+        except ValueError as error:
+            errors.append(error)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.stats()['coalesced'] < 1:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+
+
+def test_single_flight_different_keys():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    assert flight.stats()['executions'] == 2
+
+
+@pytest.fixture
+def slow_executor():
+    executor = MagicMock()
+    release = threading.Event()
+
+    def execute(command, merge_stderr, on_output=None):
+        release.wait(timeout=0.2)
+        return ExecutionResult(0, '[{"identifier": "lizzy-1"}]', '')
+
+    executor.execute.side_effect = execute
+    return executor
+
+
+def test_senza_reads_coalesced(slow_executor):
+    def list_stacks():
+        return Senza('eu-west-1', executor=slow_executor).list()
+
+    results, errors = run_concurrently(list_stacks)
+    assert not errors
+    assert len(results) == 5
+    assert slow_executor.execute.call_count == 1
+
+    # different regions are not coalesced
+    slow_executor.execute.reset_mock()
+    for region in ('eu-west-1', 'eu-central-1'):
+        run_concurrently(lambda: Senza(region, executor=slow_executor).domains('lizzy'),
+                         count=2)
+    assert slow_executor.execute.call_count == 2
+
+    slow_executor.execute.reset_mock()
+    results, _ = run_concurrently(
+        lambda: Senza('eu-west-1', executor=slow_executor).traffic('lizzy'))
+    assert results[0] == [{'identifier': 'lizzy-1'}]
+    assert slow_executor.execute.call_count == 1
+
+
+def test_senza_traffic_changes_not_coalesced(slow_executor):
+    run_concurrently(lambda: Senza('eu-west-1', executor=slow_executor).traffic('lizzy', '1', 50),
+                     count=3)
+    assert slow_executor.execute.call_count == 3
+
+
+def test_senza_read_errors_shared():
+    executor = MagicMock()
+    executor.execute.return_value = ExecutionResult(1, 'error', '')
+    with pytest.raises(SenzaTrafficError):
+        Senza('eu-west-1', executor=executor).traffic('lizzy')
@@ -0,0 +1,389 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from lizzy.apps import executors
+from lizzy.apps.common import Application
+from lizzy.apps.executors import (AsyncioExecutor, ExecutionResult,
+                                  InProcessExecutor, SubprocessExecutor,
+                                  WorkerPoolExecutor, get_executor)
+from lizzy.exceptions import ExecutionError, ExecutionTimeout
+
+
+@pytest.fixture
+def inprocess():
+    executor = InProcessExecutor()
+
+    def fake_main():
+        command = sys.argv[1]
+        if command == 'echo':
+            print(' '.join(sys.argv[2:]))
+            print('warning', file=sys.stderr)
+        elif command == 'exit':
+            print('bye')
+            sys.exit(int(sys.argv[2]))
+        elif command == 'die':
+            sys.exit('fatal message')
+        elif command == 'crash':
+            raise RuntimeError('boom')
+        elif command == 'prompt':
+            print(sys.stdin.read() == '')
+        elif command == 'count':
+            for number in range(int(sys.argv[2])):
+                try:
+                    print(number)
+                except Exception:  # tools may carry on after errors
+                    pass
+
+    executor.entry_points['fake'] = fake_main
+    return executor
+
+
+def test_get_executor():
+    assert isinstance(get_executor('subprocess'), SubprocessExecutor)
+    assert isinstance(get_executor('inprocess'), InProcessExecutor)
+    assert get_executor('inprocess') is get_executor('inprocess')
+    assert isinstance(get_executor('asyncio'), AsyncioExecutor)
+    with pytest.raises(ValueError):
+        get_executor('teleport')
+
+
+def test_inprocess_output(inprocess):
+    result = inprocess.execute(['fake', 'echo', 'a', 'b'], merge_stderr=False)
+    assert result == ExecutionResult(0, 'a b\n', 'warning\n')
+
+    result = inprocess.execute(['fake', 'echo', 'a', 'b'], merge_stderr=True)
+    assert result == ExecutionResult(0, 'a b\nwarning\n', '')
+
+    result = inprocess.execute(['fake', 'prompt'], merge_stderr=True)
+    assert result.stdout == 'True\n'
+
+    # the standard streams are restored
+    assert sys.argv[0] != 'fake'
+
+
+def test_inprocess_exit_codes(inprocess):
+    result = inprocess.execute(['fake', 'exit', '0'], merge_stderr=True)
+    assert result == ExecutionResult(0, 'bye\n', '')
+
+    result = inprocess.execute(['fake', 'exit', '3'], merge_stderr=True)
+    assert result == ExecutionResult(3, 'bye\n', '')
+
+    result = inprocess.execute(['fake', 'die'], merge_stderr=False)
+    assert result == ExecutionResult(1, '', 'fatal message\n')
+
+    result = inprocess.execute(['fake', 'crash'], merge_stderr=False)
+    assert result.returncode == 1
+    assert 'RuntimeError: boom' in result.stderr
+
+
+def test_inprocess_application(inprocess):
+    app = Application('fake', executor=inprocess)
+    assert app._execute('echo', 'hello') == 'hello\nwarning\n'
+
+    with pytest.raises(ExecutionError) as exc_info:
+        app._execute('exit', '2')
+    assert exc_info.value.error == 2
+    assert exc_info.value.output == 'bye'
+
+
+def test_inprocess_senza():
+    app = Application('senza', executor=InProcessExecutor())
+    output = app._execute('list', '--help')
+    assert 'List Cloud Formation stacks' in output
+
+    with pytest.raises(ValueError):
+        Application('does-not-exist', executor=InProcessExecutor())._execute('x')
+
+
+def pool_main():
+    """Fake command of the pool workers, imported by them by name."""
+    command = sys.argv[1]
+    if command == 'pid':
+        print(os.getpid())
+    elif command == 'sleep':
+        time.sleep(float(sys.argv[2]))
+        print(os.getpid())
+    elif command == 'stream':
+        print(os.getpid(), flush=True)
+        time.sleep(30)
+    elif command == 'kill':
+        os._exit(9)
+    elif command == 'exit':
+        print('bye', file=sys.stderr)
+        sys.exit(4)
+
+
+@pytest.fixture
+def pool():
+    executor = WorkerPoolExecutor(size=2, max_commands=3, max_memory=1024,
+                                  preload=[])
+    executor.entry_points['fake'] = pool_main
+    yield executor
+    executor.close()
+
+
+def test_pool_execute(pool):
+    result = pool.execute(['fake', 'pid'], merge_stderr=True)
+    assert result.returncode == 0
+    worker_pid = int(result.stdout)
+    assert worker_pid != os.getpid()
+    # forked by the fork server, not by this process
+    with open('/proc/{}/stat'.format(worker_pid)) as stat:
+        assert int(stat.read().rsplit(')', 1)[1].split()[1]) != os.getpid()
+
+    # the worker is reused
+    result = pool.execute(['fake', 'pid'], merge_stderr=True)
+    assert int(result.stdout) == worker_pid
+
+    result = pool.execute(['fake', 'exit'], merge_stderr=False)
+    assert result == ExecutionResult(4, '', 'bye\n')
+
+    # recycled after max_commands
+    result = pool.execute(['fake', 'pid'], merge_stderr=True)
+    assert int(result.stdout) != worker_pid
+
+
+def test_pool_forks_in_its_thread(monkeypatch, pool):
+    forked_by = []
+    worker_class = executors.PoolWorker
+
+    def worker(*args):
+        forked_by.append(threading.current_thread().name)
+        return worker_class(*args)
+
+    monkeypatch.setattr(executors, 'PoolWorker', worker)
+    pool.start()
+    deadline = time.monotonic() + 5
+    while pool.idle_workers.qsize() < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # all the workers are ready before the first command
+    assert pool.idle_workers.qsize() == 2
+
+    pool.max_commands = 1
+    pool.execute(['fake', 'pid'], merge_stderr=True)
+    pool.execute(['fake', 'pid'], merge_stderr=True)
+    assert forked_by == ['lizzy-pool'] * len(forked_by)
+    assert len(forked_by) >= 3
+
+def test_pool_recycle_memory(pool):
+    pool.max_memory = 1
+    first = pool.execute(['fake', 'pid'], merge_stderr=True)
+    second = pool.execute(['fake', 'pid'], merge_stderr=True)
+    assert first.stdout != second.stdout
+
+
+def test_pool_worker_crash(pool):
+    result = pool.execute(['fake', 'kill'], merge_stderr=True)
+    assert result.returncode == 9
+    assert 'exited unexpectedly' in result.stdout
+
+    # a new worker replaces the dead one
+    result = pool.execute(['fake', 'pid'], merge_stderr=True)
+    assert result.returncode == 0
+
+
+def test_pool_concurrency(pool):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        pool.execute(['fake', 'sleep', '0.2'], merge_stderr=True)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 4
+    # never more workers than the pool size
+    assert len({result.stdout for result in results}) == 2
+
+
+def process_alive(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as stat:
+            # zombies are dead processes waiting to be reaped
+            return stat.read().split()[2] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def wait_until_dead(pid, timeout=2):
+    deadline = time.monotonic() + timeout
+    while process_alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not process_alive(pid)
+
+
+@pytest.fixture
+def asyncio_executor():
+    return AsyncioExecutor(timeout=5)
+
+
+def test_asyncio_execute(asyncio_executor):
+    command = ['sh', '-c', 'echo out; echo err >&2; exit 3']
+    result = asyncio_executor.execute(command, merge_stderr=False)
+    assert result == ExecutionResult(3, 'out\n', 'err\n')
+
+    result = asyncio_executor.execute(command, merge_stderr=True)
+    assert result == ExecutionResult(3, 'out\nerr\n', '')
+
+    app = Application('echo', executor=asyncio_executor)
+    assert app._execute('hello') == 'hello\n'
+
+
+def test_asyncio_timeout(asyncio_executor, tmpdir):
+    pid_file = str(tmpdir.join('pid'))
+    # the child started by the command is killed too
+    command = ['sh', '-c', 'sleep 30 & echo $! > {}; wait'.format(pid_file)]
+    started = time.monotonic()
+    with pytest.raises(ExecutionTimeout) as exc_info:
+        asyncio_executor.wait(asyncio_executor.run(command, merge_stderr=True,
+                                                   timeout=0.5))
+    assert time.monotonic() - started < 5
+    assert exc_info.value.timeout == 0.5
+    assert isinstance(exc_info.value, ExecutionError)
+    with open(pid_file) as pid:
+        assert wait_until_dead(int(pid.read()))
+
+
+def test_asyncio_cancel(asyncio_executor, tmpdir):
+    pid_file = str(tmpdir.join('pid'))
+    command = ['sh', '-c', 'echo $$ > {}; sleep 30'.format(pid_file)]
+    future = asyncio.run_coroutine_threadsafe(
+        asyncio_executor.run(command, merge_stderr=True),
+        asyncio_executor.loop)
+    while not os.path.exists(pid_file) or not open(pid_file).read():
+        time.sleep(0.01)
+    future.cancel()
+    with open(pid_file) as pid:
+        assert wait_until_dead(int(pid.read()))
+
+
+def test_asyncio_long_lines(asyncio_executor, tmpdir):
+    command = ['sh', '-c', "head -c 200000 /dev/zero | tr '\\0' x; echo; printf end"]
+    streamed = []
+    result = asyncio_executor.execute(command, merge_stderr=True,
+                                      on_output=streamed.append)
+    assert result.returncode == 0
+    assert streamed == ['x' * 200000 + '\n', 'end']
+
+    def fail(line):
+        raise RuntimeError('output callback failed')
+
+    pid_file = str(tmpdir.join('pid'))
+    command = ['sh', '-c', 'echo $$ > {}; echo started; sleep 30'.format(pid_file)]
+    with pytest.raises(RuntimeError):
+        asyncio_executor.execute(command, merge_stderr=True, on_output=fail)
+    with open(pid_file) as pid:
+        assert wait_until_dead(int(pid.read()))
+
+
+def test_asyncio_concurrent_commands(asyncio_executor):
+    async def run_all():
+        return await asyncio.gather(*[
+            asyncio_executor.run(['sh', '-c', 'sleep 0.5; echo {}'.format(number)],
+                                 merge_stderr=True)
+            for number in range(3)])
+
+    started = time.monotonic()
+    results = asyncio_executor.wait(run_all())
+    assert [result.stdout for result in results] == ['0\n', '1\n', '2\n']
+    assert time.monotonic() - started < 1.4
+
+    # commands of several threads, e.g. regions listed concurrently, are
+    # awaited together by the event loop
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        asyncio_executor.execute(['sh', '-c', 'sleep 0.5'], merge_stderr=True)))
+               for _ in range(3)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 3
+    assert time.monotonic() - started < 1.4
+
+
+def test_output_streamed(inprocess, pool, asyncio_executor):
+    script = 'echo one; sleep 0.1; echo two >&2; printf three'
+    for executor in (SubprocessExecutor(), asyncio_executor):
+        for merge_stderr, lines in ((True, ['one\n', 'two\n', 'three']),
+                                    (False, ['one\n', 'three'])):
+            streamed = []
+            result = executor.execute(['sh', '-c', script], merge_stderr,
+                                      on_output=streamed.append)
+            assert streamed == lines
+            # relayed lines aren't kept
+            assert result.stdout == ''
+
+    streamed = []
+    result = inprocess.execute(['fake', 'echo', 'a', 'b'], merge_stderr=True,
+                               on_output=streamed.append)
+    assert streamed == ['a b\n', 'warning\n']
+    assert result == ExecutionResult(0, '', '')
+
+    streamed = []
+    result = pool.execute(['fake', 'exit'], merge_stderr=True,
+                          on_output=streamed.append)
+    assert streamed == ['bye\n']
+    assert result == ExecutionResult(4, '', '')
+
+
+def test_output_callback_failure_stops_command(inprocess, pool, tmpdir):
+    def fail(line):
+        raise RuntimeError('client went away')
+
+    pid_file = str(tmpdir.join('pid'))
+    command = ['sh', '-c', 'echo $$ > {}; echo started; exec sleep 30'.format(pid_file)]
+    with pytest.raises(RuntimeError):
+        SubprocessExecutor().execute(command, merge_stderr=True, on_output=fail)
+    with open(pid_file) as pid:
+        assert wait_until_dead(int(pid.read()))
+
+    streamed = []
+
+    def fail_once(line):
+        streamed.append(line)
+        raise RuntimeError('client went away')
+
+    for merge_stderr in (True, False):
+        streamed.clear()
+        with pytest.raises(RuntimeError):
+            inprocess.execute(['fake', 'count', '100'], merge_stderr,
+                              on_output=fail_once)
+        assert streamed == ['0\n']
+    # the standard streams are restored
+    assert sys.argv[0] != 'fake'
+
+    pids = []
+
+    def fail_pool(line):
+        pids.append(int(line))
+        raise RuntimeError('client went away')
+
+    with pytest.raises(RuntimeError):
+        pool.execute(['fake', 'stream'], merge_stderr=True, on_output=fail_pool)
+    assert wait_until_dead(pids[0])
+    # the worker is replaced
+    assert pool.execute(['fake', 'pid'], merge_stderr=True).returncode == 0
+
+
+def test_output_streamed_while_running(tmpdir):
+    release = tmpdir.join('release')
+    script = 'echo started; while [ ! -e {} ]; do sleep 0.01; done; echo done'
+    streamed = []
+
+    def on_output(line):
+        streamed.append(line)
+        # the command only finishes once the first line was relayed
+        release.write('')
+
+    app = Application('sh', executor=SubprocessExecutor())
+    output = app._execute('-c', script.format(release), on_output=on_output)
+    assert streamed == ['started\n', 'done\n']
+    assert output == 'started\ndone\n'
@@ -0,0 +1,116 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from fixtures.clock import FakeClock
+from lizzy.exceptions import ExecutionError
+from lizzy.health import HealthChecker
+
+
+def test_results_are_served_from_memory():
+    clock = FakeClock()
+    check = MagicMock()
+    health = HealthChecker(check, interval=30, clock=clock)
+
+    result = health.result()
+    assert result.healthy
+    assert result.error is None
+    assert result.latency == 0
+    assert check.call_count == 1
+
+    clock.time = 29
+    assert health.result() is result
+    assert check.call_count == 1
+
+    clock.time = 30
+    assert health.result() is not result
+    assert check.call_count == 2
+
+
+def test_failure_streaks():
+    clock = FakeClock()
+    check = MagicMock(side_effect=ExecutionError(1, 'Rate exceeded'))
+    health = HealthChecker(check, interval=0, clock=clock)
+
+    for _ in range(3):
+        result = health.result()
+    assert not result.healthy
+    assert result.error == 'Rate exceeded'
+
+    stats = health.stats()
+    assert stats['healthy'] is False
+    assert stats['checks'] == 3
+    assert stats['failures'] == 3
+    assert stats['consecutive_failures'] == 3
+    assert stats['consecutive_successes'] == 0
+
+    check.side_effect = RuntimeError('boom')
+    assert health.check().error == 'boom'
+    check.side_effect = None
+    assert health.check().healthy
+    stats = health.stats()
+    assert stats['consecutive_failures'] == 0
+    assert stats['consecutive_successes'] == 1
+    assert stats['failures'] == 4
+
+    health.reset()
+    assert health.stats()['checks'] == 0
+    assert health.stats()['checked_at'] is None
+
+
+def test_background_checks():
+    check = MagicMock()
+    health = HealthChecker(check, interval=60)
+    health.start()
+    assert health.running
+    health.stop()
+    assert not health.running
+    assert check.call_count == 1
+    assert health.stats()['healthy'] is True
+
+    disabled = HealthChecker(check, interval=0)
+    disabled.start()
+    assert not disabled.running
+
+
+def test_background_results_never_check_inline():
+    threads = []
+
+    def check():
+        threads.append(threading.current_thread().name)
+        time.sleep(0.1)
+
+    health = HealthChecker(check, interval=0.2)
+    health.start()
+    try:
+        latencies = []
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            assert health.result().healthy
+            latencies.append(time.monotonic() - started)
+            time.sleep(0.01)
+    finally:
+        health.stop()
+    assert len(threads) > 2
+    assert set(threads) == {'lizzy-health'}
+    # only the first probe waits, for the first outcome
+    assert max(latencies[1:]) < 0.05
+
+
+def test_background_results_overdue():
+    clock = FakeClock()
+    health = HealthChecker(MagicMock(), interval=60, clock=clock)
+    health.start()
+    try:
+        result = health.result()
+        assert result.healthy
+        clock.time = 120
+        assert health.result() is result
+        # the thread is stuck
+        clock.time = 121
+        result = health.result()
+        assert not result.healthy
+        assert 'overdue' in result.error
+    finally:
+        health.stop()
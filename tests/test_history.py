@@ -0,0 +1,135 @@
+import sqlite3
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fixtures.popen import pipe_communicate
+from lizzy.apps.common import Application
+from lizzy.apps.executors import ExecutionResult
+from lizzy.apps.history import (Execution, ExecutionHistory, acting_user,
+                                current_user, percentile)
+from lizzy.exceptions import ExecutionError
+
+
+@pytest.fixture
+def popen(monkeypatch):
+    mock_popen = MagicMock()
+    mock_popen.return_value = mock_popen
+    mock_popen.returncode = 0
+    monkeypatch.setattr('lizzy.apps.executors.Popen', mock_popen)
+    return pipe_communicate(mock_popen)
+
+
+def rows(history):
+    with sqlite3.connect(history.path) as connection:
+        return connection.execute(
+            'SELECT {} FROM executions ORDER BY id'.format(
+                ', '.join(history.columns))).fetchall()
+
+
+def executed(subcommand, region, duration, returncode=0):
+    execution = Execution('senza', subcommand, ['a'], region)
+    execution.attempted(ExecutionResult(returncode, 'output', ''), 6)
+    execution.duration = duration
+    return execution
+
+
+def test_percentile():
+    durations = [float(number) for number in range(1, 101)]
+    assert percentile(durations, 50) == 50
+    assert percentile(durations, 99) == 99
+    assert percentile([3.0], 90) == 3
+
+
+def test_acting_user():
+    assert current_user() is None
+    with acting_user('jdoe'):
+        assert Execution('senza', 'list', [], None).user == 'jdoe'
+        with acting_user('other'):
+            assert current_user() == 'other'
+        assert current_user() == 'jdoe'
+    assert current_user() is None
+
+
+def test_timings(tmpdir):
+    history = ExecutionHistory(str(tmpdir.join('history.sqlite')), size=100)
+    for duration in range(1, 11):
+        history.record(executed('list', 'eu-west-1', float(duration)))
+    history.record(executed('list', 'eu-central-1', 2.0, returncode=1))
+    history.record(executed('create', 'eu-west-1', 60.0))
+    # executions that didn't run the command aren't recorded
+    history.record(Execution('senza', 'delete', [], 'eu-west-1'))
+
+    timings = history.timings(3600)
+    assert [(timing['subcommand'], timing['region'], timing['count'])
+            for timing in timings] == [('create', 'eu-west-1', 1),
+                                       ('list', 'eu-central-1', 1),
+                                       ('list', 'eu-west-1', 10)]
+    timing = timings[2]
+    assert timing['p50'] == 5
+    assert timing['p90'] == 9
+    assert timing['p99'] == timing['max'] == 10
+    assert timing['mean'] == 5.5
+    assert timing['failures'] == 0
+    assert timings[1]['failures'] == 1
+
+    assert [timing['region'] for timing in
+            history.timings(3600, subcommand='list', region='eu-central-1')] == \
+        ['eu-central-1']
+    assert history.timings(0) == []
+
+
+def test_history_size(tmpdir):
+    history = ExecutionHistory(str(tmpdir.join('history.sqlite')), size=3)
+    for duration in range(5):
+        history.record(executed('list', 'eu-west-1', float(duration)))
+    assert [row[5] for row in rows(history)] == [2, 3, 4]
+
+    disabled = ExecutionHistory(str(tmpdir.join('disabled.sqlite')), size=0)
+    disabled.record(executed('list', 'eu-west-1', 1.0))
+    assert disabled.timings(3600) == []
+    assert not tmpdir.join('disabled.sqlite').exists()
+
+
+def test_record_failure(tmpdir):
+    history = ExecutionHistory(str(tmpdir.join('missing', 'history.sqlite')),
+                               size=10)
+    # recording never fails the command
+    history.record(executed('list', 'eu-west-1', 1.0))
+
+
+def test_locked_history(tmpdir):
+    history = ExecutionHistory(str(tmpdir.join('history.sqlite')), size=10,
+                               timeout=5, record_timeout=0.1)
+    history.record(executed('list', 'eu-west-1', 1.0))
+    with sqlite3.connect(history.path, isolation_level=None) as writer:
+        writer.execute('BEGIN IMMEDIATE')
+        # reads don't wait for the writer
+        started = time.monotonic()
+        assert history.timings(3600)[0]['count'] == 1
+        # records give up quickly instead of delaying the request
+        history.record(executed('list', 'eu-west-1', 2.0))
+        assert time.monotonic() - started < 2
+        writer.execute('ROLLBACK')
+    assert len(rows(history)) == 1
+
+
+def test_application_records_executions(popen, history):
+    popen.communicate.return_value = b'Creating stack..\n', b''
+    app = Application('senza', region='eu-west-1')
+    with acting_user('jdoe'):
+        app._execute('create', 'stack.yaml', '1')
+
+    popen.returncode = 1
+    with pytest.raises(ExecutionError):
+        app._execute('delete', 'stack', None)
+
+    recorded = [dict(zip(history.columns, row)) for row in rows(history)]
+    assert [(execution['subcommand'], execution['returncode'],
+             execution['output_size'], execution['attempts'],
+             execution['user'])
+            for execution in recorded] == [('create', 0, 17, 1, 'jdoe'),
+                                           ('delete', 1, 17, 1, None)]
+    assert all(execution['region'] == 'eu-west-1' for execution in recorded)
+    assert recorded[1]['args_hash'] == Execution('senza', 'delete',
+                                                 ['stack'], None).args_hash
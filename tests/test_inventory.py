@@ -0,0 +1,140 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from lizzy.exceptions import ExecutionError
+from lizzy.models.inventory import InventoryPoller, RevisionLog, replace_stack
+
+STACKS = [{'stack_name': 'lizzy', 'version': '1'},
+          {'stack_name': 'lizzy', 'version': '2'},
+          {'stack_name': 'other', 'version': '1'}]
+
+
+def test_replace_stack():
+    new_stack = {'stack_name': 'lizzy', 'version': '1', 'status': 'NEW'}
+    assert replace_stack(STACKS, 'lizzy', '1', [new_stack]) == [STACKS[1], STACKS[2], new_stack]
+    assert replace_stack(STACKS, 'lizzy', None, None) == [STACKS[2]]
+    assert replace_stack(STACKS, 'missing', '1', None) == STACKS
+
+
+def test_refresh():
+    list_function = MagicMock(return_value=STACKS)
+    poller = InventoryPoller(['eu-west-1', 'eu-central-1'], interval=10,
+                             list_function=list_function)
+    assert poller.snapshot('eu-west-1') is None
+    assert poller.age('eu-west-1') is None
+
+    poller.refresh_all()
+    assert list_function.call_count == 2
+    assert poller.snapshot('eu-west-1').stacks == STACKS
+    assert 0 <= poller.age('eu-west-1') < 1
+
+    poller.update_stack('eu-west-1', 'other', None)
+    assert poller.snapshot('eu-west-1').stacks == STACKS[:2]
+    assert poller.snapshot('eu-central-1').stacks == STACKS
+
+    list_function.side_effect = ExecutionError(1, 'error')
+    with pytest.raises(ExecutionError):
+        poller.refresh('eu-west-1')
+    # the last good snapshot is kept
+    assert poller.snapshot('eu-west-1') is not None
+    stats = poller.stats()
+    assert stats['eu-west-1']['error'] == '(1): error'
+    assert stats['eu-west-1']['stacks'] == 2
+    assert stats['eu-central-1']['error'] is None
+
+    # unexpected errors are recorded too
+    list_function.side_effect = KeyError('stacks')
+    with pytest.raises(KeyError):
+        poller.refresh('eu-central-1')
+    assert poller.stats()['eu-central-1']['error'] == "'stacks'"
+
+
+def test_revision_log():
+    log = RevisionLog(max_removed=1)
+    log.update(STACKS)
+    first = log.token
+    assert log.changes('{}.0'.format(log.epoch)).created == STACKS
+
+    log.update(STACKS)
+    assert log.token == first
+    assert log.changes(first) == (first, [], [], [])
+
+    changed = dict(STACKS[1], status='UPDATE_COMPLETE')
+    new = {'stack_name': 'new', 'version': '1'}
+    log.update([STACKS[0], changed, new])
+    changes = log.changes(first)
+    assert changes.revision != first
+    assert changes.created == [new]
+    assert changes.changed == [changed]
+    assert changes.removed == [{'stack_name': 'other', 'version': '1'}]
+    assert log.changes(changes.revision) == (changes.revision, [], [], [])
+
+    # only the last removed stack is remembered
+    log.update([changed, new])
+    assert log.changes(first) is None
+    assert log.changes(changes.revision).removed == [{'stack_name': 'lizzy',
+                                                      'version': '1'}]
+
+    # tokens of other processes or not issued yet
+    assert log.changes('other.2') is None
+    assert log.changes('{}.9'.format(log.epoch)) is None
+    assert log.changes('invalid') is None
+
+
+def test_revision_after_fork(monkeypatch):
+    poller = InventoryPoller(['eu-west-1'], interval=10,
+                             list_function=lambda region: STACKS)
+    assert poller.revision('eu-west-1') is None
+    poller.refresh('eu-west-1')
+    revision = poller.revision('eu-west-1')
+    assert poller.changes('eu-west-1', revision).created == []
+
+    pid = poller._pid + 1
+    monkeypatch.setattr('os.getpid', lambda: pid)
+    assert poller.revision('eu-west-1') != revision
+    assert poller.changes('eu-west-1', revision) is None
+
+
+def test_snapshot_max_age(monkeypatch):
+    poller = InventoryPoller(['eu-west-1'], interval=10,
+                             list_function=lambda region: STACKS)
+    poller.refresh('eu-west-1')
+    refreshed_at = poller.snapshot('eu-west-1').refreshed_at
+    monkeypatch.setattr('time.time', lambda: refreshed_at + 31)
+    assert poller.snapshot('eu-west-1') is None
+
+
+def test_background_thread():
+    list_function = MagicMock(return_value=STACKS)
+    poller = InventoryPoller(['eu-west-1'], interval=0.01,
+                             list_function=list_function)
+    poller.start()
+    assert poller.running
+    poller.start()  # already running
+    while list_function.call_count < 3:
+        pass
+    poller.stop()
+    assert not poller.running
+    assert poller.snapshot('eu-west-1').stacks == STACKS
+
+    disabled = InventoryPoller(['eu-west-1'], interval=0,
+                               list_function=list_function)
+    disabled.start()
+    assert not disabled.running
+
+
+def test_wait_for_change():
+    poller = InventoryPoller(['eu-west-1'], interval=10,
+                             list_function=lambda region: STACKS)
+    poller.refresh('eu-west-1')
+    revision = poller.revision('eu-west-1')
+    assert not poller.wait_for_change('eu-west-1', revision, 0.01)
+
+    timer = threading.Timer(0.05, poller.update_stack,
+                            ['eu-west-1', 'other', None])
+    timer.start()
+    assert poller.wait_for_change('eu-west-1', revision, 5)
+    timer.join()
+    assert poller.revision('eu-west-1') != revision
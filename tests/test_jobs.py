@@ -0,0 +1,216 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from lizzy.exceptions import (ExecutionError, JobQueueFull, ObjectNotFound,
+                              TrafficNotUpdated)
+from lizzy.jobs import (FAILED, INTERRUPTED, QUEUED, RUNNING, SUCCEEDED, Job,
+                        JobRunner, SQLiteJobStore, owner_alive,
+                        process_owner)
+
+
+def wait_for(job, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(workers=1, queue_size=2, max_jobs=3)
+    runner.register('echo', lambda value: ({'value': value}, 'output'))
+
+    def fail(error):
+        raise error
+
+    runner.register('fail', fail)
+    return runner
+
+
+def test_job_success(runner):
+    job = runner.submit('echo', value=42)
+    assert runner.get(job.job_id) is job
+    wait_for(job)
+    assert job.state == SUCCEEDED
+    assert job.result == {'value': 42}
+    assert job.output == 'output'
+    assert job.error is None
+    assert job.created_at <= job.started_at <= job.finished_at
+
+    job_dict = job.to_dict()
+    assert job_dict['id'] == job.job_id
+    assert job_dict['operation'] == 'echo'
+
+
+@pytest.mark.parametrize(
+    "error, title, detail",
+    [
+        (ExecutionError(1, 'senza failed'), 'Execution Error', 'senza failed'),
+        (ObjectNotFound('lizzy-1'), 'Not Found', 'Stack not found: lizzy-1'),
+        (TrafficNotUpdated('No domain'), 'TrafficNotUpdated', 'No domain'),
+        (RuntimeError('boom'), 'Internal Error', 'boom'),
+    ])
+def test_job_failure(runner, error, title, detail):
+    job = wait_for(runner.submit('fail', error=error))
+    assert job.state == FAILED
+    assert job.error == {'title': title, 'detail': detail}
+
+
+def test_unknown(runner):
+    with pytest.raises(ValueError):
+        runner.submit('teleport')
+    with pytest.raises(ObjectNotFound):
+        runner.get('does-not-exist')
+
+
+def test_queue_limits(runner):
+    release = threading.Event()
+    runner.register('block', lambda: (release.wait(), ''))
+
+    running = runner.submit('block')
+    queued = runner.submit('block')
+    assert queued.state == QUEUED
+    with pytest.raises(JobQueueFull):
+        runner.submit('block')
+    release.set()
+    wait_for(running)
+    wait_for(queued)
+
+    # only the newest finished jobs are kept
+    jobs = [wait_for(runner.submit('echo', value=value)) for value in range(3)]
+    with pytest.raises(ObjectNotFound):
+        runner.get(running.job_id)
+    assert runner.get(jobs[-1].job_id) is jobs[-1]
+
+
+def wait_for_stored(runner, job_id, timeout=2):
+    deadline = time.monotonic() + timeout
+    job = runner.get(job_id)
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+        job = runner.get(job_id)
+    return job
+
+
+@pytest.fixture
+def store(tmpdir):
+    return SQLiteJobStore(str(tmpdir.join('jobs.db')), max_jobs=3)
+
+
+def test_sqlite_store(store):
+    runner = JobRunner(workers=2, queue_size=2, store=store,
+                       poll_interval=0.05)
+    runner.register('echo', lambda value: ({'value': value}, 'output'))
+
+    def fail():
+        raise ExecutionError(1, 'senza failed')
+
+    runner.register('fail', fail)
+
+    job = wait_for_stored(runner, runner.submit('echo', value=42).job_id)
+    assert job.state == SUCCEEDED
+    assert job.arguments == {'value': 42}
+    assert job.result == {'value': 42}
+    assert job.output == 'output'
+    assert job.created_at <= job.started_at <= job.finished_at
+
+    job = wait_for_stored(runner, runner.submit('fail').job_id)
+    assert job.state == FAILED
+    assert job.error == {'title': 'Execution Error', 'detail': 'senza failed'}
+
+    jobs = [wait_for_stored(runner, runner.submit('echo', value=value).job_id)
+            for value in range(3)]
+    with pytest.raises(ObjectNotFound):
+        runner.get(job.job_id)
+    assert runner.get(jobs[-1].job_id).result == {'value': 2}
+    runner.stop()
+
+
+def test_sqlite_store_queue_full(store):
+    store.add(Job(operation='echo', arguments={}), queue_size=2)
+    store.add(Job(operation='echo', arguments={}), queue_size=2)
+    with pytest.raises(JobQueueFull):
+        store.add(Job(operation='echo', arguments={}), queue_size=2)
+    assert store.pending() == 2
+
+
+def test_sqlite_store_claims_once(store):
+    jobs = [Job(operation='echo', arguments={'value': value})
+            for value in range(3)]
+    for job in jobs:
+        store.add(job, queue_size=10)
+
+    claimed = []
+    threads = [threading.Thread(target=lambda: claimed.append(store.claim('test:1')))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(job.job_id for job in claimed if job) == sorted(job.job_id for job in jobs)
+    assert claimed.count(None) == 1
+    assert store.get(jobs[0].job_id).state == RUNNING
+    assert store.get(jobs[0].job_id).owner == 'test:1'
+
+
+def test_sqlite_store_recovery(store):
+    running = Job(operation='echo', arguments={'value': 1})
+    queued = Job(operation='echo', arguments={'value': 2})
+    store.add(running, queue_size=10)
+    store.add(queued, queue_size=10)
+    # the process running the first job exits
+    store.claim(socket.gethostname() + ':999999999')
+
+    # a new process resumes the queued job and marks the other as interrupted
+    runner = JobRunner(workers=1, queue_size=10, store=store,
+                       poll_interval=0.05)
+    runner.register('echo', lambda value: ({'value': value}, ''))
+    runner.start()
+    interrupted = runner.get(running.job_id)
+    assert interrupted.state == INTERRUPTED
+    assert interrupted.finished
+    assert interrupted.error['title'] == 'Interrupted'
+    assert wait_for_stored(runner, queued.job_id).result == {'value': 2}
+    runner.stop()
+
+
+def test_sqlite_store_periodic_recovery(monkeypatch, store):
+    recoveries = []
+    recover = store.recover
+    monkeypatch.setattr(store, 'recover',
+                        lambda: recoveries.append(1) or recover())
+    runner = JobRunner(workers=3, queue_size=10, store=store,
+                       poll_interval=0.01, recovery_interval=0.1)
+    runner.register('echo', lambda value: ({'value': value}, ''))
+    runner.start()
+
+    # a job of another process that exits while this one runs
+    running = Job(operation='echo', arguments={'value': 1})
+    running.state = RUNNING
+    running.owner = socket.gethostname() + ':999999999'
+    store.add(running, queue_size=10)
+    deadline = time.monotonic() + 5
+    while store.get(running.job_id).state != INTERRUPTED:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    runner.stop()
+    # a single worker recovers, not each one on every poll
+    assert len(recoveries) < 10
+
+
+def test_owner_alive():
+    assert owner_alive(process_owner())
+    assert not owner_alive(socket.gethostname() + ':999999999')
+    assert owner_alive('other-host:1')
+    # owners of older versions without the start time
+    assert owner_alive('{}:{}'.format(socket.gethostname(), os.getpid()))
+
+    # the pid was reused by another process, e.g. after a container restart
+    hostname, pid, started = process_owner().split(':')
+    assert pid == str(os.getpid())
+    assert not owner_alive('{}:{}:{}'.format(hostname, pid, int(started) - 1))
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from lizzy.apps.common import Application
+from lizzy.apps.executors import AsyncioExecutor
+from lizzy.apps.limits import MUTATION_LANE, READ_LANE, ConcurrencyLimit
+from lizzy.apps.senza import Senza
+
+
+def wait_for_queued(limit, queued, timeout=2):
+    deadline = time.monotonic() + timeout
+    while limit.stats()['queued'] < queued and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_concurrency_limit():
+    limit = ConcurrencyLimit('test', 2)
+    release = threading.Event()
+
+    def hold():
+        with limit.slot():
+            release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for_queued(limit, 1)
+    stats = limit.stats()
+    assert stats['running'] == 2
+    assert stats['queued'] == 1
+    assert stats['commands'] == 2
+
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    stats = limit.stats()
+    assert stats['running'] == 0
+    assert stats['queued'] == 0
+    assert stats['max_running'] == 2
+    assert stats['max_queued'] == 1
+    assert stats['commands'] == 3
+    assert stats['wait_seconds_max'] >= 0.1
+    assert 0 < stats['wait_seconds_mean'] < stats['wait_seconds_max']
+
+
+def test_no_limit():
+    limit = ConcurrencyLimit('test', 0)
+    for _ in range(3):
+        limit.acquire()
+    assert limit.stats()['running'] == 3
+
+
+def test_application_limit():
+    limit = ConcurrencyLimit('test', 1)
+    app = Application('sh', executor=AsyncioExecutor(timeout=5), limit=limit)
+
+    outputs = []
+    threads = [threading.Thread(target=lambda: outputs.append(
+        app._execute('-c', 'sleep 0.3; echo done'))) for _ in range(2)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert outputs == ['done\n', 'done\n']
+    # the commands ran one after the other
+    assert time.monotonic() - started >= 0.6
+    assert limit.stats()['max_running'] == 1
+
+    assert app._execute('-c', 'echo sync') == 'sync\n'
+    assert limit.stats()['running'] == 0
+
+    # the lane can be chosen per command
+    other = ConcurrencyLimit('other', 1)
+    assert app._execute('-c', 'echo other', lane=other) == 'other\n'
+    assert other.stats()['commands'] == 1
+    assert limit.stats()['commands'] == 3
+
+
+def test_senza_lanes(monkeypatch):
+    lanes = []
+
+    def execute(self, subcommand, *args, lane=None, **kwargs):
+        lanes.append((subcommand, lane or self.limit))
+        return []
+
+    monkeypatch.setattr(Senza, '_execute', execute)
+    senza = Senza('eu-west-1')
+    senza.list()
+    senza.domains()
+    senza.traffic('app')
+    senza.traffic('app', 'v1', 50)
+    senza.scale('app', 'v1', 3)
+    senza.respawn_instances('app', 'v1')
+    senza.remove('app-v1', dry_run=False, force=False)
+
+    assert lanes == [('list', READ_LANE),
+                     ('domains', READ_LANE),
+                     ('traffic', READ_LANE),
+                     ('traffic', MUTATION_LANE),
+                     ('scale', MUTATION_LANE),
+                     ('respawn-instances', MUTATION_LANE),
+                     ('delete', MUTATION_LANE)]
+
+
+def test_reads_dont_wait_for_mutations():
+    read_lane = ConcurrencyLimit('read', 1)
+    mutation_lane = ConcurrencyLimit('mutation', 1)
+    executor = AsyncioExecutor(timeout=5)
+    app = Application('sh', executor=executor, limit=mutation_lane)
+
+    mutation = threading.Thread(target=app._execute, args=('-c', 'sleep 1'))
+    mutation.start()
+    while not mutation_lane.stats()['running']:
+        time.sleep(0.01)
+    started = time.monotonic()
+    assert app._execute('-c', 'echo read', lane=read_lane) == 'read\n'
+    assert time.monotonic() - started < 0.9
+    mutation.join()
@@ -0,0 +1,77 @@
+from unittest.mock import MagicMock
+
+import pytest
+from fixtures.popen import pipe_communicate
+from lizzy import metrics
+from lizzy.apps.common import Application
+from lizzy.cache import TTLCache
+from lizzy.exceptions import ObjectNotFound
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+
+def sample(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def popen(monkeypatch):
+    mock_popen = MagicMock()
+    mock_popen.return_value = mock_popen
+    mock_popen.returncode = 0
+    monkeypatch.setattr('lizzy.apps.executors.Popen', mock_popen)
+    return pipe_communicate(mock_popen)
+
+
+def test_command_metrics(popen):
+    count = sample('lizzy_senza_command_duration_seconds_count',
+                   subcommand='scale', region='eu-west-1')
+    in_flight = []
+
+    def wait():
+        in_flight.append(sample('lizzy_senza_commands_in_flight',
+                                subcommand='scale'))
+        return 0
+
+    popen.communicate.return_value = b'OK', b''
+    popen.wait.side_effect = wait
+    Application('senza', region='eu-west-1')._execute('scale', 'stack', '1')
+    assert in_flight == [1]
+    assert sample('lizzy_senza_commands_in_flight', subcommand='scale') == 0
+    assert sample('lizzy_senza_command_duration_seconds_count',
+                  subcommand='scale', region='eu-west-1') == count + 1
+
+
+def test_cache_metrics():
+    hits = sample('lizzy_cache_requests_total', cache='test', result='hit')
+    misses = sample('lizzy_cache_requests_total', cache='test', result='miss')
+    cache = TTLCache(ttl=10, maxsize=10, name='test')
+    cache.get('key')
+    cache.set('key', 'value')
+    cache.get('key')
+    cache.peek('key')
+    assert sample('lizzy_cache_requests_total',
+                  cache='test', result='hit') == hits + 1
+    assert sample('lizzy_cache_requests_total',
+                  cache='test', result='miss') == misses + 1
+
+
+def test_error_metrics():
+    errors = sample('lizzy_errors_total', exception='ObjectNotFound')
+    metrics.count_error(ObjectNotFound('stack-1'))
+    assert sample('lizzy_errors_total',
+                  exception='ObjectNotFound') == errors + 1
+
+
+def test_operations():
+    specification = {'paths': {'/stacks': {'get': {'operationId': 'lizzy.api.all_stacks'},
+                                           'parameters': []}}}
+    assert metrics._operations(specification) == {
+        'lizzy_api_all_stacks': 'lizzy.api.all_stacks'}
+
+
+def test_multiprocess(monkeypatch, tmpdir):
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmpdir))
+    response = metrics.expose_metrics()
+    assert response.status_code == 200
+    assert response.content_type == prometheus_client.CONTENT_TYPE_LATEST
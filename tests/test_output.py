@@ -0,0 +1,108 @@
+import gzip
+import os
+from unittest.mock import MagicMock
+
+import pytest
+from fixtures.popen import pipe_communicate
+from lizzy.apps.common import Application
+from lizzy.apps.output import (BoundedOutput, CommandOutput, OutputCapture,
+                               OutputStore, summarize)
+from lizzy.exceptions import ObjectNotFound
+
+
+@pytest.fixture
+def popen(monkeypatch):
+    mock_popen = MagicMock()
+    mock_popen.return_value = mock_popen
+    mock_popen.returncode = 0
+    monkeypatch.setattr('lizzy.apps.executors.Popen', mock_popen)
+    return pipe_communicate(mock_popen)
+
+
+def test_bounded_output():
+    output = BoundedOutput(head=5, tail=3)
+    output.write('abc')
+    assert output.getvalue() == 'abc'
+    assert not output.truncated
+
+    output.write('defgh')
+    assert output.getvalue() == 'abcdefgh'
+
+    output.write('ijklmnop')
+    assert output.size == 16
+    assert output.truncated == 8
+    assert output.getvalue() == 'abcde\n[... 8 characters truncated ...]\nnop'
+
+    output = BoundedOutput(head=2, tail=2, keep_all=True)
+    output.write('abcdef')
+    assert output.getvalue() == 'abcdef'
+
+
+def test_summarize():
+    assert summarize('x' * 10, head=6, tail=4) == 'x' * 10
+    assert summarize('abcdefghij', head=2, tail=0) == \
+        'ab\n[... 8 characters truncated ...]\n'
+
+
+def test_store(tmpdir):
+    store = OutputStore(str(tmpdir.join('outputs')), size=2)
+    execution_ids = []
+    for number in range(3):
+        stored = store.create()
+        stored.write('output {}\n'.format(number))
+        # incomplete outputs can't be read
+        with pytest.raises(ObjectNotFound):
+            store.read(stored.execution_id)
+        stored.close()
+        # makes the order of the outputs unambiguous
+        os.utime(store._file_name(stored.execution_id), (number, number))
+        execution_ids.append(stored.execution_id)
+
+    store.prune()
+    with pytest.raises(ObjectNotFound):
+        store.read(execution_ids[0])
+    assert ''.join(store.read(execution_ids[1])) == 'output 1\n'
+    assert ''.join(store.read(execution_ids[2], chunk_size=2)) == 'output 2\n'
+    assert len(os.listdir(store.path)) == 2
+
+    with pytest.raises(ObjectNotFound):
+        store.read('../../etc/passwd')
+
+
+def test_capture(tmpdir, monkeypatch):
+    monkeypatch.setattr('lizzy.apps.output.config.output_head_size', 4)
+    monkeypatch.setattr('lizzy.apps.output.config.output_tail_size', 4)
+    store = OutputStore(str(tmpdir), size=10)
+    lines = []
+    with OutputCapture(store, on_output=lines.append) as capture:
+        capture.write('first line\n')
+        capture.write('last line\n')
+    output = capture.getvalue()
+    assert isinstance(output, CommandOutput)
+    assert output == 'firs\n[... 13 characters truncated ...]\nine\n'
+    assert lines == ['first line\n', 'last line\n']
+    with gzip.open(str(tmpdir.join(output.execution_id + '.gz')), 'rt') as stored:
+        assert stored.read() == 'first line\nlast line\n'
+
+    with OutputCapture(store, keep_all=True) as capture:
+        capture.write('{"a": "long json"}')
+    output = capture.getvalue()
+    assert output == '{"a": "long json"}'
+    assert output.execution_id is None
+
+    with OutputCapture(OutputStore(str(tmpdir), size=0)) as capture:
+        capture.write('not stored')
+    assert capture.getvalue().execution_id is None
+
+
+def test_application_stores_output(popen, output_store):
+    popen.communicate.return_value = b'Creating stack..\nOK\n', b''
+
+    app = Application('foo')
+    output = app._execute('bar', 'a')
+    assert output == 'Creating stack..\nOK\n'
+    assert ''.join(output_store.read(output.execution_id)) == output
+
+    popen.communicate.return_value = b'{"a": 1}', b''
+    assert app._execute('bar', 'a', expect_json=True) == {'a': 1}
+    assert len(os.listdir(output_store.path)) == 1
@@ -0,0 +1,58 @@
+import pytest
+from lizzy.models.query import (StackQuery, decode_cursor, encode_cursor,
+                                sort_key)
+
+STACKS = [{'creation_time': 1460635167 + number,
+           'description': '',
+           'stack_name': 'app{}'.format(number % 2),
+           'status': 'CREATE_COMPLETE' if number % 3 else 'UPDATE_COMPLETE',
+           'version': str(number)}
+          for number in range(10)]
+
+
+def versions(stacks):
+    return [stack['version'] for stack in stacks]
+
+
+def test_select_order():
+    shuffled = list(reversed(STACKS))
+    assert versions(StackQuery().select(shuffled, 'eu-west-1')) == versions(STACKS)
+    assert versions(StackQuery(limit=3).select(shuffled, 'eu-west-1')) == ['0', '1', '2']
+
+
+def test_select_pages():
+    query = StackQuery(limit=4)
+    pages = []
+    while True:
+        page = query.select(STACKS, 'eu-west-1')
+        if not page:
+            break
+        pages.append(versions(page))
+        cursor = encode_cursor(sort_key(page[-1], 'eu-west-1'))
+        query = query._replace(after=decode_cursor(cursor))
+    assert pages == [['0', '1', '2', '3'], ['4', '5', '6', '7'], ['8', '9']]
+
+
+def test_select_filters():
+    assert versions(StackQuery(name_prefix='app1').select(STACKS, 'eu-west-1')) == [
+        '1', '3', '5', '7', '9']
+    assert versions(StackQuery(statuses=['UPDATE_COMPLETE']).select(STACKS, 'eu-west-1')) == [
+        '0', '3', '6', '9']
+    query = StackQuery(created_after=1460635169, created_before=1460635172)
+    assert versions(query.select(STACKS, 'eu-west-1')) == ['2', '3', '4']
+
+
+def test_ties_broken_by_name_and_region():
+    stacks = [dict(STACKS[0], stack_name='b'), dict(STACKS[0], stack_name='a')]
+    assert [stack['stack_name']
+            for stack in StackQuery().select(stacks, 'eu-west-1')] == ['a', 'b']
+    key = sort_key(stacks[0], 'eu-west-1')
+    assert key < sort_key(stacks[0], 'us-east-1')
+    assert decode_cursor(encode_cursor(key)) == key
+
+
+@pytest.mark.parametrize('cursor', ['', 'abc', encode_cursor(()).rstrip('='),
+                                    'W10=', 'WyJhIiwgImIiLCAiYyIsICJkIl0='])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -2,9 +2,11 @@ from unittest.mock import MagicMock
 
 import pytest
 
+from fixtures.popen import pipe_communicate
 from lizzy.apps.senza import Senza
 from lizzy.version import VERSION
-from lizzy.exceptions import (ExecutionError, SenzaPatchError, SenzaScaleError,
+from lizzy.exceptions import (ExecutionError, ExecutionTimeout,
+                              SenzaPatchError, SenzaScaleError,
                               SenzaRespawnInstancesError, SenzaTrafficError,
                               SenzaDomainsError, SenzaRenderError)
 
@@ -15,8 +17,8 @@ def popen(monkeypatch):
     mock_popen.return_value = mock_popen
     mock_popen.returncode = 0
     mock_popen.communicate.return_value = b'{"stream": "stdout"}', b'stderr'
-    monkeypatch.setattr('lizzy.apps.common.Popen', mock_popen)
-    return mock_popen
+    monkeypatch.setattr('lizzy.apps.executors.Popen', mock_popen)
+    return pipe_communicate(mock_popen)
 
 
 @pytest.mark.parametrize(
@@ -289,6 +291,23 @@ def test_scale(monkeypatch, popen):
         senza.scale('lizzy', 'version42', 0)
 
 
+@pytest.mark.parametrize(
+    "method, arguments",
+    [
+        ('domains', ('lizzy',)),
+        ('traffic', ('lizzy', 'version42', 50)),
+        ('respawn_instances', ('lizzy', 'version42')),
+        ('patch', ('lizzy', 'version42', 'ami-123')),
+        ('scale', ('lizzy', 'version42', 0)),
+        ('render_definition', ('yaml content', 'version42', 'image', [])),
+    ])
+def test_timeouts_not_wrapped(popen, method, arguments):
+    popen.side_effect = ExecutionTimeout(270)
+    senza = Senza('region')
+    with pytest.raises(ExecutionTimeout):
+        getattr(senza, method)(*arguments)
+
+
 def test_render_definition(monkeypatch, popen):
     senza = Senza('region')
     senza.logger = MagicMock()
@@ -0,0 +1,124 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from lizzy.exceptions import ExecutionError, ObjectNotFound
+from lizzy.models.stack import STACK_CACHE, Stack
+
+
+def test_list_cached(mock_senza):
+    stacks = Stack.list(region='eu-west-1')
+    assert [stack.stack_name for stack in stacks] == ['lizzy-bus']
+    assert Stack.list(region='eu-west-1')[0].version == '257'
+    assert mock_senza.list.call_count == 1
+
+    Stack.list(region='eu-central-1')
+    Stack.list('lizzy-bus', '257', region='eu-west-1')
+    assert mock_senza.list.call_count == 3
+    assert STACK_CACHE.stats()['hits'] == 1
+
+
+def test_get_from_inventory(mock_senza):
+    Stack.list(region='eu-west-1')
+    stack = Stack.get('lizzy-bus', '257', region='eu-west-1')
+    assert stack.status == 'CREATE_COMPLETE'
+    mock_senza.list.assert_called_once_with()
+
+    # not in the inventory
+    Stack.get('lizzy', '42', region='eu-west-1')
+    mock_senza.list.assert_called_with('lizzy', '42')
+
+    Stack.get('lizzy', '42', region='eu-west-1')
+    assert mock_senza.list.call_count == 2
+
+
+def test_get_not_found(mock_senza):
+    mock_senza.list.side_effect = lambda *a, **k: []
+    with pytest.raises(ObjectNotFound):
+        Stack.get('lizzy', '42', region='eu-west-1')
+
+    # missing stacks are not cached, they are found once created
+    mock_senza.list.side_effect = None
+    assert Stack.get('lizzy', '42', region='eu-west-1').version == '42'
+    assert mock_senza.list.call_count == 2
+
+
+def test_listing_not_cached_after_invalidation(mock_senza):
+    def list_during_invalidation(*refs):
+        Stack.invalidate('lizzy-bus', '257', region='eu-west-1')
+        return [{'creation_time': 1460635167,
+                 'description': '',
+                 'stack_name': 'lizzy-bus',
+                 'status': 'UPDATE_IN_PROGRESS',
+                 'version': '257'}]
+
+    mock_senza.list.side_effect = list_during_invalidation
+    assert Stack.list(region='eu-west-1')[0].status == 'UPDATE_IN_PROGRESS'
+    assert STACK_CACHE.peek(('eu-west-1', ())) is None
+
+    mock_senza.list.side_effect = None
+    Stack.list(region='eu-west-1')
+    assert STACK_CACHE.peek(('eu-west-1', ())) is not None
+
+
+def test_refresh(mock_senza):
+    Stack.list(region='eu-west-1')
+    Stack.list('lizzy', '1', region='eu-west-1')
+    Stack.list(region='eu-central-1')
+
+    stack = Stack.refresh('lizzy', '42', region='eu-west-1')
+    assert stack.version == '42'
+    mock_senza.list.assert_called_with('lizzy', '42')
+
+    # the new stack is added to the inventory
+    versions = [stack.version for stack in Stack.list(region='eu-west-1')]
+    assert versions == ['257', '42']
+    assert STACK_CACHE.peek(('eu-west-1', ('lizzy', '1'))) is None
+    assert STACK_CACHE.peek(('eu-central-1', ())) is not None
+
+    mock_senza.list.reset_mock()
+    Stack.get('lizzy', '42', region='eu-west-1')
+    assert not mock_senza.list.called
+
+    mock_senza.list.side_effect = lambda *a, **k: []
+    with pytest.raises(ObjectNotFound):
+        Stack.refresh('lizzy', '42', region='eu-west-1')
+    versions = [stack.version for stack in Stack.list(region='eu-west-1')]
+    assert versions == ['257']
+
+
+def test_invalidate(mock_senza):
+    Stack.list(region='eu-west-1')
+    Stack.get('lizzy-bus', '257', region='eu-west-1')
+
+    Stack.invalidate('lizzy-bus', region='eu-west-1')
+    assert Stack.list(region='eu-west-1') == []
+
+    mock_senza.list.reset_mock()
+    Stack.get('lizzy-bus', '257', region='eu-west-1')
+    mock_senza.list.assert_called_once_with('lizzy-bus', '257')
+
+
+def test_list_regions_concurrently(monkeypatch):
+    def senza_for_region(region):
+        senza = MagicMock()
+
+        def list_stacks(*stack_ref):
+            time.sleep(0.2)
+            if region == 'us-east-1':
+                raise ExecutionError(1, 'error')
+            return [{'creation_time': 1460635167, 'description': '',
+                     'stack_name': 'lizzy', 'status': 'CREATE_COMPLETE',
+                     'version': '1'}]
+
+        senza.list.side_effect = list_stacks
+        return senza
+
+    monkeypatch.setattr('lizzy.models.stack.Senza', senza_for_region)
+
+    start = time.monotonic()
+    stacks, errors = Stack.list_regions(['eu-west-1', 'eu-central-1', 'us-east-1'])
+    assert time.monotonic() - start < 0.4
+    assert sorted(stack.region for stack in stacks) == ['eu-central-1', 'eu-west-1']
+    assert list(errors) == ['us-east-1']
@@ -0,0 +1,66 @@
+import threading
+
+from lizzy.exceptions import ClientDisconnected
+from lizzy.streaming import OutputStream, format_event
+
+
+def test_format_event():
+    assert format_event('output', 'line') == 'event: output\ndata: line\n\n'
+    assert format_event('result', 'a\nb') == 'event: result\ndata: a\ndata: b\n\n'
+
+
+def test_output_stream():
+    def operation(stream):
+        stream.write('Generating Cloud Formation template.. OK')
+        stream.write('Creating stack lizzy-1.. OK')
+        stream.finish('result', {'status': 201, 'body': {'version': '1'}})
+
+    events = list(OutputStream().run(operation).events())
+    assert events == [
+        'event: output\ndata: Generating Cloud Formation template.. OK\n\n',
+        'event: output\ndata: Creating stack lizzy-1.. OK\n\n',
+        'event: result\ndata: {"status": 201, "body": {"version": "1"}}\n\n']
+
+
+def test_output_stream_heartbeat():
+    release = threading.Event()
+
+    def operation(stream):
+        release.wait()
+        stream.finish('result', {})
+
+    events = OutputStream(heartbeat=0.01).run(operation).events()
+    assert next(events) == ': keep-alive\n\n'
+    release.set()
+    assert list(events)[-1] == 'event: result\ndata: {}\n\n'
+
+
+def test_output_stream_failure():
+    def operation(stream):
+        raise RuntimeError('boom')
+
+    events = list(OutputStream().run(operation).events())
+    assert events == ['event: error\ndata: {"title": "Internal Error", '
+                      '"detail": "boom", "status": 500}\n\n']
+
+
+def test_output_stream_client_gone():
+    finished = threading.Event()
+    errors = []
+
+    def operation(stream):
+        try:
+            for line in range(100):
+                stream.write(str(line))
+        except ClientDisconnected as error:
+            errors.append(error)
+        finished.set()
+
+    events = OutputStream(max_pending=2).run(operation).events()
+    assert next(events) == 'event: output\ndata: 0\n\n'
+    # the operation waits for the client
+    assert not finished.wait(0.1)
+    events.close()
+    # and is stopped when it writes again
+    assert finished.wait(5)
+    assert len(errors) == 1
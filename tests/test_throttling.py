@@ -0,0 +1,144 @@
+import multiprocessing
+from unittest.mock import MagicMock
+
+import pytest
+
+from fixtures.clock import FakeClock
+from fixtures.popen import pipe_communicate
+from lizzy.apps.executors import ExecutionResult
+from lizzy.apps.senza import Senza
+from lizzy.apps.throttling import AWSBudget, backoff, throttled
+from lizzy.exceptions import Throttled
+
+THROTTLED = (b'botocore.exceptions.ClientError: An error occurred (Throttling) '
+             b'when calling the DescribeStacks operation: Rate exceeded')
+
+
+@pytest.fixture
+def popen(monkeypatch):
+    mock_popen = MagicMock()
+    mock_popen.return_value = mock_popen
+    monkeypatch.setattr('lizzy.apps.executors.Popen', mock_popen)
+    return pipe_communicate(mock_popen)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('lizzy.apps.common.time.sleep', sleeps.append)
+    return sleeps
+
+
+def test_throttled():
+    assert throttled(ExecutionResult(1, THROTTLED.decode(), ''))
+    assert throttled(ExecutionResult(1, '', 'RequestLimitExceeded'))
+    assert not throttled(ExecutionResult(0, 'Rate exceeded', ''))
+    assert not throttled(ExecutionResult(1, 'Stack does not exist', ''))
+
+
+def test_backoff():
+    assert backoff(0, 1, jitter=lambda: 1) == 1
+    assert backoff(3, 1, jitter=lambda: 1) == 8
+    assert backoff(10, 1, jitter=lambda: 1) == 20
+    assert backoff(3, 1, jitter=lambda: 0.5) == 4
+
+
+def test_budget(tmpdir):
+    path = str(tmpdir.join('budget.json'))
+    clock = FakeClock(1000.0)
+    budget = AWSBudget(path, rate=2, burst=3, max_wait=5,
+                       clock=clock, sleep=clock.sleep)
+    # another process sharing the file
+    other = AWSBudget(path, rate=2, burst=3, max_wait=5,
+                      clock=clock, sleep=clock.sleep)
+
+    budget.take('eu-west-1')
+    other.take('eu-west-1')
+    budget.take('eu-west-1')
+    assert clock.time == 1000
+    other.take('eu-west-1')
+    assert clock.time == 1000.5
+    # regions have their own budget
+    budget.take('eu-central-1')
+    assert clock.time == 1000.5
+
+    assert budget.stats()['eu-west-1'] == {'commands': 2, 'waited': 0,
+                                           'wait_seconds': 0.0, 'exhausted': 0}
+    assert other.stats()['eu-west-1'] == {'commands': 2, 'waited': 1,
+                                          'wait_seconds': 0.5, 'exhausted': 0}
+
+
+def test_budget_exhausted(tmpdir):
+    clock = FakeClock(1000.0)
+    budget = AWSBudget(str(tmpdir.join('budget.json')), rate=0.1, burst=1,
+                       max_wait=5, clock=clock, sleep=clock.sleep)
+    budget.take('eu-west-1')
+    with pytest.raises(Throttled) as exc_info:
+        budget.take('eu-west-1')
+    assert exc_info.value.retry_after == 10
+    assert budget.stats()['eu-west-1']['exhausted'] == 1
+
+
+def test_budget_disabled(tmpdir):
+    path = tmpdir.join('budget.json')
+    budget = AWSBudget(str(path), rate=0, burst=1, max_wait=0)
+    for _ in range(10):
+        budget.take('eu-west-1')
+    assert not path.exists()
+
+
+def take(path: str, results):
+    budget = AWSBudget(path, rate=0.001, burst=5, max_wait=0)
+    for _ in range(5):
+        try:
+            budget.take('eu-west-1')
+            results.put(True)
+        except Throttled:
+            results.put(False)
+
+
+def test_budget_shared_by_processes(tmpdir):
+    path = str(tmpdir.join('budget.json'))
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=take, args=(path, results))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    taken = [results.get() for _ in range(20)]
+    assert taken.count(True) == 5
+
+
+def test_retry_throttled(popen, sleeps, monkeypatch):
+    monkeypatch.setattr('lizzy.apps.common.backoff',
+                        lambda attempt, base: base * 2 ** attempt)
+    popen.communicate.side_effect = [(THROTTLED, b''), (THROTTLED, b''),
+                                     (b'[]', b'')]
+    type(popen).returncode = property(
+        lambda _: 1 if len(sleeps) < 2 else 0)
+
+    senza = Senza('eu-west-1')
+    assert senza.list() == []
+    assert sleeps == [1, 2]
+    assert popen.call_count == 3
+
+
+def test_throttled_not_retried(popen, sleeps):
+    popen.returncode = 1
+    popen.communicate.return_value = THROTTLED, b''
+
+    senza = Senza('eu-west-1')
+    with pytest.raises(Throttled) as exc_info:
+        senza.create('SenzaInfo:', '1', [], False, False, [])
+    assert exc_info.value.retry_after == 1
+    assert popen.call_count == 1
+    assert not sleeps
+
+    # retries give up eventually
+    popen.reset_mock()
+    with pytest.raises(Throttled) as exc_info:
+        senza.traffic('lizzy', '1', 50)
+    assert popen.call_count == 4
+    assert len(sleeps) == 3
+    assert exc_info.value.retry_after == 8
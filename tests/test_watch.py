@@ -0,0 +1,74 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from lizzy.models.watch import Watcher
+
+
+def wait_concurrently(watcher, read, done, timeout, count=5):
+    results = []
+    errors = []
+
+    def target():
+        try:
+            results.append(watcher.wait('key', read, done, timeout))
+        except Exception as exception:
+            errors.append(exception)
+
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_waiters_share_reads():
+    statuses = iter(['CREATE_IN_PROGRESS', 'CREATE_IN_PROGRESS', 'CREATE_COMPLETE'])
+    read = MagicMock(side_effect=lambda: next(statuses))
+    watcher = Watcher(interval=0.05)
+
+    results, errors = wait_concurrently(watcher, read,
+                                        lambda status: status == 'CREATE_COMPLETE',
+                                        timeout=5)
+    assert not errors
+    assert results == ['CREATE_COMPLETE'] * 5
+    assert read.call_count == 3
+    assert watcher.stats() == {'watched': 0, 'waiting': 0, 'reads': 3}
+
+
+def test_timeout_returns_last_read():
+    read = MagicMock(return_value='CREATE_IN_PROGRESS')
+    watcher = Watcher(interval=0.05)
+    results, errors = wait_concurrently(watcher, read,
+                                        lambda status: status == 'CREATE_COMPLETE',
+                                        timeout=0.12)
+    assert not errors
+    assert results == ['CREATE_IN_PROGRESS'] * 5
+    assert 2 <= read.call_count <= 4
+
+
+def test_done_without_waiting():
+    read = MagicMock(return_value='CREATE_COMPLETE')
+    watcher = Watcher(interval=60)
+    assert watcher.wait('key', read, lambda status: True, timeout=60) == 'CREATE_COMPLETE'
+    assert watcher.wait('key', read, lambda status: True, timeout=0) == 'CREATE_COMPLETE'
+    assert read.call_count == 2  # results are not kept without waiters
+
+
+def test_errors_shared():
+    def gone():
+        time.sleep(0.1)  # until all the requests wait
+        raise LookupError('gone')
+
+    read = MagicMock(side_effect=gone)
+    watcher = Watcher(interval=60)
+    results, errors = wait_concurrently(watcher, read, lambda status: False,
+                                        timeout=5)
+    assert not results
+    assert len(errors) == 5
+    assert read.call_count == 1
+    with pytest.raises(LookupError):
+        watcher.wait('key', read, lambda status: False, timeout=5)